@@ -8,6 +8,7 @@ Implements:
 """
 
 from __future__ import print_function
+import io
 import re
 import codecs
 from collections import defaultdict, Counter as multiset
@@ -17,8 +18,12 @@ from array import array
 from discodop.tree import Tree
 from discodop.grammar import lcfrsproductions
 from discodop.treetransforms import binarize
+try:
+	import cPickle as pickle
+except ImportError:
+	import pickle
 
-from libc.stdlib cimport malloc, realloc, free
+from libc.stdlib cimport malloc, calloc, realloc, free
 from libc.string cimport memset, memcpy
 from libc.stdint cimport uint8_t, uint32_t, uint64_t
 from cpython.array cimport array, clone
@@ -86,7 +91,8 @@ cdef inline void setrootid(uint64_t *data, short root, uint32_t id,
 
 
 cdef set twoterminals(NodeArray a, Node *anodes,
-		Ctrees trees2, set contentwordprods, set lexicalprods):
+		Ctrees trees2, set contentwordprods, set lexicalprods,
+		uint32_t *scratch):
 	"""Produce tree pairs that share at least two words.
 
 	Specifically, tree pairs sharing one content word and one additional word,
@@ -95,20 +101,129 @@ cdef set twoterminals(NodeArray a, Node *anodes,
 
 	if trees2 is None, pairs (n, m) are such that n < m."""
 	cdef int i, j
-	cdef set tmp, candidates = set()
+	cdef size_t k, cnt
+	cdef array tmp, tmp2
+	cdef set candidates = set()
 	# select candidates from 'trees2' that share productions with tree 'a'
 	# want to select at least 1 content POS tag, 1 other lexical prod
 	for i in range(a.len):
 		if anodes[i].left >= 0 or anodes[i].prod not in contentwordprods:
 			continue
-		tmp = <set>(trees2.treeswithprod[anodes[i].prod])
+		tmp = trees2.treeswithprod[anodes[i].prod]
 		for j in range(a.len):
 			if (i != j and anodes[j].left < 0 and
 					anodes[j].prod in lexicalprods):
-				candidates |= tmp & <set>(trees2.treeswithprod[anodes[j].prod])
+				tmp2 = trees2.treeswithprod[anodes[j].prod]
+				cnt = intersect(tmp.data.as_uints, len(tmp),
+						tmp2.data.as_uints, len(tmp2), scratch)
+				for k in range(cnt):
+					candidates.add(scratch[k])
 	return candidates
 
 
+cdef void sharedprods(NodeArray a, Node *anodes, Ctrees trees2,
+		uint8_t *frequent, uint8_t *marks):
+	"""Mark the trees that share a production with tree ``a``.
+
+	Trees without a common production have no fragments in common with ``a``.
+	Productions marked in ``frequent`` are left out, because they occur in so
+	many trees that nearly every tree would be marked; trees that share only
+	such productions with ``a`` are deduplicated with :func:`skeletons`."""
+	cdef int i, prod = -1
+	cdef size_t j, numprods = len(trees2.treeswithprod)
+	cdef array posting
+	memset(<void *>marks, 0, trees2.len * sizeof(uint8_t))
+	# nodes are sorted by production, so each production is visited once.
+	for i in range(a.len):
+		if anodes[i].prod != prod:
+			prod = anodes[i].prod
+			if <size_t>prod >= numprods or frequent[prod]:
+				continue
+			posting = trees2.treeswithprod[prod]
+			for j in range(len(posting)):
+				marks[posting.data.as_uints[j]] = 1
+
+
+cdef array skeletons(Ctrees trees, uint8_t *frequent):
+	"""Identify each tree by its subtrees made up of frequent productions.
+
+	If tree ``a`` shares only frequent productions with trees ``m`` and
+	``m'``, and these have the same identifier, then both pairs yield the same
+	fragments of ``a``; it is enough to compare ``a`` with one of them."""
+	cdef array result = clone(uintarray, trees.len, False)
+	cdef dict ids = {}
+	cdef set children, shapes
+	cdef NodeArray b
+	cdef Node *bnodes
+	cdef int m, j
+	for m in range(trees.len):
+		b = trees.trees[m]
+		bnodes = &trees.nodes[b.offset]
+		children = set()
+		for j in range(b.len):
+			if frequent[bnodes[j].prod] and bnodes[j].left >= 0:
+				if frequent[bnodes[bnodes[j].left].prod]:
+					children.add(bnodes[j].left)
+				if (bnodes[j].right >= 0
+						and frequent[bnodes[bnodes[j].right].prod]):
+					children.add(bnodes[j].right)
+		shapes = {skeleton(bnodes, j, frequent) for j in range(b.len)
+				if frequent[bnodes[j].prod] and j not in children}
+		result.data.as_uints[m] = ids.setdefault(frozenset(shapes), len(ids))
+	return result
+
+
+cdef tuple skeleton(Node *nodes, int j, uint8_t *frequent):
+	"""Nested tuple of the frequent productions connected to node ``j``."""
+	cdef int left = nodes[j].left, right = nodes[j].right
+	if left < 0:  # preterminal; right is not used
+		return (nodes[j].prod, None, None)
+	return (nodes[j].prod,
+			skeleton(nodes, left, frequent)
+				if frequent[nodes[left].prod] else None,
+			skeleton(nodes, right, frequent)
+				if right >= 0 and frequent[nodes[right].prod] else None)
+
+
+cdef inline size_t intersect(uint32_t *a, size_t alen, uint32_t *b,
+		size_t blen, uint32_t *dest):
+	"""Intersect sorted arrays ``a`` and ``b``, store result in ``dest``.
+
+	``dest`` may be equal to ``a``. When ``b`` is much longer than ``a``,
+	binary search is used to skip ahead in ``b``.
+
+	:returns: the number of elements in the intersection."""
+	cdef size_t i = 0, j = 0, n = 0, lo, hi, mid
+	if blen > 32 * alen:
+		for i in range(alen):
+			lo, hi = j, blen
+			while lo < hi:
+				mid = (lo + hi) // 2
+				if b[mid] < a[i]:
+					lo = mid + 1
+				else:
+					hi = mid
+			j = lo
+			if j >= blen:
+				break
+			elif b[j] == a[i]:
+				dest[n] = a[i]
+				n += 1
+				j += 1
+		return n
+	while i < alen and j < blen:
+		if a[i] < b[j]:
+			i += 1
+		elif a[i] > b[j]:
+			j += 1
+		else:
+			dest[n] = a[i]
+			n += 1
+			i += 1
+			j += 1
+	return n
+
+
 cpdef extractfragments(Ctrees trees1, list sents1, int offset, int end,
 		list labels, Ctrees trees2=None, list sents2=None, bint approx=True,
 		bint debug=False, bint discontinuous=False, bint complement=False,
@@ -127,6 +242,7 @@ cpdef extractfragments(Ctrees trees1, list sents1, int offset, int end,
 	fragments in each pair of trees is extracted as well."""
 	cdef:
 		int n, m, start = 0, end2
+		size_t prod
 		short minterms = 2 if twoterms else 0
 		short SLOTS  # the number of uint32_ts needed to cover the largest tree
 		uint64_t *matrix = NULL  # bit matrix of common productions in tree pair
@@ -134,6 +250,11 @@ cpdef extractfragments(Ctrees trees1, list sents1, int offset, int end,
 		NodeArray a
 		NodeArray *ctrees1
 		Node *anodes
+		uint8_t *marks = NULL  # trees that share a production with current tree
+		uint8_t *frequent = NULL  # productions left out when marking trees
+		uint32_t *seen = NULL  # last tree compared to trees with a skeleton
+		uint32_t *candidates = NULL
+		array skeletonids = None
 		list asent
 		dict fragments = {}
 		set inter = set(), contentwordprods = None, lexicalprods = None
@@ -154,8 +275,24 @@ cpdef extractfragments(Ctrees trees1, list sents1, int offset, int end,
 	SLOTS = BITNSLOTS(max(trees1.maxnodes, trees2.maxnodes) + 1)
 	matrix = <uint64_t *>malloc(trees2.maxnodes * SLOTS * sizeof(uint64_t))
 	scratch = <uint64_t *>malloc((SLOTS + 2) * sizeof(uint64_t))
-	if matrix is NULL or scratch is NULL:
+	marks = <uint8_t *>malloc((trees2.len + 1) * sizeof(uint8_t))
+	candidates = <uint32_t *>malloc((trees2.len + 1) * sizeof(uint32_t))
+	if (matrix is NULL or scratch is NULL or marks is NULL
+			or candidates is NULL):
 		raise MemoryError('allocation error')
+	if not adjacent and not twoterms:
+		frequent = <uint8_t *>calloc(len(trees2.treeswithprod) + 1,
+				sizeof(uint8_t))
+		if frequent is NULL:
+			raise MemoryError('allocation error')
+		# productions occurring in more than an eighth of the trees
+		for prod in range(len(trees2.treeswithprod)):
+			frequent[prod] = len(trees2.treeswithprod[prod]) > trees2.len // 8
+		skeletonids = skeletons(trees2, frequent)
+		seen = <uint32_t *>calloc(max(skeletonids) + 1 if skeletonids else 1,
+				sizeof(uint32_t))
+		if seen is NULL:
+			raise MemoryError('allocation error')
 	end2 = trees2.len
 	# loop over tree pairs to extract fragments from
 	for n in range(offset, min(end or trees1.len, trees1.len)):
@@ -170,7 +307,7 @@ cpdef extractfragments(Ctrees trees1, list sents1, int offset, int end,
 						labels, inter, minterms, matrix, scratch, SLOTS)
 		elif twoterms:
 			for m in twoterminals(a, anodes, trees2,
-					contentwordprods, lexicalprods):
+					contentwordprods, lexicalprods, candidates):
 				if sents2 is None and m <= n:
 					continue
 				elif m < 0 or m >= trees2.len:
@@ -178,10 +315,15 @@ cpdef extractfragments(Ctrees trees1, list sents1, int offset, int end,
 				extractfrompair(a, anodes, trees2, n, m,
 						complement, debug, asent, sents2 or sents1,
 						labels, inter, minterms, matrix, scratch, SLOTS)
-		else:  # all pairs
+		else:  # all pairs, except those that cannot add new fragments
 			if sents2 is None:
 				start = n + 1
+			sharedprods(a, anodes, trees2, frequent, marks)
 			for m in range(start, end2):
+				if not marks[m]:
+					if seen[skeletonids.data.as_uints[m]] == n + 1:
+						continue
+					seen[skeletonids.data.as_uints[m]] = n + 1
 				extractfrompair(a, anodes, trees2, n, m,
 						complement, debug, asent, sents2 or sents1,
 						labels, inter, minterms, matrix, scratch, SLOTS)
@@ -189,6 +331,10 @@ cpdef extractfragments(Ctrees trees1, list sents1, int offset, int end,
 				discontinuous, approx, tmp, SLOTS)
 	free(matrix)
 	free(scratch)
+	free(marks)
+	free(frequent)
+	free(seen)
+	free(candidates)
 	return fragments
 
 
@@ -334,12 +480,17 @@ cpdef exactcounts(Ctrees trees1, Ctrees trees2, list bitsets,
 	not a maximal."""
 	cdef:
 		array counts = None
+		array posting
 		list theindices = None
 		object matches = None  # multiset()
-		set candidates
 		short i, j, SLOTS = BITNSLOTS(max(trees1.maxnodes, trees2.maxnodes) + 1)
-		uint32_t n, m
+		uint32_t n, m, prod
 		uint32_t *countsp = NULL
+		uint32_t *candidates = NULL  # tree indices that contain fragment
+		uint32_t *prods = NULL  # productions in fragment, rarest first
+		uint32_t *postinglen = NULL
+		uint32_t **postingdata = NULL
+		size_t numcandidates, k, x, y, numprods, numposting
 		NodeArray a, b
 		Node *anodes
 		Node *bnodes
@@ -351,6 +502,24 @@ cpdef exactcounts(Ctrees trees1, Ctrees trees2, list bitsets,
 	else:
 		counts = clone(uintarray, len(bitsets), True)
 		countsp = counts.data.as_uints
+	candidates = <uint32_t *>malloc((trees2.len + 1) * sizeof(uint32_t))
+	prods = <uint32_t *>malloc(
+			(max(trees1.maxnodes, trees2.maxnodes) + 1) * sizeof(uint32_t))
+	postinglen = <uint32_t *>malloc(
+			(len(trees2.treeswithprod) + 1) * sizeof(uint32_t))
+	postingdata = <uint32_t **>malloc(
+			(len(trees2.treeswithprod) + 1) * sizeof(uint32_t *))
+	if (candidates is NULL or prods is NULL or postinglen is NULL
+			or postingdata is NULL):
+		raise MemoryError('allocation error')
+	for x, posting in enumerate(trees2.treeswithprod):
+		postinglen[x] = len(posting)
+		postingdata[x] = posting.data.as_uints
+	# productions not indexed in trees2 do not occur there; they share an
+	# empty posting list at the end.
+	numposting = len(trees2.treeswithprod)
+	postinglen[numposting] = 0
+	postingdata[numposting] = candidates
 	# compare one bitset to each tree for each unique fragment.
 	for n, wrapper in enumerate(bitsets):
 		bitset = getpointer(wrapper)
@@ -359,16 +528,39 @@ cpdef exactcounts(Ctrees trees1, Ctrees trees2, list bitsets,
 		cur, idx = bitset[0], 0
 		i = iteratesetbits(bitset, SLOTS, &cur, &idx)
 		assert i != -1
-		candidates = <set>(trees2.treeswithprod[anodes[i].prod]).copy()
+		# collect the distinct productions of the fragment; since nodes are
+		# sorted by production, duplicates are adjacent.
+		prods[0] = min(anodes[i].prod, numposting)
+		numprods = 1
 		while True:
 			i = iteratesetbits(bitset, SLOTS, &cur, &idx)
 			if i == -1 or i >= a.len:  # FIXME. why is 2nd condition necessary?
 				break
-			candidates &= <set>(trees2.treeswithprod[anodes[i].prod])
+			prod = min(anodes[i].prod, numposting)
+			if prod != prods[numprods - 1]:
+				prods[numprods] = prod
+				numprods += 1
+		# intersect posting lists, starting with the rarest production
+		for x in range(1, numprods):
+			prod = prods[x]
+			y = x
+			while y > 0 and postinglen[prods[y - 1]] > postinglen[prod]:
+				prods[y] = prods[y - 1]
+				y -= 1
+			prods[y] = prod
+		numcandidates = postinglen[prods[0]]
+		memcpy(<void *>candidates, <void *>postingdata[prods[0]],
+				numcandidates * sizeof(uint32_t))
+		for x in range(1, numprods):
+			if numcandidates == 0:
+				break
+			numcandidates = intersect(candidates, numcandidates,
+					postingdata[prods[x]], postinglen[prods[x]], candidates)
 		i = getroot(bitset, SLOTS)  # root of fragment in tree 'a'
 		if indices:
 			matches = theindices[n]
-		for m in candidates:
+		for k in range(numcandidates):
+			m = candidates[k]
 			b = trees2.trees[m]
 			bnodes = &trees2.nodes[b.offset]
 			for j in range(b.len):
@@ -380,9 +572,259 @@ cpdef exactcounts(Ctrees trees1, Ctrees trees2, list bitsets,
 							countsp[n] += 1
 				elif anodes[i].prod < bnodes[j].prod:
 					break
+	free(candidates)
+	free(prods)
+	free(postinglen)
+	free(postingdata)
 	return theindices if indices else counts
 
 
+def treecosts(Ctrees trees1, Ctrees trees2=None):
+	"""Estimate the relative cost of extracting fragments for each tree.
+
+	For tree ``n`` in ``trees1``, the estimate is the number of node pairs
+	with the same production when comparing it to the trees in ``trees2``,
+	or to the trees ``m > n`` in ``trees1`` if ``trees2`` is None.
+	Tree pairs without common productions are skipped, so the number of
+	trees or nodes does not give a good estimate.
+
+	:returns: an array of doubles with the cost of each tree in ``trees1``."""
+	cdef:
+		array result = clone(array('d', ()), trees1.len, False)
+		double *resultp = result.data.as_doubles
+		uint64_t *cnt
+		uint64_t pairs
+		NodeArray a
+		Node *nodes
+		int n, numprods = 0
+		size_t i
+	for i in range(trees1.numnodes):
+		numprods = max(numprods, trees1.nodes[i].prod + 1)
+	if trees2 is not None:
+		for i in range(trees2.numnodes):
+			numprods = max(numprods, trees2.nodes[i].prod + 1)
+	cnt = <uint64_t *>calloc(numprods + 1, sizeof(uint64_t))
+	if cnt is NULL:
+		raise MemoryError('allocation error')
+	if trees2 is not None:
+		for i in range(trees2.numnodes):
+			cnt[trees2.nodes[i].prod] += 1
+	for n in range(trees1.len - 1, -1, -1):
+		a = trees1.trees[n]
+		nodes = &trees1.nodes[a.offset]
+		pairs = 0
+		for i in range(a.len):
+			pairs += cnt[nodes[i].prod]
+		resultp[n] = pairs
+		if trees2 is None:
+			for i in range(a.len):
+				cnt[nodes[i].prod] += 1
+	free(cnt)
+	return result
+
+
+cdef class FragmentIndex:
+	"""An index of fragments to find the fragments occurring in a tree.
+
+	Fragments are grouped by the production at their root. For each fragment
+	the distinct productions are stored as well, such that fragments with a
+	production missing from the tree are rejected without comparing their
+	structure. A lookup therefore only visits the fragments with a root
+	production that occurs in the tree.
+
+	:param trees, sents: fragments as read by ``readtreebank()``; a fragment
+		is identified by its index in ``trees``.
+	:param labels, prods: the labels and productions used to read ``trees``;
+		trees to be looked up should be read with (copies of) these.
+	:param fragments: optionally, a list of the fragments as strings.
+
+	The index can be stored with ``tofile()`` and loaded with ``fromfile()``;
+	the fragments are then memory-mapped."""
+	cdef Ctrees trees
+	cdef uint64_t *bitsets
+	cdef uint32_t *present
+	cdef uint32_t stamp
+	cdef short SLOTS
+	cdef int numprods
+	cdef array byroot, byrootstart, fragprods, fragprodsstart
+	cdef readonly list sents, labels, fragments
+	cdef readonly dict prods
+
+	def __cinit__(self):
+		self.bitsets = self.present = NULL
+
+	def __init__(self, Ctrees trees, list sents, list labels, dict prods,
+			list fragments=None):
+		cdef:
+			array cnt
+			list tmp = []
+			list sent
+			uint64_t *bitset
+			Node *nodes
+			NodeArray a
+			int n, i, prod
+		self.trees, self.sents = trees, sents
+		self.labels, self.prods = labels, prods
+		self.fragments = fragments
+		self.numprods = len(prods)
+		self.SLOTS = BITNSLOTS(trees.maxnodes + 1)
+		self.stamp = 0
+		self.bitsets = <uint64_t *>calloc(
+				(trees.len or 1) * self.SLOTS, sizeof(uint64_t))
+		self.present = <uint32_t *>calloc(
+				self.numprods or 1, sizeof(uint32_t))
+		if self.bitsets is NULL or self.present is NULL:
+			raise MemoryError('allocation error')
+		# fragments by the production at their root
+		cnt = clone(uintarray, self.numprods + 1, True)
+		for n in range(trees.len):
+			a = trees.trees[n]
+			cnt.data.as_uints[trees.nodes[a.offset + a.root].prod + 1] += 1
+		for prod in range(self.numprods):
+			cnt.data.as_uints[prod + 1] += cnt.data.as_uints[prod]
+		self.byrootstart = cnt
+		self.byroot = clone(uintarray, trees.len, False)
+		cnt = clone(uintarray, self.numprods, False)
+		memcpy(cnt.data.as_uints, self.byrootstart.data.as_uints,
+				self.numprods * sizeof(uint32_t))
+		self.fragprodsstart = clone(uintarray, trees.len + 1, False)
+		for n in range(trees.len):
+			a = trees.trees[n]
+			nodes = &trees.nodes[a.offset]
+			prod = nodes[a.root].prod
+			self.byroot.data.as_uints[cnt.data.as_uints[prod]] = n
+			cnt.data.as_uints[prod] += 1
+			# the bitset and distinct productions of the non-frontier nodes;
+			# since nodes are sorted by production, duplicates are adjacent.
+			self.fragprodsstart.data.as_uints[n] = len(tmp)
+			bitset = &self.bitsets[n * self.SLOTS]
+			sent = sents[n]
+			for i in range(a.len):
+				if (nodes[i].left >= 0
+						or sent[termidx(nodes[i].left)] is not None):
+					SETBIT(bitset, i)
+					if (len(tmp) == self.fragprodsstart.data.as_uints[n]
+							or tmp[len(tmp) - 1] != nodes[i].prod):
+						tmp.append(nodes[i].prod)
+		self.fragprodsstart.data.as_uints[trees.len] = len(tmp)
+		self.fragprods = array('I', tmp)
+
+	@classmethod
+	def fromfragments(cls, filename, encoding='utf-8'):
+		"""Create an index of the fragments in a file.
+
+		:param filename: a file with fragments in bracket format, optionally
+			followed by a tab and counts or indices, as produced by
+			``discodop fragments``."""
+		cdef list labels = [], fragments = []
+		cdef dict prods = {}
+		trees, sents = readtreebank(filename, labels, prods,
+				'bracket', None, encoding)
+		with io.open(filename, encoding=encoding) as inp:
+			for line in inp:
+				fragments.append(line.rstrip('\n').split('\t', 1)[0])
+		return cls(trees, sents, labels, prods, fragments)
+
+	def tofile(self, filename):
+		"""Store the index; writes ``filename`` and ``filename.ctrees``."""
+		self.trees.tofile(filename + '.ctrees')
+		with open(filename, 'wb') as out:
+			pickle.dump((self.sents, self.labels, self.prods,
+					self.fragments), out, protocol=-1)
+
+	@classmethod
+	def fromfile(cls, filename):
+		"""Load an index stored with ``tofile()``."""
+		result = None
+		with open(filename, 'rb') as inp:
+			result = pickle.load(inp)
+		return cls(Ctrees.fromfile(filename + '.ctrees'), *result)
+
+	def query(self, Ctrees trees, int start=0, end=None):
+		"""Find the fragments occurring in each of the given trees.
+
+		:param trees: trees read with the labels and productions of this
+			index.
+		:returns: a list with, for each tree ``start...end``, a multiset
+			mapping the indices of fragments to their number of
+			occurrences."""
+		cdef int n
+		cdef list result = []
+		if end is None or end > trees.len:
+			end = trees.len
+		for n in range(start, end):
+			result.append(self._query(trees.trees[n],
+					&trees.nodes[trees.trees[n].offset]))
+		return result
+
+	def queryfile(self, filename, encoding='utf-8', limit=None):
+		"""Find the fragments occurring in the trees of a bracket treebank.
+
+		Cf. ``query()``.
+
+		The productions of the index are not modified."""
+		trees, _ = readtreebank(filename, list(self.labels), dict(self.prods),
+				'bracket', limit, encoding)
+		return self.query(trees)
+
+	cdef _query(self, NodeArray b, Node *bnodes):
+		"""Find the fragments occurring in a single tree."""
+		cdef:
+			object result = multiset()
+			NodeArray a
+			Node *anodes
+			uint64_t *bitset
+			uint32_t *byroot = self.byroot.data.as_uints
+			uint32_t *byrootstart = self.byrootstart.data.as_uints
+			uint32_t *fragprods = self.fragprods.data.as_uints
+			uint32_t *fragprodsstart = self.fragprodsstart.data.as_uints
+			uint32_t n, k, x
+			int i, j, end, prod
+		# mark the productions in the tree
+		self.stamp += 1
+		if self.stamp == 0:
+			memset(self.present, 0, self.numprods * sizeof(uint32_t))
+			self.stamp = 1
+		for j in range(b.len):
+			if bnodes[j].prod < self.numprods:
+				self.present[bnodes[j].prod] = self.stamp
+		# nodes are sorted by production; visit each run of nodes with the
+		# same production, and the fragments with that root production.
+		j = 0
+		while j < b.len:
+			prod = bnodes[j].prod
+			end = j + 1
+			while end < b.len and bnodes[end].prod == prod:
+				end += 1
+			if prod < self.numprods:
+				for k in range(byrootstart[prod], byrootstart[prod + 1]):
+					n = byroot[k]
+					for x in range(fragprodsstart[n], fragprodsstart[n + 1]):
+						if self.present[fragprods[x]] != self.stamp:
+							break
+					else:
+						a = self.trees.trees[n]
+						anodes = &self.trees.nodes[a.offset]
+						bitset = &self.bitsets[n * self.SLOTS]
+						for i in range(j, end):
+							if containsbitset(anodes, bnodes, bitset,
+									a.root, i):
+								result[n] += 1
+			j = end
+		return result
+
+	def __len__(self):
+		return self.trees.len
+
+	def __dealloc__(self):
+		if self.bitsets is not NULL:
+			free(self.bitsets)
+			self.bitsets = NULL
+		if self.present is not NULL:
+			free(self.present)
+			self.present = NULL
+
+
 cdef inline int containsbitset(Node *a, Node *b, uint64_t *bitset,
 		short i, short j):
 	"""Test whether the fragment ``bitset`` at ``a[i]`` occurs at ``b[j]``."""
@@ -417,12 +859,11 @@ cpdef dict coverbitsets(Ctrees trees, list sents, list labels,
 		raise MemoryError('allocation error')
 	assert SLOTS, SLOTS
 	for p, treeindices in enumerate(trees.treeswithprod):
-		try:  # slightly convoluted way of getting an arbitrary set member:
-			n = next(iter(treeindices))
-		except StopIteration:
+		if len(treeindices) == 0:
 			# when using multiple treebanks, there may be a production which
 			# doesn't occur in this treebank
 			continue
+		n = treeindices[0]
 		nodes = &trees.nodes[trees.trees[n].offset]
 		memset(<void *>scratch, 0, SLOTS * sizeof(uint64_t))
 		for i in range(trees.trees[n].len):
@@ -478,7 +919,7 @@ cdef extractcompbitsets(uint64_t *bitset, Node *a,
 		# need to create a new array because further down in the recursion
 		# other fragments may be encountered which should not overwrite
 		# this one
-		scratch = <uint64_t *>malloc((SLOTS + 2) * sizeof(uint64_t))
+		scratch = <uint64_t *>calloc(SLOTS + 2, sizeof(uint64_t))
 		if scratch is NULL:
 			raise MemoryError('allocation error')
 		setrootid(scratch, i, n, SLOTS)
@@ -900,6 +1341,7 @@ def readtreebank(treebankfile, list labels, dict prods,
 	return ctrees, sents
 
 
-__all__ = ['addprods', 'completebitsets', 'coverbitsets', 'exactcounts',
-		'extractfragments', 'getctrees', 'getlabelsprods', 'getprodid',
-		'nonfrontier', 'pygetsent', 'readtreebank', 'repl', 'tolist']
+__all__ = ['FragmentIndex', 'addprods', 'completebitsets', 'coverbitsets',
+		'exactcounts', 'extractfragments', 'getctrees', 'getlabelsprods',
+		'getprodid', 'nonfrontier', 'pygetsent', 'readtreebank', 'repl',
+		'tolist', 'treecosts']
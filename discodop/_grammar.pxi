@@ -504,11 +504,18 @@ cdef class Grammar:
 			markovization; e.g., ``NP`` and ``VP`` may be blocked,
 			but not ``NP|<DT-NN>``.
 		- ``_[0-9]+`` to ignore discontinuous nodes ``X_n`` where ``X`` is a
-			label and *n* is a fanout."""
+			label and *n* is a fanout.
+
+		Also constructs the inverse mapping ``finemapping``, from coarse
+		labels to lists of fine labels, and the list ``neverblocked`` of fine
+		labels that are never pruned; this allows whitelists to be constructed
+		in time proportional to their size."""
 		cdef int n, m, components = 0
 		cdef set seen = {0}
 		if coarse is None:
 			coarse = self
+		self.finemapping = [[] for _ in range(coarse.nonterminals)]
+		self.neverblocked = []
 		if self.mapping is not NULL:
 			free(self.mapping)
 		self.mapping = <uint32_t *>malloc(sizeof(uint32_t) * self.nonterminals)
@@ -542,8 +549,14 @@ cdef class Grammar:
 				else:
 					self.mapping[n] = coarse.toid[strlabel]
 					seen.add(self.mapping[n])
+					if n and self.mapping[n]:
+						self.finemapping[self.mapping[n]].append(n)
+					elif n:
+						self.neverblocked.append(n)
 			else:
 				self.mapping[n] = 0
+				if n:
+					self.neverblocked.append(n)
 		if seen == set(range(coarse.nonterminals)):
 			msg = 'label sets are equal'
 		else:
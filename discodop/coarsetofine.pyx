@@ -6,11 +6,16 @@ from discodop.tree import Tree
 from discodop.treetransforms import mergediscnodes, unbinarize, fanout, \
 		addbitsets
 from discodop.containers cimport Grammar, Chart, ChartItem, Edges, Edge, \
-		Rule, LexicalRule, RankedEdge, cellidx, \
+		Rule, LexicalRule, RankedEdge, SpanSet, cellidx, \
 		CFGtoSmallChartItem, CFGtoFatChartItem
+from discodop.pcfg cimport compactcellidx
 from discodop.kbest import lazykbest
 import numpy as np
 
+cdef extern from "macros.h":
+	int BITSIZE
+	int BITNSLOTS(int nb)
+
 # alternative: take coarse chart, return fine chart w/whitelist.
 # cpdef Chart prunechart(coarsechart, Grammar fine, int k,
 # 		bint splitprune, bint markorigin, bint finecfg, bint bitpar):
@@ -44,16 +49,25 @@ def prunechart(Chart coarsechart, Grammar fine, k,
 		map to the discontinuous node NP_2.
 	:param bitpar: prune from bitpar derivations instead of actual chart
 
-	For LCFRS, the white list is indexed as follows:
-			:whitelisted: ``whitelist[label][item] == None``
+	For LCFRS, the white list is a list indexed by fine label, containing
+	``SpanSet`` objects with the spans of the corresponding coarse label
+	(``None`` for labels that are never pruned):
+			:whitelisted: ``item in whitelist[label]``
 			:blocked: ``item not in whitelist[label]``
 
-	For a CFG, indexing is as follows:
-		:whitelisted: ``whitelist[span][label] == None``
-		:blocked: ``label not in whitelist[cell]``
+	For a CFG, the white list is a 2D array with a bitset over coarse labels
+	for each cell, indexed by ``compactcellidx(start, end, lensent, 1)``;
+	bit 0 is always set, for the fine labels which are never pruned:
+		:whitelisted: ``TESTBIT(whitelist[cell], fine.mapping[label])``
+		:blocked: ``not TESTBIT(whitelist[cell], fine.mapping[label])``
 	"""
 	cdef list whitelist
+	cdef uint64_t [:, :] cfgwhitelist
+	cdef uint8_t [:] seen
 	cdef ChartItem chartitem
+	cdef uint32_t label
+	cdef size_t span, cell
+	cdef short lensent
 	if fine.mapping is NULL:
 		raise ValueError('need to call fine.getmapping(coarse, ...).')
 	if splitprune and markorigin:
@@ -76,29 +90,35 @@ def prunechart(Chart coarsechart, Grammar fine, k,
 				len(coarsechart.getitems()), len(items),
 				len(coarsechart.rankededges[coarsechart.root()][:k]), k))
 	if finecfg:
-		cfgwhitelist = {}
+		lensent = coarsechart.lensent
+		result = np.empty((compactcellidx(lensent - 1, lensent, lensent, 1) + 1,
+				BITNSLOTS(coarsechart.grammar.nonterminals)), dtype=np.uint64)
+		cfgwhitelist = result
+		# cells without any coarse items are not pruned
+		cfgwhitelist[:, :] = ~0UL
+		seen = np.zeros(cfgwhitelist.shape[0], dtype=np.uint8)
 		for item in items:
 			label = coarsechart.label(item)
-			finespan = coarsechart.asCFGspan(item, fine.nonterminals)
-			if finespan not in cfgwhitelist:
-				cfgwhitelist[finespan] = {}
-			for finelabel in range(1, fine.nonterminals):
-				if (fine.mapping[finelabel] == 0
-						or fine.mapping[finelabel] == label):
-					cfgwhitelist[finespan][finelabel] = None
-		return cfgwhitelist, len(items)
+			span = coarsechart.asCFGspan(item, 1)
+			cell = compactcellidx(span // lensent, span % lensent + 1,
+					lensent, 1)
+			if not seen[cell]:
+				seen[cell] = 1
+				cfgwhitelist[cell, :] = 0
+				cfgwhitelist[cell, 0] = 1  # labels that are never pruned
+			cfgwhitelist[cell, label // BITSIZE] |= 1UL << (label % BITSIZE)
+		return result, msg
 	else:
 		whitelist = [None] * fine.nonterminals
-		kbestspans = [{} for _ in coarsechart.grammar.toid]
-		kbestspans[0] = None
+		kbestspans = [[] for _ in coarsechart.grammar.toid]
 		# uses ids of labels in coarse chart
 		for item in items:
 			# we can use coarsechart here because we only use the item to
 			# define a span, which is the same for the fine chart.
 			chartitem = coarsechart.asChartItem(item)
-			label = chartitem.label
-			chartitem.label = 0
-			kbestspans[label][chartitem] = None
+			kbestspans[chartitem.label].append(chartitem)
+		kbestspans = [SpanSet(a) for a in kbestspans]
+		kbestspans[0] = None
 		# now construct a list which references these coarse items:
 		for label in range(fine.nonterminals):
 			if splitprune and markorigin and fine.fanout[label] != 1:
@@ -143,40 +163,60 @@ def bitparkbestitems(Chart chart, int k, bint finecfg):
 def whitelistfromposteriors(inside, outside, start,
 		Grammar coarse, Grammar fine, double threshold,
 		bint splitprune, bint markorigin, bint finecfg):
-	"""Compute posterior probabilities & prune away cells below a threshold."""
-	cdef uint32_t label
-	cdef short lensent = start[2]
+	"""Compute posterior probabilities & prune away cells below a threshold.
+
+	Posteriors are computed span by span from the compact inside and outside
+	matrices produced by ``pcfg.doinsideoutside()``, and items above the
+	threshold are added to the whitelist directly, without allocating
+	intermediate matrices.
+
+	Produces a whitelist in the format described for ``prunechart()``."""
+	cdef double [:, :] insidemat = inside, outsidemat = outside
+	cdef uint64_t [:, :] cfgwhitelist = None
+	cdef uint32_t label, startid = start[0]
+	cdef short left, right, span, lensent = start[2]
+	cdef size_t idx, unfiltered = 0, numitems = 0, numremain = 0
+	cdef double sentprob, posterior
+	cdef bint fatitems = lensent >= (sizeof(uint64_t) * 8)
+	cdef list kbestspans = None
+	whitelist = None
 	if not 0 < threshold < 1:
 		raise ValueError('probability threshold should be between 0 and 1.')
-	sentprob = inside[0, lensent, start[0]]
-	posterior = (inside[:lensent, :lensent + 1]
-		* outside[:lensent, :lensent + 1]) / sentprob
-
-	leftidx, rightidx, labels = (posterior[:lensent, :lensent + 1]
-		> threshold).nonzero()
-
-	kbestspans = [{} for _ in coarse.toid]
-	fatitems = lensent >= (sizeof(uint64_t) * 8)
-	for label, left, right in zip(labels, leftidx, rightidx):
-		if finecfg:
-			ei = cellidx(left, right, lensent, fine.nonterminals)
-		elif fatitems:
-			ei = CFGtoFatChartItem(0, left, right)
-		else:
-			ei = CFGtoSmallChartItem(0, left, right)
-		kbestspans[label][ei] = None
-
+	sentprob = insidemat[compactcellidx(0, lensent, lensent, 1), startid]
 	if finecfg:
-		whitelist = {}
-		for left in range(start[2]):
-			for right in range(left + 1, start[2] + 1):
-				span = cellidx(left, right, lensent, fine.nonterminals)
-				cell = whitelist[span] = {}
-				for label in range(1, fine.nonterminals):
-					if (fine.mapping[label] == 0
-							or span in kbestspans[fine.mapping[label]]):
-						cell[label] = None
+		whitelist = np.zeros((compactcellidx(lensent - 1, lensent, lensent, 1)
+				+ 1, BITNSLOTS(coarse.nonterminals)), dtype=np.uint64)
+		cfgwhitelist = whitelist
+		cfgwhitelist[:, 0] = 1  # labels that are never pruned
 	else:
+		kbestspans = [[] for _ in coarse.toid]
+	for span in range(1, lensent + 1):
+		for left in range(lensent - span + 1):
+			right = left + span
+			idx = compactcellidx(left, right, lensent, 1)
+			for label in range(coarse.nonterminals):
+				if outsidemat[idx, label] == 0.0:
+					continue
+				unfiltered += 1
+				posterior = (insidemat[idx, label]
+						* outsidemat[idx, label] / sentprob)
+				if posterior == 0.0:
+					continue
+				numitems += 1
+				if posterior <= threshold:
+					continue
+				numremain += 1
+				if finecfg:
+					cfgwhitelist[idx, label // BITSIZE] |= (
+							1UL << (label % BITSIZE))
+				elif fatitems:
+					kbestspans[label].append(
+							CFGtoFatChartItem(0, left, right))
+				else:
+					kbestspans[label].append(
+							CFGtoSmallChartItem(0, left, right))
+	if not finecfg:
+		kbestspans = [SpanSet(a) for a in kbestspans]
 		whitelist = [None] * fine.nonterminals
 		for label in range(fine.nonterminals):
 			if splitprune and markorigin and fine.fanout[label] != 1:
@@ -186,42 +226,12 @@ def whitelistfromposteriors(inside, outside, start,
 			else:
 				if fine.mapping[label] != 0:
 					whitelist[label] = kbestspans[fine.mapping[label]]
-	unfiltered = (outside != 0.0).sum()
-	numitems = (posterior != 0.0).sum()
-	numremain = (posterior > threshold).sum()
 	msg = ('coarse items before pruning=%d; filtered: %d;'
 			' pruned: %d; sentprob=%g' % (
 			unfiltered, numitems, numremain, sentprob))
 	return whitelist, msg
 
 
-def whitelistfromposteriors_matrix(inside, outside, ChartItem goal,
-		Grammar coarse, Grammar fine, finechart, short maxlen,
-		double threshold):
-	"""Compute posterior probabilities & prune away cells below a threshold.
-
-	This version produces a matrix with pruned spans having NaN as value."""
-	cdef long label
-	cdef short lensent = goal.right
-	sentprob = inside[0, lensent, goal.label]
-	# print >>stderr, "sentprob=%g" % sentprob
-	posterior = (inside[:lensent, :lensent + 1, :]
-			* outside[:lensent, :lensent + 1, :]) / sentprob
-	inside[:lensent, :lensent + 1, :] = np.NAN
-	inside[posterior > threshold] = np.inf
-	# print >>stderr, ' ', (posterior > threshold).sum(),
-	# print >>stderr, "of", (posterior != 0.0).sum(),
-	# print >>stderr, "nonzero coarse items left",
-	# labels, leftidx, rightidx = (posterior[:lensent, :lensent+1, :]
-	# 	> threshold).nonzero()
-	# for left, right, label in zip(leftidx, rightidx, labels):
-	# 	for x in mapping[label]:
-	# 		finechart[left, right, x] = inside[left, right, label]
-	for label in range(len(fine.toid)):
-		finechart[:lensent, :lensent + 1, label] = inside[
-				:lensent, :lensent + 1, fine.mapping[label]]
-
-
 def posteriorthreshold(Chart chart, double threshold):
 	"""Get posterior prob. for parse forest & prune away cells below threshold.
 
@@ -369,7 +379,7 @@ def doctf(coarse, fine, sent, tree, k, split, verbose=False):
 					bin((<ChartItem>a).vec))
 		print("\nwhitelist:")
 		for n, x in enumerate(l):
-			if isinstance(x, dict):
+			if isinstance(x, SpanSet):
 				print(fine.tolabel[n], map(bin, x))
 			elif x:
 				for m, y in enumerate(x):
@@ -480,5 +490,4 @@ def test():
 		print("time elapsed", clock() - begin, "s")
 
 __all__ = ['bitparkbestitems', 'doctf', 'getinside', 'getoutside',
-		'posteriorthreshold', 'prunechart', 'whitelistfromposteriors',
-		'whitelistfromposteriors_matrix']
+		'posteriorthreshold', 'prunechart', 'whitelistfromposteriors']
@@ -1,6 +1,6 @@
 from math import isinf, exp, log, fsum
 from libc.stdlib cimport malloc, calloc, realloc, free, qsort, atol, strtod
-from libc.string cimport memcmp, memset
+from libc.string cimport memcmp, memset, memcpy
 from libc.stdint cimport uint8_t, uint32_t, uint64_t
 cimport cython
 include "constants.pxi"
@@ -39,6 +39,7 @@ cdef class Grammar:
 	cdef readonly bytes origrules, start
 	cdef readonly unicode origlexicon
 	cdef readonly list tolabel, lexical, modelnames, rulemapping
+	cdef readonly list finemapping, neverblocked
 	cdef readonly dict toid, lexicalbyword, lexicalbylhs, lexicalbynum, rulenos
 	cdef _convertrules(self, list rulelines, dict fanoutdict)
 	cdef _indexrules(self, Rule **dest, int idx, int filterlen)
@@ -132,6 +133,14 @@ cdef SmallChartItem CFGtoSmallChartItem(uint32_t label, Idx start, Idx end)
 cdef FatChartItem CFGtoFatChartItem(uint32_t label, Idx start, Idx end)
 
 
+@cython.final
+cdef class SpanSet:
+	cdef uint64_t *data  # sorted array of bit vectors, each of `slots` words
+	cdef readonly size_t len
+	cdef readonly int slots
+	cdef bint contains(self, uint64_t *vec)
+
+
 cdef union Position: # 8 bytes
 	short mid  # CFG, end index of left child
 	uint64_t lvec  # LCFRS, bit vector of left child
@@ -215,6 +224,7 @@ cdef class Ctrees:
 	cdef readonly short maxnodes
 	cdef readonly int len
 	cdef list treeswithprod
+	cdef object mapped
 	cpdef alloc(self, int numtrees, long numnodes)
 	cdef realloc(self, int numtrees, int extranodes)
 	cpdef add(self, list tree, dict prods)
@@ -1,14 +1,21 @@
 """Data types for chart items, edges, &c."""
 from __future__ import print_function
 from math import exp, log, fsum
+from struct import Struct
 from libc.math cimport log, exp
 from discodop.tree import Tree
+from array import array
 from discodop.bit cimport nextset, nextunset, anextset, anextunset
+from cpython.array cimport array, clone
 cimport cython
 include "constants.pxi"
 
 maxbitveclen = SLOTS * sizeof(uint64_t) * 8
 cdef double INFINITY = float('infinity')
+cdef array uintarray = array('I', ())  # template to create arrays of this type
+# magic, sizeof(NodeArray), sizeof(Node), len, numnodes, maxnodes
+CTREESHEADER = Struct('<8sHHIQI4x')  # padded to 32 bytes for alignment
+CTREESMAGIC = b'CTREES01'
 
 include "_grammar.pxi"
 
@@ -166,6 +173,113 @@ cdef FatChartItem CFGtoFatChartItem(uint32_t label, Idx start, Idx end):
 	return fci
 
 
+@cython.final
+cdef class SpanSet:
+	"""A set of spans stored as a sorted array of bit vectors.
+
+	Used by the LCFRS parser for coarse-to-fine pruning; membership tests are
+	done with binary search in C instead of hashing ``ChartItem`` objects.
+
+	:param items: an iterable of ``SmallChartItem`` or ``FatChartItem``
+		objects; only their bit vectors are used, labels are ignored.
+
+	>>> spans = SpanSet([SmallChartItem(1, 0b110), SmallChartItem(2, 0b1)])
+	>>> SmallChartItem(3, 0b110) in spans, SmallChartItem(1, 0b11) in spans
+	(True, False)"""
+	def __cinit__(self):
+		self.data = NULL
+
+	def __init__(self, items=()):
+		cdef ChartItem item
+		cdef size_t n, m = 0
+		items = list(items)
+		self.slots = 1
+		if items and isinstance(items[0], FatChartItem):
+			self.slots = SLOTS
+		self.data = <uint64_t *>malloc(
+				(len(items) or 1) * self.slots * sizeof(uint64_t))
+		if self.data is NULL:
+			raise MemoryError('allocation error')
+		for n, item in enumerate(items):
+			if self.slots == 1:
+				self.data[n] = (<SmallChartItem>item).vec
+			else:
+				memcpy(&(self.data[n * SLOTS]), (<FatChartItem>item).vec,
+						SLOTS * sizeof(uint64_t))
+		if not items:
+			self.len = 0
+			return
+		qsort(self.data, len(items), self.slots * sizeof(uint64_t),
+				&spancmpsmall if self.slots == 1 else &spancmpfat)
+		# remove duplicates
+		for n in range(1, len(items)):
+			if spancmp(&(self.data[n * self.slots]),
+					&(self.data[m * self.slots]), self.slots) != 0:
+				m += 1
+				if m != n:
+					memcpy(&(self.data[m * self.slots]),
+							&(self.data[n * self.slots]),
+							self.slots * sizeof(uint64_t))
+		self.len = m + 1
+
+	cdef bint contains(self, uint64_t *vec):
+		"""Test whether bit vector ``vec`` (of ``slots`` words) is in set."""
+		cdef size_t lo = 0, hi = self.len, mid
+		cdef int cmp
+		while lo < hi:
+			mid = (lo + hi) // 2
+			cmp = spancmp(&(self.data[mid * self.slots]), vec, self.slots)
+			if cmp < 0:
+				lo = mid + 1
+			elif cmp > 0:
+				hi = mid
+			else:
+				return True
+		return False
+
+	def __contains__(self, ChartItem item):
+		if isinstance(item, SmallChartItem):
+			return self.slots == 1 and self.contains(
+					&(<SmallChartItem>item).vec)
+		return self.slots == SLOTS and self.contains(
+				(<FatChartItem>item).vec)
+
+	def __iter__(self):
+		"""Yield the bit vectors in this set as Python integers."""
+		cdef size_t n
+		cdef int m
+		for n in range(self.len):
+			vec = 0
+			for m in range(self.slots):
+				vec |= int(self.data[n * self.slots + m]) << (m * BITSIZE)
+			yield vec
+
+	def __len__(self):
+		return self.len
+
+	def __dealloc__(self):
+		if self.data is not NULL:
+			free(self.data)
+			self.data = NULL
+
+
+cdef inline int spancmp(uint64_t *a, uint64_t *b, int slots) nogil:
+	"""Compare bit vectors numerically, most significant word first."""
+	cdef int n
+	for n in range(slots - 1, -1, -1):
+		if a[n] != b[n]:
+			return (a[n] > b[n]) - (a[n] < b[n])
+	return 0
+
+
+cdef int spancmpsmall(const void *a, const void *b) nogil:
+	return spancmp(<uint64_t *>a, <uint64_t *>b, 1)
+
+
+cdef int spancmpfat(const void *a, const void *b) nogil:
+	return spancmp(<uint64_t *>a, <uint64_t *>b, SLOTS)
+
+
 @cython.final
 cdef class Edges:
 	"""A static array with a fixed number of Edge structs."""
@@ -408,9 +522,12 @@ cdef class Ctrees:
 
 	When trees is given, prods should be given as well.
 	When trees is not given, the alloc() method should be called and
-	trees added one by one using the add() or addnodes() methods."""
+	trees added one by one using the add() or addnodes() methods.
+	Alternatively, a Ctrees object stored with tofile() can be memory-mapped
+	with fromfile()."""
 	def __cinit__(self):
 		self.trees = self.nodes = NULL
+		self.mapped = None
 
 	def __init__(self, list trees=None, dict prods=None):
 		self.len = self.max = 0
@@ -436,6 +553,8 @@ cdef class Ctrees:
 		"""Increase size of array (handy with incremental binarization)."""
 		# based on Python's listobject.c list_resize()
 		cdef numnodes
+		if self.mapped is not None:
+			raise ValueError('cannot add trees to memory-mapped Ctrees.')
 		if numtrees > self.max:
 			# overallocate to get linear-time amortized behavior
 			numtrees += (numtrees >> 3) + (3 if numtrees < 9 else 6)
@@ -508,21 +627,94 @@ cdef class Ctrees:
 	def indextrees(self, dict prods):
 		"""Create index from productions to trees containing that production.
 
-		Productions are represented as integer IDs, trees are given as sets of
-		integer indices."""
+		Productions are represented as integer IDs, trees are given as sorted
+		arrays of integer indices (``array('I')``)."""
 		cdef:
-			list result = [set() for _ in prods]
+			list result
+			array tmp
 			NodeArray a
 			Node *nodes
-			int n, m
+			int n, m, prod, numprods = len(prods)
+			uint32_t *cnt = <uint32_t *>calloc(numprods, sizeof(uint32_t))
+			int *last = <int *>malloc(numprods * sizeof(int))
+		if cnt is NULL or last is NULL:
+			raise MemoryError('allocation error')
+		# count the number of trees for each production, then fill arrays
+		memset(<void *>last, -1, numprods * sizeof(int))
 		for n in range(self.len):
 			a = self.trees[n]
 			nodes = &self.nodes[a.offset]
 			for m in range(a.len):
-				(<set>result[nodes[m].prod]).add(n)
+				prod = nodes[m].prod
+				if last[prod] != n:
+					last[prod] = n
+					cnt[prod] += 1
+		result = [clone(uintarray, cnt[prod], False)
+				for prod in range(numprods)]
+		memset(<void *>cnt, 0, numprods * sizeof(uint32_t))
+		memset(<void *>last, -1, numprods * sizeof(int))
+		for n in range(self.len):
+			a = self.trees[n]
+			nodes = &self.nodes[a.offset]
+			for m in range(a.len):
+				prod = nodes[m].prod
+				if last[prod] != n:
+					last[prod] = n
+					tmp = result[prod]
+					tmp.data.as_uints[cnt[prod]] = n
+					cnt[prod] += 1
+		free(cnt)
+		free(last)
 		self.treeswithprod = result
 
+	def tofile(self, filename):
+		"""Store the node arrays in a binary file; cf. ``fromfile()``.
+
+		The format is a header followed by the raw NodeArray and Node structs,
+		so the file is only valid on machines with the same struct layout."""
+		with open(filename, 'wb') as out:
+			out.write(CTREESHEADER.pack(CTREESMAGIC, sizeof(NodeArray),
+					sizeof(Node), self.len, self.numnodes, self.maxnodes))
+			if self.len:
+				out.write((<char *>self.trees)[:self.len * sizeof(NodeArray)])
+				out.write((<char *>self.nodes)[:self.numnodes * sizeof(Node)])
+
+	@classmethod
+	def fromfile(cls, filename):
+		"""Memory-map a Ctrees object stored with ``tofile()``.
+
+		The nodes are not copied, so processes mapping the same file share
+		the memory; the result is read-only. Call ``indextrees()`` to
+		re-create the index of productions."""
+		import numpy as np
+		cdef Ctrees ctrees = Ctrees()
+		cdef size_t offset = CTREESHEADER.size
+		cdef char *data
+		cdef bytes header = None
+		with open(filename, 'rb') as inp:
+			header = inp.read(CTREESHEADER.size)
+		(magic, treesize, nodesize, numtrees, numnodes, maxnodes
+				) = CTREESHEADER.unpack(header)
+		if (magic != CTREESMAGIC or treesize != sizeof(NodeArray)
+				or nodesize != sizeof(Node)):
+			raise ValueError('%r: incompatible Ctrees file.' % filename)
+		if not numtrees:
+			return ctrees
+		ctrees.mapped = np.memmap(filename, dtype=np.uint8, mode='r')
+		if len(ctrees.mapped) != (offset + numtrees * sizeof(NodeArray)
+				+ numnodes * sizeof(Node)):
+			raise ValueError('%r: truncated Ctrees file.' % filename)
+		data = <char *><size_t>ctrees.mapped.ctypes.data
+		ctrees.trees = <NodeArray *>&data[offset]
+		ctrees.nodes = <Node *>&data[offset + numtrees * sizeof(NodeArray)]
+		ctrees.len = ctrees.max = numtrees
+		ctrees.numnodes = numnodes
+		ctrees.maxnodes = maxnodes
+		return ctrees
+
 	def __dealloc__(self):
+		if self.mapped is not None:  # memory belongs to the memory map
+			self.trees = self.nodes = NULL
 		if self.nodes is not NULL:
 			free(self.nodes)
 			self.nodes = NULL
@@ -554,4 +746,4 @@ cdef inline copynodes(tree, dict prods, Node *result):
 				result[n].right = -1
 
 __all__ = ['Chart', 'Ctrees', 'Edges', 'FatChartItem', 'Grammar',
-		'LexicalRule', 'RankedEdge', 'SmallChartItem', 'numedges']
+		'LexicalRule', 'RankedEdge', 'SmallChartItem', 'SpanSet', 'numedges']
@@ -27,7 +27,7 @@ from libc.stdint cimport uint8_t, uint32_t, uint64_t
 from discodop.bit cimport abitcount
 from discodop.plcfrs cimport DoubleEntry, new_DoubleEntry
 from discodop.containers cimport Grammar, Rule, LexicalRule, Chart, Edges, \
-		SmallChartItem, FatChartItem, Edge, RankedEdge, \
+		SmallChartItem, FatChartItem, SpanSet, Edge, RankedEdge, \
 		new_RankedEdge, logprobadd, logprobsum, yieldranges
 cimport cython
 
@@ -735,7 +735,7 @@ def treeparsing(trees, sent, Grammar grammar, int m, backtransform, tags=None,
 	# do not apply directly.
 	cdef FatChartItem fitem
 	cdef int n, selected = 0, lensent = len(sent)
-	whitelist = [{} for _ in grammar.toid]
+	whitelist = [[] for _ in grammar.toid]
 	if maskrules:
 		grammar.setmask([])  # block all rules
 	for treestr in trees:
@@ -750,7 +750,7 @@ def treeparsing(trees, sent, Grammar grammar, int m, backtransform, tags=None,
 				for n in leaves:
 					SETBIT(fitem.vec, n)
 			try:
-				whitelist[grammar.toid[node.label.encode('ascii')]][item] = 0.0
+				whitelist[grammar.toid[node.label.encode('ascii')]].append(item)
 			except KeyError:
 				return [], "'%s' not in grammar" % node.label, None
 
@@ -769,6 +769,7 @@ def treeparsing(trees, sent, Grammar grammar, int m, backtransform, tags=None,
 	# if maskrules:
 	# 	grammar = SubsetGrammar(grammar, selected)
 
+	whitelist = [SpanSet(a) for a in whitelist]
 	# Project labels to all possible labels that generate that label. For DOP
 	# reduction, all possible ids; for Double DOP, ignore artificial labels.
 	for label, n in grammar.toid.items():
@@ -15,7 +15,7 @@ else:
 	from itertools import izip_longest as zip_longest
 
 from discodop import grammar
-from discodop.tree import Tree
+from discodop.tree import Tree, CompactTree
 from discodop.treedraw import DrawTree
 from discodop.treebank import READERS, dependencies
 from discodop.treebanktransforms import readheadrules
@@ -751,6 +751,8 @@ def bracketings(tree, labeled=True, dellabel=(), disconly=False):
 	``tree`` must have been processed by ``transform()``.
 	The argument ``dellabel`` is only used to exclude the ROOT node from the
 	results (because it cannot be deleted by ``transform()`` when non-unary).
+	A ``CompactTree`` cannot be transformed; its bracketings are read off
+	directly.
 
 	>>> tree = Tree.parse('(S (NP 1) (VP (VB 0) (JJ 2)))', parse_leaf=int)
 	>>> params = {'DELETE_LABEL': set(), 'DELETE_WORD': set(),
@@ -766,6 +768,15 @@ def bracketings(tree, labeled=True, dellabel=(), disconly=False):
 	... params, set())
 	>>> bracketings(tree)
 	Counter({('S', (0, 1, 2)): 1})"""
+	if isinstance(tree, CompactTree):
+		result = multiset()
+		for a in tree.subtrees(lambda n: n and isinstance(n[0], CompactTree)
+				and n.label not in dellabel):
+			indices = tuple(sorted(a.leaves()))
+			if not disconly or (indices
+					and indices[-1] - indices[0] + 1 != len(indices)):
+				result[a.label if labeled else '', indices] += 1
+		return result
 	return multiset(bracketing(a, labeled) for a in tree.subtrees()
 			if a and isinstance(a[0], Tree)  # nonempty, not a preterminal
 				and a.label not in dellabel and (not disconly or disc(a)))
@@ -13,13 +13,25 @@ import os
 import re
 import sys
 import codecs
+import heapq
+import hashlib
+import marshal
 import logging
+import shutil
+import tempfile
+import time
+import zlib
 if sys.version[0] > '2':
+	import pickle
 	imap = map
 else:
+	import cPickle as pickle
 	from itertools import imap
 from multiprocessing import Pool, cpu_count, log_to_stderr, SUBDEBUG
-from collections import defaultdict
+from ast import literal_eval
+from array import array
+from collections import defaultdict, Counter as multiset
+from functools import partial
 from itertools import count
 from getopt import gnu_getopt, GetoptError
 from discodop.tree import Tree
@@ -27,7 +39,9 @@ from discodop.treebank import READERS
 from discodop.treetransforms import binarize, introducepreterminals, unbinarize
 from discodop._fragments import readtreebank, getctrees, \
 		extractfragments, exactcounts, \
-		completebitsets, coverbitsets
+		completebitsets, coverbitsets, treecosts, \
+		addprods, getlabelsprods, getprodid, tolist
+from discodop.containers import Ctrees
 from discodop.parser import workerfunc
 
 USAGE = '''\
@@ -55,10 +69,31 @@ Options:
   --batch=dir   enable batch mode; any number of treebanks > 1 can be given;
                 first treebank will be compared to all others.
                 Results are written to filenames of the form dir/A_B.
+                With --numproc, the other treebanks are divided over the
+                processes.
   --numproc=n   use n independent processes, to enable multi-core usage
                 (default: 1); use 0 to detect the number of CPUs.
   --numtrees=n  only read first n trees from first treebank
   --encoding=x  use x as treebank encoding, e.g. UTF-8, ISO-8859-1, etc.
+  --cachedir=dir
+                store converted treebanks in 'dir'; subsequent runs with the
+                same treebanks and options memory-map them instead of
+                re-reading the treebanks.
+  --checkpoint=dir
+                store intermediate results in 'dir' as they are finished;
+                when the same command is interrupted and run again, completed
+                work is read from 'dir' instead of being repeated.
+  --memlimit=n  when the collected fragments take more than n MB of memory,
+                write them to temporary files, which are merged at the end;
+                the fragments are then counted and written in chunks, in a
+                different order than without --memlimit. Incompatible with
+                --relfreq.
+  --incremental=file
+                update the fragments in 'file', extracted from treebank1
+                with counts or with --indices, after adding the trees of
+                treebank2; only pairs with a new tree are compared. The
+                result is the same as extracting fragments from treebank1
+                followed by treebank2.
   --nofreq      do not report frequencies.
   --approx      report counts of occurrence as maximal fragment (lower bound)
   --relfreq     report relative frequencies wrt. root node of fragments.
@@ -73,11 +108,14 @@ Options:
 
 FLAGS = ('approx', 'indices', 'nofreq', 'complete', 'complement', 'cover',
 		'alt', 'relfreq', 'twoterms', 'adjacent', 'debin', 'debug', 'quiet')
-OPTIONS = ('fmt=', 'numproc=', 'numtrees=', 'encoding=', 'batch=')
+OPTIONS = ('fmt=', 'numproc=', 'numtrees=', 'encoding=', 'batch=',
+		'cachedir=', 'checkpoint=', 'memlimit=', 'incremental=')
 PARAMS = {}
 FRONTIERRE = re.compile(r"\(([^ ()]+) \)")
 TERMRE = re.compile(r"\(([^ ()]+) ([^ ()]+)\)")
 APPLY = lambda x, _y: x()
+WORKMULT = 8  # number of intervals per process, handed out dynamically
+BATCHCHUNK = 1000  # with --memlimit, number of trees per extraction in batch
 
 
 def main(argv=None):
@@ -95,6 +133,7 @@ def main(argv=None):
 		PARAMS[flag] = '--' + flag in opts
 	PARAMS['disc'] = opts.get('--fmt', 'bracket') != 'bracket'
 	PARAMS['fmt'] = opts.get('--fmt', 'bracket')
+	PARAMS['cachedir'] = opts.get('--cachedir')
 	numproc = int(opts.get("--numproc", 1))
 	if numproc == 0:
 		numproc = cpu_count()
@@ -103,6 +142,7 @@ def main(argv=None):
 	limit = int(opts.get('--numtrees', 0)) or None
 	encoding = opts.get("--encoding", "UTF-8")
 	batchdir = opts.get("--batch")
+	memlimit = int(float(opts.get('--memlimit', 0)) * 1024 ** 2) or None
 
 	if len(args) < 1:
 		print("missing treebank argument")
@@ -110,10 +150,6 @@ def main(argv=None):
 		print("incorrect number of arguments:", args)
 		print(USAGE)
 		return
-	if batchdir:
-		if numproc != 1:
-			raise ValueError('Batch mode only supported in single-process '
-				'mode. Use the xargs command for multi-processing.')
 	if args[0] == '-':
 		args[0] = '/dev/stdin'
 	for a in args:
@@ -123,6 +159,20 @@ def main(argv=None):
 		if PARAMS['twoterms'] or PARAMS['adjacent']:
 			raise ValueError('--twoterms and --adjacent are incompatible '
 					'with --complete.')
+	if '--incremental' in opts:
+		if len(args) != 2 or batchdir:
+			raise ValueError('--incremental requires two treebanks: '
+					'the old treebank and the new trees.')
+		if PARAMS['disc'] or limit:
+			raise ValueError('--incremental is incompatible with --fmt '
+					'and --numtrees.')
+		if any(PARAMS[a] for a in ('approx', 'nofreq', 'complete', 'cover',
+				'complement', 'twoterms', 'adjacent')):
+			raise ValueError('--incremental is incompatible with --approx, '
+					'--nofreq, --complete, --cover, --complement, --twoterms, '
+					'and --adjacent.')
+	if memlimit and PARAMS['relfreq']:
+		raise ValueError('--relfreq is incompatible with --memlimit.')
 	if PARAMS['complete']:
 		if len(args) != 2 and not batchdir:
 			raise ValueError('need at least two treebanks with --complete.')
@@ -143,21 +193,56 @@ def main(argv=None):
 	logging.info("\n".join("treebank%d: %s" % (n + 1, a)
 		for n, a in enumerate(args)))
 
-	if numproc == 1 and batchdir:
-		batch(batchdir, args, limit, encoding, '--debin' in opts)
+	if batchdir:
+		batch(batchdir, args, limit, encoding, '--debin' in opts, memlimit,
+				numproc)
 	else:
-		fragmentkeys, counts = regular(args, numproc, limit, encoding)
+		if '--incremental' in opts:
+			chunks = [incremental(opts['--incremental'], args,
+					numproc, encoding)]
+		else:
+			chunks = regularchunks(args, numproc, limit, encoding,
+					checkpoint=opts.get('--checkpoint'), memlimit=memlimit)
 		out = (io.open(opts['-o'], 'w', encoding=encoding)
 				if '-o' in opts else None)
-		if '--debin' in opts:
-			fragmentkeys = debinarize(fragmentkeys)
-		printfragments(fragmentkeys, counts, out=out)
+		for fragmentkeys, counts in chunks:
+			if '--debin' in opts:
+				fragmentkeys = debinarize(fragmentkeys)
+			printfragments(fragmentkeys, counts, out=out)
+
+
+def regular(filenames, numproc, limit, encoding, checkpoint=None,
+		memlimit=None):
+	"""non-batch processing. multiprocessing optional.
+
+	:returns: a tuple ``(fragmentkeys, counts)``; cf. :func:`regularchunks`
+		for the parameters."""
+	fragmentkeys, counts = [], []
+	for keys, values in regularchunks(filenames, numproc, limit, encoding,
+			checkpoint, memlimit):
+		fragmentkeys.extend(keys)
+		counts.extend(values or ())
+	return fragmentkeys, None if PARAMS['nofreq'] else counts
 
 
-def regular(filenames, numproc, limit, encoding):
-	"""non-batch processing. multiprocessing optional."""
-	mult = 1
-	if PARAMS['approx']:
+def regularchunks(filenames, numproc, limit, encoding, checkpoint=None,
+		memlimit=None):
+	"""Like :func:`regular`, but yield the fragments in chunks.
+
+	:param checkpoint: if given, a directory where intermediate results are
+		stored; when the same command is run again, completed work is read
+		from this directory instead of being repeated.
+	:param memlimit: if given, collect fragments in a :class:`FragmentStore`
+		which spills to disk when it uses more than this number of bytes.
+		The merged fragments are then counted and yielded in chunks of about
+		this size, in a different order; only the extraction of fragments
+		is stored with ``checkpoint``.
+	:returns: an iterator of tuples ``(fragmentkeys, counts)``; without
+		``memlimit``, there is a single chunk."""
+	mult = WORKMULT
+	if memlimit:
+		fragments = FragmentStore(memlimit)
+	elif PARAMS['approx']:
 		fragments = defaultdict(int)
 	else:
 		fragments = {}
@@ -176,117 +261,325 @@ def regular(filenames, numproc, limit, encoding):
 	numtrees = (PARAMS['trees1'].len if limit is None
 			else min(PARAMS['trees1'].len, limit))
 
-	if PARAMS['complete']:
-		trees1, trees2 = PARAMS['trees1'], PARAMS['trees2']
-		fragments = completebitsets(trees1, PARAMS['sents1'], PARAMS['labels'],
-				max(trees1.maxnodes, (trees2 or trees1).maxnodes),
-				PARAMS['disc'])
+	# with memlimit, the work of a single process is divided as well, such
+	# that each result is added to the store before the next is extracted
+	work = workload(numtrees, mult, max(numproc, 2) if memlimit else numproc,
+			treecosts(PARAMS['trees1'], PARAMS['trees2']))
+	if checkpoint is not None:
+		key = [(os.path.abspath(a), os.stat(a).st_size, os.stat(a).st_mtime)
+				for a in filenames]
+		key += [limit, encoding, PARAMS['fmt']] + [PARAMS[a] for a in (
+				'approx', 'indices', 'complete', 'complement', 'cover',
+				'twoterms', 'adjacent')]
+		work = initcheckpoint(checkpoint, key, work)
+	merged = loadcheckpoint(checkpoint, 'merged')
+	if merged is not None:
+		chunks = [merged]
 	else:
-		if len(filenames) == 1:
-			work = workload(numtrees, mult, numproc)
+		if PARAMS['complete']:
+			trees1, trees2 = PARAMS['trees1'], PARAMS['trees2']
+			fragments = completebitsets(trees1, PARAMS['sents1'],
+					PARAMS['labels'],
+					max(trees1.maxnodes, (trees2 or trees1).maxnodes),
+					PARAMS['disc'])
 		else:
-			chunk = numtrees // (mult * numproc) + 1
-			work = [(a, a + chunk) for a in range(0, numtrees, chunk)]
-		if numproc != 1:
-			logging.info("work division:\n%s", "\n".join("    %s:\t%r" % kv
-				for kv in sorted(dict(numchunks=len(work), mult=mult).items())))
-		dowork = mymap(worker, work)
-		for n, results in enumerate(dowork):
+			if numproc != 1:
+				logging.info("work division:\n%s", "\n".join(
+					"    %s:\t%r" % kv for kv in sorted(dict(
+						numchunks=len(work), mult=mult).items())))
+			dowork = mapcheckpointed(worker, work,
+					mymap if numproc == 1 else timedmap(pool), checkpoint,
+					'fragments')
+			for n, results in enumerate(dowork):
+				if PARAMS['approx'] and memlimit:
+					fragments.add(results)
+				elif PARAMS['approx']:
+					for frag, x in results.items():
+						fragments[frag] += x
+				else:
+					fragments.update(results)
+		if PARAMS['cover']:
+			cover = myapply(coverfragworker, ())
 			if PARAMS['approx']:
-				for frag, x in results.items():
-					fragments[frag] += x
+				fragments.update(zip(cover,
+						exactcounts(PARAMS['trees1'], PARAMS['trees1'],
+						cover.values())))
 			else:
-				fragments.update(results)
-	if PARAMS['cover']:
-		cover = myapply(coverfragworker, ())
-		if PARAMS['approx']:
-			fragments.update(zip(cover,
-					exactcounts(PARAMS['trees1'], PARAMS['trees1'],
-					cover.values())))
+				fragments.update(cover)
+			logging.info("merged %d cover fragments", len(cover))
+		if isinstance(fragments, FragmentStore):
+			chunks = fragments.chunks()
+			checkpoint = None
 		else:
-			fragments.update(cover)
-		logging.info("merged %d cover fragments", len(cover))
-	fragmentkeys = list(fragments)
-	if PARAMS['nofreq']:
-		counts = None
-	elif PARAMS['approx']:
-		counts = [fragments[a] for a in fragmentkeys]
+			chunks = [keysvalues(fragments)]
+			if checkpoint is not None:
+				dumpcheckpoint(chunks[0], checkpoint, 'merged')
+		del fragments
+	for fragmentkeys, values in chunks:
+		if PARAMS['nofreq']:
+			counts = None
+		elif PARAMS['approx']:
+			counts = values
+		else:
+			task = "indices" if PARAMS['indices'] else "counts"
+			logging.info("dividing work for exact %s", task)
+			bitsets = values
+			countchunk = len(bitsets) // numproc + 1
+			work = list(range(0, len(bitsets), countchunk))
+			work = [(n, len(work), bitsets[a:a + countchunk])
+					for n, a in enumerate(work)]
+			counts = []
+			logging.info("getting exact %s", task)
+			for a in mapcheckpointed(exactcountworker, work, mymap,
+					checkpoint, 'counts%d-' % countchunk):
+				counts.extend(a)
+		yield fragmentkeys, counts
+	if numproc != 1:
+		pool.close()
+		pool.join()
+		del pool
+
+
+def incremental(previous, filenames, numproc, encoding):
+	"""Update fragments of a treebank after new trees have been added.
+
+	:param previous: a file with fragments of the old treebank, with counts
+		or (when ``PARAMS['indices']`` is True) indices.
+	:param filenames: the old treebank and a treebank with the new trees.
+	:returns: a tuple ``(fragmentkeys, counts)`` as would be obtained from
+		the old treebank followed by the new trees.
+
+	Fragments are only extracted from pairs with at least one new tree; the
+	counts of the previous fragments are updated by counting their
+	occurrences in the new trees."""
+	prevcounts = {}
+	with io.open(previous, encoding=encoding) as inp:
+		for n, line in enumerate(inp, 1):
+			frag, _, value = line.rstrip().rpartition('\t')
+			if value.startswith('['):
+				prevcounts[frag] = multiset(literal_eval(value))
+			elif frag and value.isdigit():
+				prevcounts[frag] = int(value)
+			else:
+				raise ValueError('%s, line %d: expected a fragment with a '
+						'count or indices; --incremental requires previous '
+						'fragments extracted without --nofreq.' % (previous, n))
+	if PARAMS['indices'] and not all(isinstance(a, multiset)
+			for a in prevcounts.values()):
+		raise ValueError('--indices requires previous fragments with indices')
+	oldtreebank, newtreebank = filenames
+	# the new trees are treebank1, such that extracted fragments refer to them
+	initworker(newtreebank, oldtreebank, None, encoding)
+	newtrees, oldtrees = PARAMS['trees1'], PARAMS['trees2']
+	if numproc == 1:
+		mymap = imap
 	else:
-		task = "indices" if PARAMS['indices'] else "counts"
-		logging.info("dividing work for exact %s", task)
-		bitsets = [fragments[a] for a in fragmentkeys]
-		countchunk = len(bitsets) // numproc + 1
-		work = list(range(0, len(bitsets), countchunk))
-		work = [(n, len(work), bitsets[a:a + countchunk])
-				for n, a in enumerate(work)]
-		counts = []
-		logging.info("getting exact %s", task)
-		for a in mymap(exactcountworker, work):
-			counts.extend(a)
+		pool = Pool(processes=numproc, initializer=initworker,
+				initargs=(newtreebank, oldtreebank, None, encoding))
+		mymap = timedmap(pool)
+	work = [(a, b, True) for a, b in workload(newtrees.len, WORKMULT,
+			numproc, treecosts(newtrees, oldtrees))]
+	work += [(a, b, False) for a, b in workload(newtrees.len, WORKMULT,
+			numproc, treecosts(newtrees))]
+	fragments = {}
+	for results in mymap(incrementalworker, work):
+		fragments.update(results)
 	if numproc != 1:
 		pool.close()
 		pool.join()
-		del dowork, pool
+		del pool
+	# read the previous fragments as trees, to count them in the new trees
+	prevtrees, prevsents = readtreebank(previous, PARAMS['labels'],
+			PARAMS['prods'], 'bracket', None, encoding)
+	prevfragments = completebitsets(prevtrees, prevsents, PARAMS['labels'],
+			max(prevtrees.maxnodes, newtrees.maxnodes), False)
+	newkeys = [a for a in fragments if a not in prevfragments]
+	logging.info("%d previous fragments, %d new fragments",
+			len(prevfragments), len(newkeys))
+	# the bitsets of the two kinds of work differ in size; read the new
+	# fragments as trees as well, to count them in the old and new trees.
+	if newkeys:
+		fd, filename = tempfile.mkstemp(suffix='.mrg')
+		try:
+			with os.fdopen(fd, 'wb') as out:
+				out.writelines(a + b'\n' for a in newkeys)
+			fragtrees, fragsents = readtreebank(filename, PARAMS['labels'],
+					PARAMS['prods'], 'bracket', None, 'utf-8')
+		finally:
+			os.remove(filename)
+	del fragments
+	for trees in (prevtrees, newtrees, oldtrees):
+		trees.indextrees(PARAMS['prods'])
+	# previous fragments: add occurrences in new trees
+	fragmentkeys = list(prevfragments)
+	counts = exactcounts(prevtrees, newtrees,
+			[prevfragments[a] for a in fragmentkeys], indices=True)
+	counts = [addindices(prevcounts[a], b, oldtrees.len) for a, b
+			in zip(fragmentkeys, counts)]
+	# new fragments: count occurrences in old and new trees
+	fragmentkeys.extend(newkeys)
+	if newkeys:
+		oldbitsets, newbitsets = (completebitsets(fragtrees, fragsents,
+				PARAMS['labels'], max(fragtrees.maxnodes, trees.maxnodes),
+				False) for trees in (oldtrees, newtrees))
+		counts.extend(addindices(a, b, oldtrees.len) for a, b in zip(
+				exactcounts(fragtrees, oldtrees,
+					[oldbitsets[a] for a in newkeys], indices=True),
+				exactcounts(fragtrees, newtrees,
+					[newbitsets[a] for a in newkeys], indices=True)))
+	if not PARAMS['indices']:
+		counts = [a if isinstance(a, int) else sum(a.values())
+				for a in counts]
 	return fragmentkeys, counts
 
 
-def batch(outputdir, filenames, limit, encoding, debin):
+def addindices(old, new, offset):
+	"""Combine counts or indices of old trees with indices of new trees.
+
+	New trees are numbered starting from ``offset``."""
+	if isinstance(old, int):
+		return old + sum(new.values())
+	result = multiset(old)
+	for n, cnt in new.items():
+		result[n + offset] += cnt
+	return result
+
+
+@workerfunc
+def incrementalworker(args):
+	"""Worker function for comparing new trees to old or other new trees.
+
+	New trees are compared to old trees if ``old`` is True;
+	cf. :func:`incremental`."""
+	offset, end, old = args
+	return extractfragments(PARAMS['trees1'], PARAMS['sents1'], offset, end,
+			PARAMS['labels'], PARAMS['trees2'] if old else None,
+			PARAMS['sents2'] if old else None, approx=False,
+			discontinuous=PARAMS['disc'], debug=PARAMS['debug'])
+
+
+def batch(outputdir, filenames, limit, encoding, debin, memlimit=None,
+		numproc=1):
 	"""batch processing: three or more treebanks specified.
 	The use case for this is when you have one big treebank which you want to
 	compare to lots of smaller sets of trees, and get the results for each
-	comparison in a separate file."""
+	comparison in a separate file.
+
+	:param memlimit: cf. :func:`regularchunks`; with multiple processes, the
+		limit applies to each process.
+	:param numproc: when > 1, the treebanks are distributed over a pool of
+		processes, which share the first treebank as loaded by this process
+		(copy-on-write). Each result is written as soon as it is ready."""
 	initworker(filenames[0], None, limit, encoding)
+	PARAMS.update(outputdir=outputdir, batchfile=filenames[0], limit=limit,
+			encoding=encoding, debin=debin, memlimit=memlimit)
+	if numproc == 1:
+		mymap = imap
+	else:
+		pool = Pool(processes=numproc)
+		mymap = timedmap(pool)
+		# largest treebanks first, to balance the work
+		filenames = [filenames[0]] + sorted(filenames[1:],
+				key=os.path.getsize, reverse=True)
+	for outputfilename in mymap(batchworker, filenames[1:]):
+		logging.info("wrote to %s", outputfilename)
+	if numproc != 1:
+		pool.close()
+		pool.join()
+		del pool
+
+
+@workerfunc
+def batchworker(filename):
+	"""Worker function for comparing the first treebank to another treebank.
+
+	Used in batch mode; returns the name of the file with results for the
+	treebank ``filename``."""
 	trees1 = PARAMS['trees1']
 	sents1 = PARAMS['sents1']
-	if PARAMS['approx']:
-		fragments = defaultdict(int)
-	else:
-		fragments = {}
-	for filename in filenames[1:]:
-		PARAMS.update(read2ndtreebank(filename, PARAMS['labels'],
-			PARAMS['prods'], PARAMS['fmt'], limit, encoding))
-		trees2 = PARAMS['trees2']
-		sents2 = PARAMS['sents2']
-		if PARAMS['complete']:
-			fragments = completebitsets(trees2, sents2, PARAMS['labels'],
-					max(trees1.maxnodes, (trees2 or trees1).maxnodes),
-					PARAMS['disc'])
-		else:
-			fragments = extractfragments(trees2, sents2, 0, 0,
+	memlimit = PARAMS['memlimit']
+	PARAMS.update(read2ndtreebank(filename, PARAMS['labels'],
+		PARAMS['prods'], PARAMS['fmt'], PARAMS['limit'], PARAMS['encoding']))
+	trees2 = PARAMS['trees2']
+	sents2 = PARAMS['sents2']
+	# the index of trees1 should cover productions new in this treebank
+	trees1.indextrees(PARAMS['prods'])
+	if PARAMS['complete']:
+		fragments = completebitsets(trees2, sents2, PARAMS['labels'],
+				max(trees1.maxnodes, (trees2 or trees1).maxnodes),
+				PARAMS['disc'])
+	elif memlimit:  # extract in chunks to bound memory usage
+		fragments = FragmentStore(memlimit)
+		for offset in range(0, trees2.len, BATCHCHUNK):
+			results = extractfragments(trees2, sents2, offset,
+					min(offset + BATCHCHUNK, trees2.len),
 					PARAMS['labels'], trees1, sents1,
 					discontinuous=PARAMS['disc'], debug=PARAMS['debug'],
 					approx=PARAMS['approx'],
 					twoterms=PARAMS['twoterms'],
 					adjacent=PARAMS['adjacent'])
-		counts = None
-		fragmentkeys = list(fragments)
-		if PARAMS['approx'] or not fragments:
-			counts = fragments.values()
-		elif not PARAMS['nofreq']:
-			bitsets = [fragments[a] for a in fragmentkeys]
-			logging.info('getting %s for %d fragments',
-					'indices of occurrence' if PARAMS['indices']
-					else 'exact counts', len(bitsets))
-			counts = exactcounts(trees2, trees1, bitsets,
-					indices=PARAMS['indices'])
-		outputfilename = '%s/%s_%s' % (outputdir,
-				os.path.basename(filenames[0]), os.path.basename(filename))
-		out = io.open(outputfilename, 'w', encoding=encoding)
-		if debin:
-			fragmentkeys = debinarize(fragmentkeys)
-		printfragments(fragmentkeys, counts, out=out)
-		logging.info("wrote to %s", outputfilename)
+			if PARAMS['approx']:
+				fragments.add(results)
+			else:
+				fragments.update(results)
+	else:
+		fragments = extractfragments(trees2, sents2, 0, 0,
+				PARAMS['labels'], trees1, sents1,
+				discontinuous=PARAMS['disc'], debug=PARAMS['debug'],
+				approx=PARAMS['approx'],
+				twoterms=PARAMS['twoterms'],
+				adjacent=PARAMS['adjacent'])
+	chunks = (fragments.chunks() if isinstance(fragments, FragmentStore)
+			else [keysvalues(fragments)])
+	del fragments
+	outputfilename = '%s/%s_%s' % (PARAMS['outputdir'],
+			os.path.basename(PARAMS['batchfile']), os.path.basename(filename))
+	with io.open(outputfilename, 'w', encoding=PARAMS['encoding']) as out:
+		for fragmentkeys, values in chunks:
+			counts = None
+			if PARAMS['approx'] or not fragmentkeys:
+				counts = values
+			elif not PARAMS['nofreq']:
+				bitsets = values
+				logging.info('getting %s for %d fragments',
+						'indices of occurrence' if PARAMS['indices']
+						else 'exact counts', len(bitsets))
+				counts = exactcounts(trees2, trees1, bitsets,
+						indices=PARAMS['indices'])
+			if PARAMS['debin']:
+				fragmentkeys = debinarize(fragmentkeys)
+			printfragments(fragmentkeys, counts, out=out)
+	return outputfilename
 
 
 def readtreebanks(treebank1, treebank2=None, fmt='bracket',
-		limit=None, encoding='utf-8'):
-	"""Read one or two treebanks."""
+		limit=None, encoding='utf-8', cachedir=None):
+	"""Read one or two treebanks.
+
+	:param cachedir: if given, store the converted treebanks in this directory
+		and memory-map them on subsequent calls with the same treebanks
+		(as identified by path, size, and modification time) and options."""
+	cache = None
+	if cachedir is not None:
+		cache = cachefilename(cachedir, (treebank1, treebank2),
+				fmt, limit, encoding)
+		if cache is not None and os.path.exists(cache + '.pickle'):
+			return loadcache(cache)
 	labels = []
 	prods = {}
 	trees1, sents1 = readtreebank(treebank1, labels, prods,
 			fmt, limit, encoding)
 	trees2, sents2 = readtreebank(treebank2, labels, prods,
 			fmt, limit, encoding)
+	if cache is not None:
+		trees1.tofile(cache + '.ctrees1')
+		if trees2:
+			trees2.tofile(cache + '.ctrees2')
+		with open(cache + '.tmp', 'wb') as out:
+			pickle.dump(dict(sents1=sents1, sents2=sents2, prods=prods,
+					labels=labels), out, protocol=-1)
+		# the pickle is written last and marks the cache as complete
+		os.rename(cache + '.tmp', cache + '.pickle')
 	trees1.indextrees(prods)
 	if trees2:
 		trees2.indextrees(prods)
@@ -294,6 +587,41 @@ def readtreebanks(treebank1, treebank2=None, fmt='bracket',
 			prods=prods, labels=labels)
 
 
+def cachefilename(cachedir, treebanks, fmt, limit, encoding):
+	"""Return prefix for cache files of the given treebanks and options.
+
+	Returns None if one of the treebanks is not a regular file
+	(e.g., ``/dev/stdin``)."""
+	key = [fmt, limit, encoding.lower()]
+	for filename in treebanks:
+		if filename is None:
+			key.append(None)
+			continue
+		if not os.path.isfile(filename):
+			return None
+		stat = os.stat(filename)
+		key.append((os.path.abspath(filename), stat.st_size, stat.st_mtime))
+	if not os.path.isdir(cachedir):
+		os.makedirs(cachedir)
+	return os.path.join(cachedir,
+			hashlib.sha1(repr(key).encode('utf-8')).hexdigest())
+
+
+def loadcache(cache):
+	"""Load treebanks stored by ``readtreebanks()``.
+
+	The trees are memory-mapped."""
+	with open(cache + '.pickle', 'rb') as inp:
+		result = pickle.load(inp)
+	result['trees1'] = Ctrees.fromfile(cache + '.ctrees1')
+	result['trees1'].indextrees(result['prods'])
+	result['trees2'] = None
+	if result['sents2'] is not None:
+		result['trees2'] = Ctrees.fromfile(cache + '.ctrees2')
+		result['trees2'].indextrees(result['prods'])
+	return result
+
+
 def read2ndtreebank(treebank2, labels, prods, fmt='bracket',
 		limit=None, encoding='utf-8'):
 	"""Read a second treebank."""
@@ -310,9 +638,11 @@ def initworker(treebank1, treebank2, limit, encoding):
 	"""Read treebanks for this worker.
 
 	We do this separately for each process under the assumption that this is
-	advantageous with a NUMA architecture."""
+	advantageous with a NUMA architecture. With ``--cachedir``, the treebanks
+	are converted once and memory-mapped by each worker."""
 	PARAMS.update(readtreebanks(treebank1, treebank2,
-			limit=limit, fmt=PARAMS['fmt'], encoding=encoding))
+			limit=limit, fmt=PARAMS['fmt'], encoding=encoding,
+			cachedir=PARAMS.get('cachedir')))
 	if PARAMS['debug']:
 		print("\nproductions:")
 		for a, b in sorted(PARAMS['prods'].items(), key=lambda x: x[1]):
@@ -335,6 +665,7 @@ def initworker(treebank1, treebank2, limit, encoding):
 def initworkersimple(trees, sents, disc, trees2=None, sents2=None):
 	"""Initialization for a worker in which a treebank was already loaded."""
 	PARAMS.update(getctrees(trees, sents, disc, trees2, sents2))
+	PARAMS['iteration'] = 0
 	assert PARAMS['trees1']
 
 
@@ -389,7 +720,315 @@ def coverfragworker():
 			PARAMS['disc'])
 
 
-def workload(numtrees, mult, numproc):
+class FragmentStore(object):
+	"""A fragment dictionary which spills to disk when it grows too large.
+
+	Behaves like the dictionaries of fragments that are merged in
+	:func:`regular` and :func:`getfragments`, but only supports adding
+	results with ``update()`` and ``add()``, and retrieving the final result
+	with ``chunks()``. Fragments are interned by a 64-bit hash, where
+	collisions are resolved by comparing the fragments themselves. The
+	fragments are stored (marshalled) in a single bytearray. When the
+	estimated memory usage exceeds ``memlimit`` bytes, the fragments are
+	written to a temporary file sorted by hash (a run), and memory is cleared;
+	the runs are merged in ``chunks()``.
+
+	The result is the same as with a dictionary, except for the order of the
+	fragments, which are sorted by hash."""
+
+	# estimated overhead per fragment for the index and the arrays.
+	ENTRYSIZE = 160
+
+	def __init__(self, memlimit, tmpdir=None):
+		self.memlimit = memlimit
+		self.tmpdir = tmpdir
+		self.rundir = None
+		self.runs = []
+		self.seq = 0
+		self._reset()
+
+	def _reset(self):
+		"""Clear the in-memory part."""
+		self.index = {}  # hash => slot
+		self.overflow = {}  # marshalled key => slot, for hash collisions
+		self.arena = bytearray()  # marshalled keys
+		self.offsets = array('L' if array('L').itemsize == 8 else 'Q', [0])
+		self.hashes = array(self.offsets.typecode)
+		self.seqs = array(self.offsets.typecode)  # order of first insertion
+		self.values = []
+		self.replaces = array('b')  # whether value replaces earlier runs
+		self.size = 0
+
+	def __len__(self):
+		"""The number of fragments in memory.
+
+		Fragments may occur in multiple runs."""
+		return len(self.values)
+
+	def _slot(self, key):
+		"""Return slot for key, or create one."""
+		keydata = marshal.dumps(key)
+		# unlike hash(), the same for every run of the program
+		keyhash = (zlib.crc32(keydata) & 0xFFFFFFFF) << 32 | (
+				zlib.adler32(keydata) & 0xFFFFFFFF)
+		slot = self.index.get(keyhash)
+		if slot is not None:
+			if self.arena[self.offsets[slot]:self.offsets[slot + 1]] == keydata:
+				return slot, False
+			slot = self.overflow.get(keydata)
+			if slot is not None:
+				return slot, False
+			self.overflow[keydata] = len(self.values)
+		else:
+			self.index[keyhash] = len(self.values)
+		self.arena.extend(keydata)
+		self.offsets.append(len(self.arena))
+		self.hashes.append(keyhash)
+		self.seqs.append(self.seq)
+		self.seq += 1
+		self.size += len(keydata) + self.ENTRYSIZE
+		return len(self.values), True
+
+	def update(self, fragments):
+		"""Add fragments like ``dict.update()``.
+
+		A new value replaces an existing value."""
+		for key, value in (fragments.items()
+				if isinstance(fragments, dict) else fragments):
+			slot, new = self._slot(key)
+			if new:
+				self.values.append(value)
+				self.replaces.append(True)
+				self.size += sys.getsizeof(value)
+			else:
+				self.values[slot] = value
+				self.replaces[slot] = True
+		if self.size > self.memlimit:
+			self.spill()
+
+	def add(self, fragments):
+		"""Add fragments; values of existing fragments are summed."""
+		for key, value in (fragments.items()
+				if isinstance(fragments, dict) else fragments):
+			slot, new = self._slot(key)
+			if new:
+				self.values.append(value)
+				self.replaces.append(False)
+				self.size += sys.getsizeof(value)
+			else:
+				self.values[slot] += value
+		if self.size > self.memlimit:
+			self.spill()
+
+	def _items(self):
+		"""Yield in-memory fragments as sorted tuples.
+
+		The tuples have the form ``(hash, seq, keydata, value, replaces)``."""
+		offsets = self.offsets
+		for slot in sorted(range(len(self.values)),
+				key=lambda n: (self.hashes[n], self.seqs[n])):
+			yield (self.hashes[slot], self.seqs[slot],
+					bytes(self.arena[offsets[slot]:offsets[slot + 1]]),
+					self.values[slot], self.replaces[slot])
+
+	def spill(self):
+		"""Write in-memory fragments to a new run on disk."""
+		if self.rundir is None:
+			self.rundir = tempfile.mkdtemp(prefix='fragments', dir=self.tmpdir)
+		filename = os.path.join(self.rundir, 'run%d' % len(self.runs))
+		with open(filename, 'wb') as out:
+			for item in self._items():
+				marshal.dump(item, out)
+		logging.debug("spilled %d fragments to %s", len(self.values), filename)
+		self.runs.append(filename)
+		self._reset()
+
+	def _merged(self):
+		"""Merge the runs and the in-memory fragments.
+
+		Yields tuples ``(keydata, value)`` sorted by hash."""
+		runs = [readrun(a) for a in self.runs]
+		runs.append(self._items())
+		prevhash, group = None, {}
+		for keyhash, seq, keydata, value, replaces in heapq.merge(*runs):
+			if keyhash != prevhash:
+				for _, keydata1, value1 in sorted(group.values()):
+					yield keydata1, value1
+				prevhash, group = keyhash, {}
+			if keydata not in group:
+				group[keydata] = [seq, keydata, value]
+			elif replaces:
+				group[keydata][2] = value
+			else:
+				group[keydata][2] += value
+		for _, keydata1, value1 in sorted(group.values()):
+			yield keydata1, value1
+
+	def chunks(self):
+		"""Merge all fragments and yield them in chunks.
+
+		Yields tuples ``(keys, values)`` of two lists, which take about
+		``memlimit`` bytes; there is at least one chunk. The store is empty
+		afterwards."""
+		if self.runs and self.values:  # free memory for the chunks
+			self.spill()
+		keys, values, size, numchunks = [], [], 0, 0
+		try:
+			for keydata, value in self._merged():
+				keys.append(marshal.loads(keydata))
+				values.append(value)
+				size += len(keydata) + self.ENTRYSIZE + sys.getsizeof(value)
+				if size > self.memlimit:
+					yield keys, values
+					keys, values, size = [], [], 0
+					numchunks += 1
+		finally:
+			self.close()
+		if keys or not numchunks:
+			yield keys, values
+
+	def close(self):
+		"""Remove runs and clear memory."""
+		for filename in self.runs:
+			os.remove(filename)
+		if self.rundir is not None:
+			os.rmdir(self.rundir)
+		self.runs, self.rundir = [], None
+		self._reset()
+
+
+def readrun(filename):
+	"""Yield items stored by ``FragmentStore.spill()``."""
+	with open(filename, 'rb') as inp:
+		while True:
+			try:
+				yield marshal.load(inp)
+			except EOFError:
+				break
+
+
+def keysvalues(fragments):
+	"""Return the fragments and their values as two lists.
+
+	:param fragments: a dictionary or a :class:`FragmentStore`."""
+	if isinstance(fragments, FragmentStore):
+		fragmentkeys, values = [], []
+		for keys, chunk in fragments.chunks():
+			fragmentkeys.extend(keys)
+			values.extend(chunk)
+		return fragmentkeys, values
+	fragmentkeys = list(fragments)
+	return fragmentkeys, [fragments[a] for a in fragmentkeys]
+
+
+def initcheckpoint(checkpoint, key, work):
+	"""Prepare a directory for a resumable run.
+
+	:param key: a picklable description of the input and options; a run can
+		only be resumed if its key is identical.
+	:param work: the work division of a new run.
+	:returns: the work division that should be used; when resuming, this is
+		the work division of the original run."""
+	if not os.path.isdir(checkpoint):
+		os.makedirs(checkpoint)
+	previous = loadcheckpoint(checkpoint, 'manifest')
+	if previous is None:
+		dumpcheckpoint((key, work), checkpoint, 'manifest')
+		return work
+	if previous[0] != key:
+		raise ValueError('%r contains results for different treebanks or '
+				'options.' % checkpoint)
+	logging.info("resuming from %r", checkpoint)
+	return previous[1]
+
+
+def loadcheckpoint(checkpoint, name):
+	"""Return object stored with ``dumpcheckpoint()``, or None."""
+	if checkpoint is None:
+		return None
+	filename = os.path.join(checkpoint, name + '.pickle')
+	if not os.path.exists(filename):
+		return None
+	with open(filename, 'rb') as inp:
+		return pickle.load(inp)
+
+
+def dumpcheckpoint(obj, checkpoint, name):
+	"""Store an object such that it is either completely written or not at all.
+
+	I.e., a crash will never leave a partially written file."""
+	filename = os.path.join(checkpoint, name + '.pickle')
+	with open(filename + '.tmp', 'wb') as out:
+		pickle.dump(obj, out, protocol=-1)
+	os.rename(filename + '.tmp', filename)
+
+
+def mapcheckpointed(func, work, mymap, checkpoint, prefix):
+	"""Like ``mymap(func, work)``, but resumable with a checkpoint directory.
+
+	When ``checkpoint`` is a directory, store each result as soon as it is
+	finished, and skip items for which a result was stored in a previous run;
+	stored results are yielded in the order of ``work``."""
+	if checkpoint is None:
+		for result in mymap(func, work):
+			yield result
+		return
+	names = ['%s%d' % (prefix, n) for n in range(len(work))]
+	pending = [(func, a, checkpoint, name) for a, name in zip(work, names)
+			if not os.path.exists(os.path.join(checkpoint, name + '.pickle'))]
+	logging.info("%d of %d chunks completed in a previous run",
+			len(work) - len(pending), len(work))
+	for _ in mymap(checkpointworker, pending):
+		pass
+	for name in names:
+		yield loadcheckpoint(checkpoint, name)
+
+
+@workerfunc
+def checkpointworker(args):
+	"""Apply a worker function and store its result in the spill directory.
+
+	The result is not returned to the master process, which reads the
+	results from disk when all work is done."""
+	func, arg, checkpoint, name = args
+	dumpcheckpoint(func(arg), checkpoint, name)
+	logging.debug("stored %s", name)
+
+
+def timedmap(pool):
+	"""Return a function like ``map()`` which schedules work dynamically.
+
+	Work is handed out to the processes in ``pool`` as soon as they are idle,
+	and the utilization of each process is logged when all work is done.
+	Results are yielded in the order of the work, such that merging them gives
+	reproducible output."""
+	def mymap(func, work):
+		"""Apply func to each item of work."""
+		busy, numchunks = defaultdict(float), defaultdict(int)
+		start = time.time()
+		for pid, elapsed, result in pool.imap(
+				timedworker, [(func, a) for a in work]):
+			busy[pid] += elapsed
+			numchunks[pid] += 1
+			yield result
+		total = time.time() - start
+		logging.info("utilization of %d processes:\n%s", len(busy),
+				"\n".join("    %d: %d chunks, %.2fs busy (%.0f%%)" % (
+					pid, numchunks[pid], busy[pid],
+					100 * busy[pid] / (total or 1)) for pid in sorted(busy)))
+	return mymap
+
+
+@workerfunc
+def timedworker(args):
+	"""Apply a worker function and report the process and time taken."""
+	func, arg = args
+	start = time.time()
+	result = func(arg)
+	return os.getpid(), time.time() - start, result
+
+
+def workload(numtrees, mult, numproc, costs=None):
 	"""Calculate an even workload.
 
 	When *n* trees are compared against themselves, ``n * (n - 1)`` total
@@ -397,11 +1036,28 @@ def workload(numtrees, mult, numproc):
 	such that ``m < x <= n``
 	(meaning there are more comparisons for lower *n*).
 
+	:param mult: the number of intervals per process.
+	:param costs: if given, a sequence with the estimated cost of each tree
+		(cf. :func:`_fragments.treecosts`) which is balanced instead of the
+		number of comparisons.
 	:returns: a sequence of ``(start, end)`` intervals such that
 		the number of comparisons is approximately balanced."""
-	# could base on number of nodes as well.
 	if numproc == 1:
 		return [(0, numtrees)]
+	if costs is not None:
+		total = sum(costs[:numtrees])
+		chunk = total / (mult * numproc)
+		goal, togo = total - chunk, total
+		result = []
+		last = 0
+		for n in range(numtrees - 1):
+			togo -= costs[n]
+			if togo <= goal and len(result) < mult * numproc - 1:
+				goal -= chunk
+				result.append((last, n + 1))
+				last = n + 1
+		result.append((last, numtrees))
+		return result
 	# here chunk is the number of tree pairs that will be compared
 	goal = togo = total = 0.5 * numtrees * (numtrees - 1)
 	chunk = total // (mult * numproc) + 1
@@ -420,7 +1076,8 @@ def workload(numtrees, mult, numproc):
 
 
 def getfragments(trees, sents, numproc=1, disc=True,
-		iterate=False, complement=False, indices=True, cover=True):
+		iterate=False, complement=False, indices=True, cover=True,
+		checkpoint=None, memlimit=None):
 	"""Get recurring fragments with exact counts in a single treebank.
 
 	:returns: a dictionary whose keys are fragments as strings, and
@@ -431,19 +1088,26 @@ def getfragments(trees, sents, numproc=1, disc=True,
 	:param trees: a sequence of binarized Tree objects.
 	:param numproc: number of processes to use; pass 0 to use detected # CPUs.
 	:param disc: when disc=True, assume trees with discontinuous constituents.
-	:param iterate, complement: see :func:`_fragments.extractfragments`"""
+	:param iterate, complement: see :func:`_fragments.extractfragments`
+	:param checkpoint, memlimit: cf. :func:`regular`."""
 	if numproc == 0:
 		numproc = cpu_count()
 	numtrees = len(trees)
 	if not numtrees:
 		raise ValueError('no trees.')
-	mult = 1  # 3 if numproc > 1 else 1
-	fragments = {}
+	mult = WORKMULT
+	fragments = FragmentStore(memlimit) if memlimit else {}
 	trees = trees[:]
-	work = workload(numtrees, mult, numproc)
 	PARAMS.update(disc=disc, indices=indices, approx=False, complete=False,
 			complement=complement, debug=False, adjacent=False, twoterms=False)
 	initworkersimple(trees, list(sents), disc)
+	work = workload(numtrees, mult, numproc, treecosts(PARAMS['trees1']))
+	if checkpoint is not None:
+		key = hashlib.sha1()
+		for tree, sent in zip(trees, sents):
+			key.update(('%s\t%s\n' % (tree, sent)).encode('utf-8'))
+		work = initcheckpoint(checkpoint, [key.hexdigest(), disc, complement,
+				indices, cover], work)
 	if numproc == 1:
 		mymap = map
 		myapply = APPLY
@@ -456,54 +1120,69 @@ def getfragments(trees, sents, numproc=1, disc=True,
 				initargs=(trees, list(sents), disc))
 		mymap = pool.map
 		myapply = pool.apply
-	# collect recurring fragments
-	logging.info("extracting recurring fragments")
-	for a in mymap(worker, work):
-		fragments.update(a)
-	# add 'cover' fragments corresponding to single productions
-	if cover:
-		cover = myapply(coverfragworker, ())
-		before = len(fragments)
-		fragments.update(cover)
-		logging.info("merged %d unseen cover fragments", len(fragments) - before)
-	fragmentkeys = list(fragments)
-	bitsets = [fragments[a] for a in fragmentkeys]
+	merged = loadcheckpoint(checkpoint, 'merged')
+	if merged is not None:
+		fragmentkeys, bitsets = merged
+		fragments = dict(zip(fragmentkeys, bitsets))
+	else:
+		# collect recurring fragments
+		logging.info("extracting recurring fragments")
+		for a in mapcheckpointed(worker, work,
+				mymap if numproc == 1 else timedmap(pool), checkpoint,
+				'fragments'):
+			fragments.update(a)
+		# add 'cover' fragments corresponding to single productions
+		if cover and memlimit:
+			cover = myapply(coverfragworker, ())
+			fragments.update(cover)
+			logging.info("merged %d cover fragments", len(cover))
+		elif cover:
+			cover = myapply(coverfragworker, ())
+			before = len(fragments)
+			fragments.update(cover)
+			logging.info("merged %d unseen cover fragments",
+					len(fragments) - before)
+		fragmentkeys, bitsets = keysvalues(fragments)
+		if memlimit:
+			fragments = dict(zip(fragmentkeys, bitsets)) if iterate else None
+		if checkpoint is not None:
+			dumpcheckpoint((fragmentkeys, bitsets), checkpoint, 'merged')
 	countchunk = len(bitsets) // numproc + 1
 	work = list(range(0, len(bitsets), countchunk))
 	work = [(n, len(work), bitsets[a:a + countchunk])
 			for n, a in enumerate(work)]
 	logging.info("getting exact counts for %d fragments", len(bitsets))
 	counts = []
-	for a in mymap(exactcountworker, work):
+	for a in mapcheckpointed(exactcountworker, work, mymap, checkpoint,
+			'counts%d-' % countchunk):
 		counts.extend(a)
-	if numproc != 1:
-		pool.close()
-		pool.join()
-		del pool
 	if iterate:  # optionally collect fragments of fragments
 		logging.info("extracting fragments of recurring fragments")
-		PARAMS['complement'] = False  # needs to be turned off if it was on
+		# the pool is re-used; its processes read the trees of each
+		# iteration from this directory.
+		tmpdir = tempfile.mkdtemp() if numproc != 1 else None
 		newfrags = fragments
-		trees, sents = None, None
 		ids = count()
-		for _ in range(10):  # up to 10 iterations
+		for iteration in range(1, 11):  # up to 10 iterations
 			newtrees = [binarize(
 					introducepreterminals(Tree.parse(tree, parse_leaf=int),
 					ids=ids), childchar="}") for tree, _ in newfrags]
 			newsents = [["#%d" % next(ids) if word is None else word
 					for word in sent] for _, sent in newfrags]
-			newfrags, newcounts = iteratefragments(
-					fragments, newtrees, newsents, trees, sents, numproc)
+			newfrags, newcounts = iteratefragments(fragments, newtrees,
+					newsents, iteration, numproc,
+					None if numproc == 1 else pool, tmpdir)
 			if len(newfrags) == 0:
 				break
-			if trees is None:
-				trees = []
-				sents = []
-			trees.extend(newtrees)
-			sents.extend(newsents)
 			fragmentkeys.extend(newfrags)
 			counts.extend(newcounts)
 			fragments.update(zip(newfrags, newcounts))
+		if tmpdir is not None:
+			shutil.rmtree(tmpdir)
+	if numproc != 1:
+		pool.close()
+		pool.join()
+		del pool
 	logging.info("found %d fragments", len(fragmentkeys))
 	if not disc:
 		return {a.decode('utf-8'): b for a, b in zip(fragmentkeys, counts)}
@@ -511,21 +1190,35 @@ def getfragments(trees, sents, numproc=1, disc=True,
 			for (a, b), c in zip(fragmentkeys, counts)}
 
 
-def iteratefragments(fragments, newtrees, newsents, trees, sents, numproc):
-	"""Get fragments of fragments."""
+def iteratefragments(fragments, newtrees, newsents, iteration, numproc,
+		pool=None, tmpdir=None):
+	"""Get fragments of fragments.
+
+	The fragments of ``newtrees`` are extracted, as well as fragments
+	shared with the trees of earlier iterations.
+
+	:param iteration: the number of this iteration, starting from 1.
+	:param pool, tmpdir: when ``numproc > 1``, a pool of processes that is
+		re-used across iterations, and a directory through which the new
+		trees are passed to these processes."""
 	numtrees = len(newtrees)
 	if not numtrees:
 		raise ValueError('no trees.')
 	if numproc == 1:  # set fragments as input
-		initworkersimple(newtrees, newsents, PARAMS['disc'], trees, sents)
+		nextiteration(newtrees, newsents, iteration)
 		mymap = map
 	else:
-		# since the input trees change, we need a new pool each time
-		pool = Pool(processes=numproc, initializer=initworkersimple,
-				initargs=(newtrees, newsents, PARAMS['disc'], trees, sents))
-		mymap = pool.imap
+		filename = os.path.join(tmpdir, 'iteration%d.pickle' % iteration)
+		with open(filename, 'wb') as out:
+			pickle.dump((newtrees, newsents), out, protocol=-1)
+		# results in order, because the trees of the next iteration are
+		# numbered in order of the fragments
+		def mymap(func, work):
+			"""Apply func in a process with the trees of this iteration."""
+			return pool.imap(iterationworker,
+					[(tmpdir, iteration, func, a) for a in work])
 	newfragments = {}
-	for a in mymap(worker, workload(numtrees, 1, numproc)):
+	for a in mymap(worker, workload(numtrees, WORKMULT, numproc)):
 		newfragments.update(a)
 	logging.info("before: %d, after: %d, difference: %d",
 		len(fragments), len(set(fragments) | set(newfragments)),
@@ -544,13 +1237,58 @@ def iteratefragments(fragments, newtrees, newsents, trees, sents, numproc):
 	counts = []
 	for a in mymap(exactcountworker, work):
 		counts.extend(a)
-	if numproc != 1:
-		pool.close()
-		pool.join()
-		del pool
 	return newkeys, counts
 
 
+def nextiteration(newtrees, newsents, iteration):
+	"""Set up the trees for an iteration of ``iteratefragments()``.
+
+	``newtrees`` become ``trees1``, while the trees of the previous
+	iteration are added to ``trees2``. Only the new trees are converted;
+	the labels and productions are extended, so the node arrays of
+	earlier iterations remain valid."""
+	labels, prods = PARAMS['labels'], PARAMS['prods']
+	if iteration == 1:
+		PARAMS.update(trees2=None, sents2=None, prevtrees=None)
+	elif PARAMS['prevtrees']:
+		if PARAMS['trees2'] is None:
+			PARAMS['trees2'] = Ctrees()
+			PARAMS['trees2'].alloc(len(PARAMS['prevtrees']),
+					sum(map(len, PARAMS['prevtrees'])))
+			PARAMS['sents2'] = []
+		for tree in PARAMS['prevtrees']:
+			PARAMS['trees2'].add(tree, prods)
+		PARAMS['sents2'].extend(PARAMS['sents1'])
+	trees = [tolist(addprods(Tree.convert(a), b, PARAMS['disc']), b)
+			for a, b in zip(newtrees, newsents)]
+	getlabelsprods(trees, labels, prods)
+	for tree in trees:
+		root = tree[0]
+		tree.sort(key=partial(getprodid, prods))
+		for n, a in enumerate(tree):
+			a.idx = n
+		tree[0].rootidx = root.idx
+	# complement fragments are only extracted from the original trees
+	PARAMS.update(trees1=Ctrees(trees, prods), sents1=newsents,
+			prevtrees=trees, iteration=iteration, complement=False)
+	PARAMS['trees1'].indextrees(prods)
+	if PARAMS['trees2'] is not None:
+		PARAMS['trees2'].indextrees(prods)
+
+
+@workerfunc
+def iterationworker(args):
+	"""Apply a worker function in an iteration of ``iteratefragments()``.
+
+	First loads the trees of the iterations this process has not seen."""
+	tmpdir, iteration, func, arg = args
+	for n in range(PARAMS['iteration'] + 1, iteration + 1):
+		with open(os.path.join(tmpdir, 'iteration%d.pickle' % n), 'rb') as inp:
+			newtrees, newsents = pickle.load(inp)
+		nextiteration(newtrees, newsents, n)
+	return func(arg)
+
+
 def altrepr(a):
 	"""Rewrite bracketed tree to alternative format.
 
@@ -654,10 +1392,15 @@ def test():
 	main("fragments.py --disc alpinosample.export".split())
 
 
-__all__ = ['altrepr', 'batch', 'coverfragworker', 'debinarize',
-		'exactcountworker', 'getfragments', 'initworker', 'initworkersimple',
-		'iteratefragments', 'printfragments', 'read2ndtreebank',
-		'readtreebanks', 'regular', 'worker', 'workload']
+__all__ = ['FragmentStore', 'addindices', 'altrepr', 'batch',
+		'batchworker', 'cachefilename', 'checkpointworker', 'coverfragworker',
+		'debinarize', 'dumpcheckpoint', 'exactcountworker', 'getfragments',
+		'incremental', 'incrementalworker', 'initcheckpoint', 'initworker',
+		'initworkersimple', 'iteratefragments', 'iterationworker',
+		'keysvalues', 'loadcache', 'loadcheckpoint', 'mapcheckpointed',
+		'nextiteration', 'printfragments', 'readrun', 'read2ndtreebank',
+		'readtreebanks', 'regular', 'regularchunks', 'timedmap',
+		'timedworker', 'worker', 'workload']
 
 if __name__ == '__main__':
 	main()
@@ -9,7 +9,7 @@ import logging
 from operator import mul, itemgetter
 from collections import defaultdict, OrderedDict, Counter as multiset
 from itertools import count, islice, repeat
-from discodop.tree import Tree, ImmutableTree
+from discodop.tree import Tree, ImmutableTree, CompactTree
 from discodop.treebank import READERS
 if sys.version[0] >= '3':
 	from functools import reduce  # pylint: disable=W0622
@@ -75,7 +75,7 @@ def lcfrsproductions(tree, sent, frontiers=False):
 	corresponding words for these indices. Always produces monotone LCFRS
 	rules. For best results, tree should be canonicalized. When ``frontiers``
 	is ``True``, frontier nodes will generate empty productions, by default
-	they are ignored.
+	they are ignored. Tree may also be a ``CompactTree``.
 
 	>>> tree = Tree.parse("(S (VP_2 (V 0) (ADJ 2)) (NP 1))", parse_leaf=int)
 	>>> sent = "is Mary happy".split()
@@ -117,10 +117,9 @@ def lcfrsproductions(tree, sent, frontiers=False):
 			# 		"terminal; frontier nodes should dominate a sequence of "
 			# 		"indices that are None in the sentence.\n"
 			# 		"subtree: %s\nsent: %r" % (st, sent)))
-		elif all(isinstance(a, Tree) for a in st):  # isinstance(st[0], Tree):
+		elif all(isinstance(a, (Tree, CompactTree)) for a in st):
 			# convert leaves() to bitsets
-			childleaves = [a.leaves() if isinstance(a, Tree) else [a]
-					for a in st]
+			childleaves = [a.leaves() for a in st]
 			leaves = [(idx, n) for n, child in enumerate(childleaves)
 					for idx in child]
 			leaves.sort(key=itemgetter(0), reverse=True)
@@ -224,7 +223,8 @@ def dopreduction(trees, sents, packedgraph=False, decorater=None,
 
 
 def doubledop(trees, sents, debug=False, binarized=True,
-		complement=False, iterate=False, numproc=None, extrarules=None):
+		complement=False, iterate=False, numproc=None, extrarules=None,
+		memlimit=None):
 	"""Extract a Double-DOP grammar from a treebank.
 
 	That is, a fragment grammar containing fragments that occur at least twice,
@@ -237,7 +237,8 @@ def doubledop(trees, sents, debug=False, binarized=True,
 	uniquely identifying that terminal and tag: ``tag@word``.
 
 	:param binarized: Whether the resulting grammar should be binarized.
-	:param iterate, complement, numproc: cf. fragments.getfragments()
+	:param iterate, complement, numproc, memlimit: cf.
+		fragments.getfragments()
 	:returns: a tuple (grammar, altweights, backtransform)
 		altweights is a dictionary containing alternate weights."""
 	def getweight(frag, terminals):
@@ -260,7 +261,7 @@ def doubledop(trees, sents, debug=False, binarized=True,
 	backtransform = {}
 	ids = UniqueIDs()
 	fragments = getfragments(trees, sents, numproc,
-			iterate=iterate, complement=complement)
+			iterate=iterate, complement=complement, memlimit=memlimit)
 	# build index of the number of fragments extracted from a tree for ewe
 	fragmentcount = defaultdict(int)
 	for indices in fragments.values():
@@ -29,6 +29,7 @@ from discodop.grammar import defaultparse
 from discodop.containers import Grammar
 from discodop.coarsetofine import prunechart, whitelistfromposteriors
 from discodop.disambiguation import getderivations, marginalize, doprerank
+from discodop.kbest import lazykbest
 from discodop.tree import Tree
 from discodop.lexicon import replaceraretestwords, UNKNOWNWORDFUNC, UNK
 from discodop.treebank import WRITERS, writetree
@@ -95,6 +96,11 @@ DEFAULTSTAGE = dict(
 		iterate=False,  # for double dop, whether to add fragments of fragments
 		complement=False,  # for double dop, whether to include fragments which
 			# form the complement of the maximal recurring fragments extracted
+		adaptivek=None,  # choose k per sentence; options: None, 'length',
+			# 'entropy'; see adaptivek()
+		maxretries=0,  # if pruned stage fails, retry with relaxed k up to n times
+		relaxfactor=10,  # multiply no. of derivations by this factor on retry,
+			# or divide posterior threshold by it; k=0 is relaxed to no pruning
 		neverblockre=None,  # do not prune nodes with label that match regex
 		estimates=None,  # compute, store & use outside estimates
 		)
@@ -234,6 +240,9 @@ def doparsing(parser, infile, out, printprob, oneline, usetags, numparses,
 				initargs=(parser, printprob, usetags, numparses, fmt,
 					morphology))
 		mymap = pool.imap
+	# show each parse immediately when writing to a terminal; otherwise,
+	# let the output be buffered.
+	interactive = out.isatty()
 	for output, noparse, sec, msg in mymap(worker, enumerate(infile)):
 		if output:
 			print(msg, file=sys.stderr)
@@ -241,8 +250,9 @@ def doparsing(parser, infile, out, printprob, oneline, usetags, numparses,
 			if noparse:
 				unparsed += 1
 			times.append(sec)
-			sys.stderr.flush()
-			out.flush()
+			if interactive:
+				sys.stderr.flush()
+				out.flush()
 	print('average time per sentence', sum(times) / len(times),
 			'\nunparsed sentences:', unparsed,
 			'\nfinished',
@@ -413,69 +423,91 @@ class Parser(object):
 				exportbitpargrammar(stage)
 			if not stage.binarized and not stage.mode.startswith('pcfg-bitpar'):
 				raise ValueError('non-binarized grammar requires use of bitpar')
+			k, retries = stage.k, 0
 			if not stage.prune or chart:
-				if n != 0 and stage.prune and stage.mode != 'dop-rerank':
-					beginprune = time.clock()
-					if self.stages[n - 1].mode == 'pcfg-posterior':
-						whitelist, msg1 = whitelistfromposteriors(
-								inside, outside, start,
-								self.stages[n - 1].grammar, stage.grammar,
-								stage.k, stage.splitprune,
-								self.stages[n - 1].markorigin,
-								stage.mode.startswith('pcfg'))
+				coarsechart = chart
+				if n != 0 and stage.prune and stage.adaptivek:
+					k = adaptivek(stage, sent, coarsechart
+							if self.stages[n - 1].mode in ('pcfg', 'plcfrs')
+							else None)
+				while True:
+					if n != 0 and stage.prune and stage.mode != 'dop-rerank':
+						beginprune = time.clock()
+						if k is None:  # pruning has been relaxed completely
+							whitelist, msg1 = None, 'not pruned'
+						elif self.stages[n - 1].mode == 'pcfg-posterior':
+							whitelist, msg1 = whitelistfromposteriors(
+									inside, outside, start,
+									self.stages[n - 1].grammar, stage.grammar,
+									k, stage.splitprune,
+									self.stages[n - 1].markorigin,
+									stage.mode.startswith('pcfg'))
+						else:
+							whitelist, msg1 = prunechart(
+									coarsechart, stage.grammar, k,
+									stage.splitprune,
+									self.stages[n - 1].markorigin,
+									stage.mode.startswith('pcfg'),
+									self.stages[n - 1].mode
+										== 'pcfg-bitpar-nbest')
+						msg += '%s; %gs\n\t' % (
+								msg1, time.clock() - beginprune)
 					else:
-						whitelist, msg1 = prunechart(
-								chart, stage.grammar, stage.k,
-								stage.splitprune,
-								self.stages[n - 1].markorigin,
-								stage.mode.startswith('pcfg'),
-								self.stages[n - 1].mode == 'pcfg-bitpar-nbest')
-					msg += '%s; %gs\n\t' % (msg1, time.clock() - beginprune)
-				else:
-					whitelist = None
-				if stage.mode == 'pcfg':
-					chart, msg1 = pcfg.parse(
-							sent, stage.grammar, tags=tags,
-							whitelist=whitelist if stage.prune else None)
-				elif stage.mode == 'pcfg-posterior':
-					inside, outside, start, msg1 = pcfg.doinsideoutside(
-							sent, stage.grammar, tags=tags)
-					chart = start
-				elif stage.mode.startswith('pcfg-bitpar'):
-					if stage.mode == 'pcfg-bitpar-forest':
-						numderivs = 0
-					elif (n == len(self.stages) - 1
-							or not self.stages[n + 1].prune):
-						numderivs = stage.m
-					else:  # request 1000 nbest parses for CTF pruning
-						numderivs = 1000
-					chart, cputime, msg1 = pcfg.parse_bitpar(stage.grammar,
-							stage.rulesfile.name, stage.lexiconfile.name,
-							sent, numderivs,
-							stage.grammar.start,
-							stage.grammar.toid[stage.grammar.start], tags=tags)
-					begin -= cputime
-				elif stage.mode == 'plcfrs':
-					chart, msg1 = plcfrs.parse(
-							sent, stage.grammar, tags=tags,
-							exhaustive=stage.dop or (
-								n + 1 != len(self.stages)
-								and self.stages[n + 1].prune),
-							whitelist=whitelist,
-							splitprune=stage.splitprune
-								and self.stages[n - 1].split,
-							markorigin=self.stages[n - 1].markorigin,
-							estimates=(stage.estimates, stage.outside)
-								if stage.estimates in ('SX', 'SXlrgaps')
-								else None)
-				elif stage.mode == 'dop-rerank':
-					if chart:
-						parsetrees = doprerank(chart, sent, stage.k,
-								self.stages[n - 1].grammar, stage.grammar)
-						msg1 = 're-ranked %d parse trees. ' % len(parsetrees)
-				else:
-					raise ValueError('unknown mode specified.')
-				msg += '%s\n\t' % msg1
+						whitelist = None
+					if stage.mode == 'pcfg':
+						chart, msg1 = pcfg.parse(
+								sent, stage.grammar, tags=tags,
+								whitelist=whitelist if stage.prune else None)
+					elif stage.mode == 'pcfg-posterior':
+						inside, outside, start, msg1 = pcfg.doinsideoutside(
+								sent, stage.grammar, tags=tags)
+						chart = start
+					elif stage.mode.startswith('pcfg-bitpar'):
+						if stage.mode == 'pcfg-bitpar-forest':
+							numderivs = 0
+						elif (n == len(self.stages) - 1
+								or not self.stages[n + 1].prune):
+							numderivs = stage.m
+						else:  # request 1000 nbest parses for CTF pruning
+							numderivs = 1000
+						chart, cputime, msg1 = pcfg.parse_bitpar(
+								stage.grammar, stage.rulesfile.name,
+								stage.lexiconfile.name, sent, numderivs,
+								stage.grammar.start,
+								stage.grammar.toid[stage.grammar.start],
+								tags=tags, worker=None if tags
+									else getbitparworker(stage, numderivs))
+						begin -= cputime
+					elif stage.mode == 'plcfrs':
+						chart, msg1 = plcfrs.parse(
+								sent, stage.grammar, tags=tags,
+								exhaustive=stage.dop or (
+									n + 1 != len(self.stages)
+									and self.stages[n + 1].prune),
+								whitelist=whitelist,
+								splitprune=stage.splitprune
+									and self.stages[n - 1].split,
+								markorigin=self.stages[n - 1].markorigin,
+								estimates=(stage.estimates, stage.outside)
+									if stage.estimates in ('SX', 'SXlrgaps')
+									else None)
+					elif stage.mode == 'dop-rerank':
+						if chart:
+							parsetrees = doprerank(chart, sent, stage.k,
+									self.stages[n - 1].grammar, stage.grammar)
+							msg1 = 're-ranked %d parse trees. ' % len(
+									parsetrees)
+					else:
+						raise ValueError('unknown mode specified.')
+					msg += '%s\n\t' % msg1
+					# if pruning was too aggressive, relax it and try again
+					if (chart or n == 0 or not stage.prune or k is None
+							or retries >= stage.maxretries
+							or stage.mode not in ('pcfg', 'plcfrs')):
+						break
+					retries += 1
+					k = relaxk(k, stage.relaxfactor)
+					msg += 'retry %d with k=%s\n\t' % (retries, k)
 				if (n != 0 and not chart and not noparse
 						and stage.split == self.stages[n - 1].split):
 					logging.error('ERROR: expected successful parse. '
@@ -557,7 +589,8 @@ class Parser(object):
 			msg += '%.2fs cpu time elapsed\n' % (elapsedtime)
 			yield DictObj(name=stage.name, parsetree=parsetree, prob=prob,
 					parsetrees=parsetrees, fragments=fragments,
-					noparse=noparse, elapsedtime=elapsedtime, msg=msg)
+					noparse=noparse, elapsedtime=elapsedtime, msg=msg,
+					k=k, retries=retries)
 
 	def postprocess(self, treestr, stage=-1):
 		"""Take parse tree and apply postprocessing."""
@@ -590,6 +623,59 @@ class Parser(object):
 		return parsetree, prob, noparse
 
 
+def adaptivek(stage, sent, chart=None):
+	"""Choose the pruning parameter ``k`` for a sentence.
+
+	Depending on ``stage.adaptivek``:
+
+	:``'length'``: ``stage.k`` is interpreted per word; i.e., a number of
+		derivations is multiplied, and a posterior threshold divided, by the
+		length of the sentence.
+	:``'entropy'``: ``stage.k`` is multiplied by the perplexity ``2 ** H`` of
+		the distribution over the ``k``-best derivations in the coarse
+		``chart``; i.e., prune less when the coarse stage is uncertain.
+		Only applies to pruning with *k*-best derivations.
+
+	>>> stage = DictObj(k=10, adaptivek='length')
+	>>> adaptivek(stage, 'The cat saw the dog .'.split())
+	60"""
+	k = stage.k
+	if stage.adaptivek == 'length':
+		if 0 < k < 1:
+			return k / len(sent)
+		return int(k * len(sent))
+	elif stage.adaptivek == 'entropy':
+		if k < 1 or chart is None:
+			return k
+		_ = lazykbest(chart, k, derivs=False)
+		probs = [exp(-entry.value)
+				for entry in chart.rankededges[chart.root()][:k]]
+		total = sum(probs)
+		if not total:
+			return k
+		entropy = -sum(p / total * log(p / total, 2) for p in probs if p)
+		return int(round(k * 2 ** entropy))
+	elif stage.adaptivek is not None:
+		raise ValueError('unrecognized adaptivek option: %r' % stage.adaptivek)
+	return k
+
+
+def relaxk(k, factor):
+	"""Relax the pruning parameter ``k`` after pruning prevented a parse.
+
+	A number of derivations is multiplied by ``factor``, a posterior threshold
+	is divided by it. When ``k=0`` (filter only), the result is ``None``,
+	which means that the stage will not be pruned at all.
+
+	>>> relaxk(50, 10), relaxk(0.5, 10), relaxk(0, 10)
+	(500, 0.05, None)"""
+	if k == 0:
+		return None
+	elif 0 < k < 1:
+		return k / factor
+	return int(k * factor)
+
+
 def readgrammars(resultdir, stages, postagging=None, top='ROOT'):
 	"""Read the grammars from a previous experiment.
 
@@ -673,6 +759,9 @@ def readgrammars(resultdir, stages, postagging=None, top='ROOT'):
 
 def exportbitpargrammar(stage):
 	"""(re-)export bitpar grammar with current weights."""
+	if getattr(stage, 'bitparworker', None) is not None:
+		stage.bitparworker.close()
+		stage.bitparworker = None
 	if not hasattr(stage, 'rulesfile'):
 		stage.rulesfile = tempfile.NamedTemporaryFile()
 		stage.lexiconfile = tempfile.NamedTemporaryFile()
@@ -705,6 +794,22 @@ def exportbitpargrammar(stage):
 	stage.lexiconfile.flush()
 
 
+def getbitparworker(stage, numderivs):
+	"""Return a persistent bitpar process with the grammar of this stage.
+
+	The process is started on first use in each (worker) process, and
+	restarted when the grammar is re-exported."""
+	worker = getattr(stage, 'bitparworker', None)
+	if (worker is None or worker.n != numderivs
+			or not worker.alive()):
+		if worker is not None and worker.pid == os.getpid():
+			worker.close()
+		worker = stage.bitparworker = pcfg.BitParWorker(
+				stage.rulesfile.name, stage.lexiconfile.name, numderivs,
+				stage.grammar.start)
+	return worker
+
+
 def probstr(prob):
 	"""Render probability / number of subtrees as string."""
 	if isinstance(prob, tuple):
@@ -721,8 +826,8 @@ def which(program):
 
 
 __all__ = ['DictObj', 'Parser', 'doparsing', 'exportbitpargrammar',
-		'initworker', 'probstr', 'readgrammars', 'readinputbitparstyle',
-		'which', 'worker', 'workerfunc']
+		'getbitparworker', 'initworker', 'probstr', 'readgrammars',
+		'readinputbitparstyle', 'which', 'worker', 'workerfunc']
 
 if __name__ == '__main__':
 	main()
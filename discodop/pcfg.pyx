@@ -1,8 +1,10 @@
 """CKY parser for Probabilistic Context-Free Grammar (PCFG)."""
 from __future__ import print_function
-from os import unlink
+import os
 import re
+import time
 import subprocess
+from os import unlink
 from math import exp, log as pylog
 from itertools import count
 from collections import defaultdict
@@ -220,19 +222,23 @@ cdef class SparseCFGChart(CFGChart):
 		return item in self.parseforest
 
 
-def parse(sent, Grammar grammar, tags=None, start=None, dict whitelist=None):
+def parse(sent, Grammar grammar, tags=None, start=None, whitelist=None):
 	"""A CKY parser modeled after Bodenstab's 'fast grammar loop'.
 
 	If ``whitelist`` is given, the loop is filtered by the allowed items.
-	The whitelist is of the form: whitelist = {cell: {label: None}};
-	cell is a represenattion of a span as used by the CFGChart, label is an
-	integer for a non-terminal label; the value of the inner dict is not used.
-	The presence of a label means the span with that label will not be pruned.
+	The whitelist is a 2D array of ``uint64`` with a bitset over coarse labels
+	for each cell; i.e., ``whitelist[compactcellidx(start, end, lensent, 1)]``;
+	a fine label ``label`` is allowed in a cell if the bit for its coarse
+	label ``grammar.mapping[label]`` is set; bit 0 is set for all cells, so
+	that labels which are never pruned (mapped to 0) are always allowed.
+	Requires the mapping established by ``grammar.getmapping()``.
 	"""
 	if grammar.maxfanout != 1:
 		raise ValueError('Not a PCFG! fanout: %d' % grammar.maxfanout)
 	if not grammar.logprob:
 		raise ValueError('Expected grammar with log probabilities.')
+	if whitelist is not None and grammar.mapping is NULL:
+		raise ValueError('need to call grammar.getmapping(coarse, ...).')
 	if grammar.nonterminals < 20000:
 		chart = DenseCFGChart(grammar, sent, start)
 		return parse_main(sent, <DenseCFGChart>chart, grammar, tags=tags,
@@ -244,11 +250,14 @@ def parse(sent, Grammar grammar, tags=None, start=None, dict whitelist=None):
 
 
 cdef parse_main(sent, CFGChart_fused chart, Grammar grammar, tags=None,
-		start=None, dict whitelist=None):
+		start=None, whitelist=None):
 	cdef:
 		short [:, :] minleft, maxleft, minright, maxright
+		uint64_t [:, ::1] cfgwhitelist
 		DoubleAgenda unaryagenda = DoubleAgenda()
-		dict cellwhitelist = None
+		uint64_t *wl = NULL  # start of whitelist array, if any
+		uint64_t *cellwhitelist = NULL
+		size_t slots = 0
 		Rule *rule
 		short left, right, mid, span, lensent = len(sent)
 		short narrowl, narrowr, widel, wider, minmid, maxmid
@@ -257,8 +266,12 @@ cdef parse_main(sent, CFGChart_fused chart, Grammar grammar, tags=None,
 		size_t cell
 	minleft, maxleft, minright, maxright = minmaxmatrices(
 			grammar.nonterminals, lensent)
+	if whitelist is not None:
+		cfgwhitelist = whitelist
+		wl = &(cfgwhitelist[0, 0])
+		slots = cfgwhitelist.shape[1]
 	# assign POS tags
-	covered, msg = populatepos(grammar, chart, sent, tags, whitelist,
+	covered, msg = populatepos(grammar, chart, sent, tags, wl, slots,
 			minleft, maxleft, minright, maxright)
 	if not covered:
 		return chart, msg
@@ -268,15 +281,14 @@ cdef parse_main(sent, CFGChart_fused chart, Grammar grammar, tags=None,
 		for left in range(lensent - span + 1):
 			right = left + span
 			cell = cellidx(left, right, lensent, grammar.nonterminals)
-			if whitelist is not None:
-				cellwhitelist = <dict>whitelist.get(cell)
+			if wl is not NULL:
+				cellwhitelist = &(wl[
+						compactcellidx(left, right, lensent, slots)])
 			# apply binary rules
-			# FIXME: if whitelist is given, loop only over whitelisted labels
-			# for cell
-			# for lhs in cellwhitelist:
 			# only loop over labels which occur on LHS of a phrasal rule.
 			for lhs in range(1, grammar.phrasalnonterminals):
-				if cellwhitelist is not None and lhs not in cellwhitelist:
+				if (cellwhitelist is not NULL
+						and not TESTBIT(cellwhitelist, grammar.mapping[lhs])):
 					continue
 				n = 0
 				rule = &(grammar.bylhs[lhs][n])
@@ -335,8 +347,8 @@ cdef parse_main(sent, CFGChart_fused chart, Grammar grammar, tags=None,
 					if rule.rhs1 != rhs1:
 						break
 					elif TESTBIT(grammar.mask, rule.no) or (
-							cellwhitelist is not None
-							and rule.lhs not in cellwhitelist):
+							cellwhitelist is not NULL and not TESTBIT(
+								cellwhitelist, grammar.mapping[rule.lhs])):
 						continue
 					lhs = rule.lhs
 					prob = rule.prob + chart._subtreeprob(cell + rhs1)
@@ -369,7 +381,8 @@ def parse_symbolic(sent, Grammar grammar, tags=None, start=None):
 	return parse(sent, grammar, tags=tags, start=start, whitelist=None)
 
 
-cdef populatepos(Grammar grammar, CFGChart_fused chart, sent, tags, whitelist,
+cdef populatepos(Grammar grammar, CFGChart_fused chart, sent, tags,
+		uint64_t *whitelist, size_t slots,
 		short [:, :] minleft, short [:, :] maxleft,
 		short [:, :] minright, short [:, :] maxright):
 	"""Apply all possible lexical and unary rules on each lexical span.
@@ -380,16 +393,19 @@ cdef populatepos(Grammar grammar, CFGChart_fused chart, sent, tags, whitelist,
 		DoubleAgenda unaryagenda = DoubleAgenda()
 		Rule *rule
 		LexicalRule lexrule
+		uint64_t *cellwhitelist = NULL
 		uint32_t n, lhs, rhs1
 		short left, right, lensent = len(sent)
 	for left, word in enumerate(sent):
 		tag = tags[left].encode('ascii') if tags else None
 		right = left + 1
-		cell = cellidx(left, right, lensent, grammar.nonterminals)
+		if whitelist is not NULL:
+			cellwhitelist = &(whitelist[
+					compactcellidx(left, right, lensent, slots)])
 		recognized = False
 		for lexrule in grammar.lexicalbyword.get(word, ()):
-			assert whitelist is None or cell in whitelist, whitelist.keys()
-			if whitelist is not None and lexrule.lhs not in whitelist[cell]:
+			if (cellwhitelist is not NULL
+					and not TESTBIT(cellwhitelist, grammar.mapping[lexrule.lhs])):
 				continue
 			lhs = lexrule.lhs
 			# if we are given gold tags, make sure we only allow matching
@@ -441,8 +457,8 @@ cdef populatepos(Grammar grammar, CFGChart_fused chart, sent, tags, whitelist,
 				if rule.rhs1 != rhs1:
 					break
 				elif TESTBIT(grammar.mask, rule.no) or (
-						whitelist is not None
-						and rule.lhs not in whitelist[cell]):
+						cellwhitelist is not NULL and not TESTBIT(
+							cellwhitelist, grammar.mapping[rule.lhs])):
 					continue
 				lhs = rule.lhs
 				item = cellidx(left, right, lensent, grammar.nonterminals) + lhs
@@ -469,35 +485,45 @@ cdef populatepos(Grammar grammar, CFGChart_fused chart, sent, tags, whitelist,
 
 def doinsideoutside(sent, Grammar grammar, inside=None, outside=None,
 		tags=None, startid=None):
+	"""Compute inside and outside probabilities for a sentence.
+
+	The probabilities are stored in matrices with one row per span, indexed
+	by ``compactcellidx(left, right, len(sent), 1)``, and one column per
+	label; i.e., only the upper triangle of the chart is allocated. The
+	outside pass only visits spans that are reachable from the root.
+
+	:returns: ``(inside, outside, start, msg)``; ``start`` is a tuple
+		``(label, 0, len(sent))`` for the root item, or ``None`` when there
+		is no parse."""
+	cdef short lensent = len(sent)
+	cdef size_t numcells = compactcellidx(lensent - 1, lensent, lensent, 1) + 1
 	if grammar.maxfanout != 1:
-		raise('Not a PCFG! fanout = %d' % grammar.maxfanout)
+		raise ValueError('Not a PCFG! fanout = %d' % grammar.maxfanout)
 	if grammar.logprob:
-		raise('Grammar must not have log probabilities.')
-	lensent = len(sent)
+		raise ValueError('Grammar must not have log probabilities.')
 	if startid is None:
 		startid = grammar.toid[grammar.start]
 	if inside is None:
-		inside = np.zeros((lensent, lensent + 1,
-				grammar.nonterminals), dtype='d')
+		inside = np.zeros((numcells, grammar.nonterminals), dtype='d')
 	else:
-		inside[:len(sent), :len(sent) + 1, :] = 0.0
+		inside[:numcells, :] = 0.0
 	if outside is None:
-		outside = np.zeros((lensent, lensent + 1,
-				grammar.nonterminals), dtype='d')
+		outside = np.zeros((numcells, grammar.nonterminals), dtype='d')
 	else:
-		outside[:len(sent), :len(sent) + 1, :] = 0.0
+		outside[:numcells, :] = 0.0
 	minmaxlr = insidescores(sent, grammar, inside, tags)
-	if inside[0, len(sent), startid]:
+	sentprob = inside[compactcellidx(0, lensent, lensent, 1), startid]
+	if sentprob:
 		outsidescores(grammar, sent, startid, inside, outside, *minmaxlr)
-		msg = 'inside prob=%g' % inside[0, len(sent), startid]
-		start = (startid, 0, len(sent))
+		msg = 'inside prob=%g' % sentprob
+		start = (startid, 0, lensent)
 	else:
 		start = None
 		msg = "no parse"
 	return inside, outside, start, msg
 
 
-def insidescores(sent, Grammar grammar, double [:, :, :] inside, tags=None):
+def insidescores(sent, Grammar grammar, double [:, :] inside, tags=None):
 	"""Compute inside scores.
 
 	NB: These are not Viterbi scores, but sums of all derivations headed by a
@@ -507,6 +533,7 @@ def insidescores(sent, Grammar grammar, double [:, :, :] inside, tags=None):
 		short narrowl, narrowr, minmid, maxmid
 		double prob, ls, rs
 		uint32_t n, lhs, rhs1
+		size_t idx
 		bint foundbetter = False
 		Rule *rule
 		LexicalRule lexrule
@@ -519,26 +546,27 @@ def insidescores(sent, Grammar grammar, double [:, :, :] inside, tags=None):
 	for left in range(lensent):  # assign POS tags
 		tag = tags[left].encode('ascii') if tags else None
 		right = left + 1
+		idx = compactcellidx(left, right, lensent, 1)
 		for lexrule in grammar.lexicalbyword.get(sent[left], []):
 			lhs = lexrule.lhs
 			# if we are given gold tags, make sure we only allow matching
 			# tags - after removing addresses introduced by the DOP reduction
 			if not tags or (grammar.tolabel[lhs] == tag
 					or grammar.tolabel[lhs].startswith(tag + b'@')):
-				inside[left, right, lhs] = lexrule.prob
-		if not inside.base[left, right].any():
+				inside[idx, lhs] = lexrule.prob
+		if not inside.base[idx].any():
 			if tags is not None:
 				lhs = grammar.toid[tag]
 				if not tags or (grammar.tolabel[lhs] == tag
 						or grammar.tolabel[lhs].startswith(tag + b'@')):
-					inside[left, right, lhs] = 1.
+					inside[idx, lhs] = 1.
 			else:
 				raise ValueError("not covered: %r" % (tag or sent[left]), )
 		# unary rules on POS tags (NB: agenda is a min-heap, negate probs)
 		unaryagenda.update_entries([new_DoubleEntry(
-				rhs1, -inside[left, right, rhs1], 0)
+				rhs1, -inside[idx, rhs1], 0)
 			for rhs1 in range(grammar.nonterminals)
-			if inside[left, right, rhs1]
+			if inside[idx, rhs1]
 			and grammar.unary[rhs1].rhs1 == rhs1])
 		unaryscores[:] = 0.0
 		while unaryagenda.length:
@@ -547,17 +575,17 @@ def insidescores(sent, Grammar grammar, double [:, :, :] inside, tags=None):
 				rule = &(grammar.unary[rhs1][n])
 				if rule.rhs1 != rhs1:
 					break
-				prob = rule.prob * inside[left, right, rhs1]
+				prob = rule.prob * inside[idx, rhs1]
 				lhs = rule.lhs
 				edge = (rule.no, right)
 				if edge not in cell[lhs]:
 					unaryagenda.setifbetter(lhs, -prob)
-					inside[left, right, lhs] += prob
+					inside[idx, lhs] += prob
 					cell[lhs][edge] = edge
 		for a in cell:
 			a.clear()
 		for lhs in range(grammar.nonterminals):
-			if inside[left, right, lhs]:
+			if inside[idx, lhs]:
 				# update filter
 				if left > minleft[lhs, right]:
 					minleft[lhs, right] = left
@@ -571,6 +599,7 @@ def insidescores(sent, Grammar grammar, double [:, :, :] inside, tags=None):
 		# constituents from left to right
 		for left in range(lensent - span + 1):
 			right = left + span
+			idx = compactcellidx(left, right, lensent, 1)
 			# binary rules
 			for n in range(grammar.numrules):
 				rule = &(grammar.bylhs[0][n])
@@ -587,19 +616,21 @@ def insidescores(sent, Grammar grammar, double [:, :, :] inside, tags=None):
 				minmid = narrowr if narrowr > widel else widel
 				wider = maxright[rule.rhs1, left]
 				maxmid = wider if wider < narrowl else narrowl
-				# oldscore = inside[left, right, lhs]
+				# oldscore = inside[idx, lhs]
 				foundbetter = False
 				for split in range(minmid, maxmid + 1):
-					ls = inside[left, split, rule.rhs1]
+					ls = inside[compactcellidx(left, split, lensent, 1),
+							rule.rhs1]
 					if ls == 0.0:
 						continue
-					rs = inside[split, right, rule.rhs2]
+					rs = inside[compactcellidx(split, right, lensent, 1),
+							rule.rhs2]
 					if rs == 0.0:
 						continue
 					foundbetter = True
-					inside[left, right, lhs] += rule.prob * ls * rs
-					# assert 0.0 < inside[left, right, lhs] <= 1.0, (
-					# 	inside[left, right, lhs],
+					inside[idx, lhs] += rule.prob * ls * rs
+					# assert 0.0 < inside[idx, lhs] <= 1.0, (
+					# 	inside[idx, lhs],
 					# 	left, right, grammar.tolabel[lhs])
 				if foundbetter:  # and oldscore == 0.0:
 					if left > minleft[lhs, right]:
@@ -612,9 +643,9 @@ def insidescores(sent, Grammar grammar, double [:, :, :] inside, tags=None):
 						maxright[lhs, left] = right
 			# unary rules on this span
 			unaryagenda.update_entries([new_DoubleEntry(
-						rhs1, -inside[left, right, rhs1], 0)
+						rhs1, -inside[idx, rhs1], 0)
 					for rhs1 in range(grammar.nonterminals)
-					if inside[left, right, rhs1]
+					if inside[idx, rhs1]
 					and grammar.unary[rhs1].rhs1 == rhs1])
 			unaryscores[:] = 0.0
 			while unaryagenda.length:
@@ -623,18 +654,18 @@ def insidescores(sent, Grammar grammar, double [:, :, :] inside, tags=None):
 					rule = &(grammar.unary[rhs1][n])
 					if rule.rhs1 != rhs1:
 						break
-					prob = rule.prob * inside[left, right, rhs1]
+					prob = rule.prob * inside[idx, rhs1]
 					lhs = rule.lhs
 					edge = (rule.no, right)
 					if edge not in cell[lhs]:
 						unaryagenda.setifbetter(lhs, -prob)
-						inside[left, right, lhs] += prob
+						inside[idx, lhs] += prob
 						cell[lhs][edge] = edge
 			for a in cell:
 				a.clear()
 			for lhs in range(grammar.nonterminals):
 				# update filter
-				if inside[left, right, lhs]:
+				if inside[idx, lhs]:
 					if left > minleft[lhs, right]:
 						minleft[lhs, right] = left
 					if left < maxleft[lhs, right]:
@@ -647,26 +678,33 @@ def insidescores(sent, Grammar grammar, double [:, :, :] inside, tags=None):
 
 
 def outsidescores(Grammar grammar, sent, uint32_t start,
-		double [:, :, :] inside, double [:, :, :] outside,
+		double [:, :] inside, double [:, :] outside,
 		short [:, :] minleft, short [:, :] maxleft,
 		short [:, :] minright, short [:, :] maxright):
+	"""Compute outside scores.
+
+	Spans with zero outside probability for all labels are skipped."""
 	cdef:
 		short left, right, span, lensent = len(sent)
 		short narrowl, narrowr, minmid, maxmid
 		double ls, rs, os
 		uint32_t n, lhs
+		size_t idx, lidx, ridx
 		Rule *rule
 		DoubleAgenda unaryagenda = DoubleAgenda()
 		list cell = [{} for _ in grammar.toid]
-	outside[0, lensent, start] = 1.0
+	outside[compactcellidx(0, lensent, lensent, 1), start] = 1.0
 	for span in range(lensent, 0, -1):
 		for left in range(1 + lensent - span):
 			right = left + span
+			idx = compactcellidx(left, right, lensent, 1)
 			# unary rules
 			unaryagenda.update_entries([new_DoubleEntry(
-					lhs, -outside[left, right, lhs], 0)
+					lhs, -outside[idx, lhs], 0)
 				for lhs in range(grammar.nonterminals)
-				if outside[left, right, lhs]])
+				if outside[idx, lhs]])
+			if not unaryagenda.length:  # span not reachable from root
+				continue
 			while unaryagenda.length:
 				lhs = unaryagenda.popentry().key
 				for n in range(grammar.numrules):
@@ -675,17 +713,17 @@ def outsidescores(Grammar grammar, sent, uint32_t start,
 						break
 					elif rule.rhs2:
 						continue
-					prob = rule.prob * outside[left, right, lhs]
+					prob = rule.prob * outside[idx, lhs]
 					edge = (rule.no, right)
 					if edge not in cell[lhs]:
 						unaryagenda.setifbetter(rule.rhs1, -prob)
 						cell[lhs][edge] = edge
-						outside[left, right, rule.rhs1] += prob
-						# assert 0.0 < outside[left, right, rule.rhs1] <= 1.0, (
+						outside[idx, rule.rhs1] += prob
+						# assert 0.0 < outside[idx, rule.rhs1] <= 1.0, (
 						# 		'illegal value: outside[%d, %d, %s] = %g' % (
 						# 			left, right, grammar.tolabel[rule.rhs1],
-						# 			outside[left, right, rule.rhs1]),
-						# 		rule.prob, outside[left, right, lhs],
+						# 			outside[idx, rule.rhs1]),
+						# 		rule.prob, outside[idx, lhs],
 						# 		grammar.tolabel[rule.lhs])
 			for lhs in range(grammar.nonterminals):
 				cell[lhs].clear()
@@ -695,9 +733,9 @@ def outsidescores(Grammar grammar, sent, uint32_t start,
 				lhs = rule.lhs
 				if lhs == grammar.nonterminals:
 					break
-				elif not rule.rhs2 or outside[left, right, lhs] == 0.0:
+				elif not rule.rhs2 or outside[idx, lhs] == 0.0:
 					continue
-				os = outside[left, right, lhs]
+				os = outside[idx, lhs]
 				narrowr = minright[rule.rhs1, left]
 				narrowl = minleft[rule.rhs2, right]
 				if narrowr >= right or narrowl < narrowr:
@@ -707,23 +745,25 @@ def outsidescores(Grammar grammar, sent, uint32_t start,
 				wider = maxright[rule.rhs1, left]
 				maxmid = wider if wider < narrowl else narrowl
 				for split in range(minmid, maxmid + 1):
-					ls = inside[left, split, rule.rhs1]
+					lidx = compactcellidx(left, split, lensent, 1)
+					ls = inside[lidx, rule.rhs1]
 					if ls == 0.0:
 						continue
-					rs = inside[split, right, rule.rhs2]
+					ridx = compactcellidx(split, right, lensent, 1)
+					rs = inside[ridx, rule.rhs2]
 					if rs == 0.0:
 						continue
-					outside[left, split, rule.rhs1] += rule.prob * rs * os
-					outside[split, right, rule.rhs2] += rule.prob * ls * os
-					# assert 0.0 < outside[left, split, rule.rhs1] <= 1.0, (
+					outside[lidx, rule.rhs1] += rule.prob * rs * os
+					outside[ridx, rule.rhs2] += rule.prob * ls * os
+					# assert 0.0 < outside[lidx, rule.rhs1] <= 1.0, (
 					# 		'illegal value: outside[%d, %d, %s] = %g' % (
 					# 			left, split, grammar.tolabel[rule.rhs1],
-					# 			outside[left, split, rule.rhs1]),
+					# 			outside[lidx, rule.rhs1]),
 					# 		rule.prob, rs, os, grammar.tolabel[rule.lhs])
-					# assert 0.0 < outside[split, right, rule.rhs2] <= 1.0, (
+					# assert 0.0 < outside[ridx, rule.rhs2] <= 1.0, (
 					# 		'illegal value: outside[%d, %d, %s] = %g' % (
 					# 			split, right, grammar.tolabel[rule.rhs2],
-					# 			outside[split, right, rule.rhs2]))
+					# 			outside[ridx, rule.rhs2]))
 
 
 def minmaxmatrices(nonterminals, lensent):
@@ -747,12 +787,112 @@ CPUTIME = re.compile('^raw cpu time (.+)$', re.MULTILINE)
 LOG10 = pylog(10)
 
 
+class BitParWorker(object):
+	"""A persistent bitpar process which parses one sentence at a time.
+
+	The grammar is loaded once when the process is started; sentences are
+	written to its standard input. Since the output for a sentence is not
+	terminated in the same way for parses, n-best lists, and failed parses,
+	each sentence is followed by a sentinel sentence that can not be parsed;
+	the output for the sentence is read up to the line that reports the
+	sentinel. Messages on standard error are collected in a temporary file,
+	so that the process can not block on them.
+
+	:param n: the number of derivations to return; if n == 0, return parse
+		forests instead of n-best lists.
+	:param executable: path of the bitpar executable; by default it is
+		looked up in the search path.
+	:param timeout: if bitpar produces no output for this number of seconds,
+		the process is killed and ``parse()`` raises an error; None to wait
+		indefinitely."""
+
+	sentinel = b'__SENTINEL__'
+
+	def __init__(self, rulesfile, lexiconfile, n, startlabel,
+			executable=None, timeout=300):
+		import tempfile
+		from discodop.parser import which
+		self.n = n
+		self.pid = os.getpid()
+		self.timeout = timeout
+		self.buf = b''
+		args = ['-y'] if n == 0 else ['-b', str(n)]
+		# pass empty 'unkwown word file' to disable bitpar's smoothing
+		args += ['-s', startlabel, '-vp', '-u', '/dev/null',
+				rulesfile, lexiconfile]
+		cmd = [executable or which('bitpar')] + args
+		try:  # bitpar does not flush its output after each sentence
+			cmd = [which('stdbuf'), '-oL'] + cmd
+		except ValueError:
+			pass
+		self.stderr = tempfile.TemporaryFile()
+		self.proc = subprocess.Popen(cmd, shell=False,
+				stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+				stderr=self.stderr)
+
+	def parse(self, tokens):
+		"""Parse a sentence given as a list of (byte string) tokens.
+
+		:returns: a tuple ``(results, msg, cputime)`` with the raw output of
+			bitpar for this sentence, and its messages on standard error
+			(which may include messages about the sentinel)."""
+		import select
+		begin = time.time()
+		self.proc.stdin.write(b'\n'.join(tokens) + b'\n\n'
+				+ self.sentinel + b'\n\n')
+		self.proc.stdin.flush()
+		fd = self.proc.stdout.fileno()
+		idx = end = -1
+		while end == -1:  # read up to the end of the line with the sentinel
+			if self.timeout is not None and not select.select(
+					[fd], [], [], self.timeout)[0]:
+				self.proc.kill()
+				raise ValueError('no output from bitpar in %gs.'
+						% self.timeout)
+			data = os.read(fd, 65536)
+			if not data:
+				raise ValueError('bitpar exited unexpectedly.')
+			self.buf += data
+			if idx == -1:
+				idx = self.buf.find(self.sentinel)
+			if idx != -1:
+				end = self.buf.find(b'\n', idx)
+		# blank lines that terminate the output of the sentinel are skipped
+		# when reading the output of the next sentence.
+		result = self.buf[:self.buf.rfind(b'\n', 0, idx) + 1].lstrip(b'\n')
+		self.buf = self.buf[end + 1:]
+		self.stderr.seek(0)
+		msg = self.stderr.read().replace(
+				b'Warning: Word class 0 did not occur!\n', b'').decode('utf8')
+		self.stderr.seek(0)
+		self.stderr.truncate()
+		match = CPUTIME.search(msg)
+		cputime = float(match.group(1)) if match else time.time() - begin
+		return result, msg.strip(), cputime
+
+	def alive(self):
+		"""Test whether this process can be used by the current process."""
+		return self.pid == os.getpid() and self.proc.poll() is None
+
+	def close(self):
+		"""Terminate bitpar process."""
+		if self.alive():
+			self.proc.stdin.close()
+			self.proc.wait()
+		self.stderr.close()
+
+
 def parse_bitpar(grammar, rulesfile, lexiconfile, sent, n,
-		startlabel, startid, tags=None):
+		startlabel, startid, tags=None, worker=None):
 	"""Parse a sentence with bitpar, given filenames of rules and lexicon.
 
 	:param n: the number of derivations to return (max 1000); if n == 0, return
 		parse forest instead of n-best list (requires binarized grammar).
+	:param worker: if given, a ``BitParWorker`` for the same grammar and
+		``n`` to which the sentence is sent, instead of starting a new bitpar
+		process; not used when tags are given, since these require a
+		different lexicon for each sentence. If the worker fails, it is
+		closed and a new process is started for this sentence.
 	:returns: a dictionary of derivations with their probabilities."""
 	from discodop.parser import which
 	if n < 1 or n > 1000:
@@ -779,17 +919,26 @@ def parse_bitpar(grammar, rulesfile, lexiconfile, sent, n,
 			for word in sent]
 	if tags:
 		tokens = ['%s@%s' % (tag, token) for tag, token in zip(tags, tokens)]
-	# pass empty 'unkwown word file' to disable bitpar's smoothing
-	args = ['-y'] if n == 0 else ['-b', str(n)]
-	args += ['-s', startlabel, '-vp', '-u', '/dev/null', rulesfile, lexiconfile]
-	proc = subprocess.Popen([which('bitpar')] + args,
-			shell=False, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-			stderr=subprocess.PIPE)
-	results, msg = proc.communicate('\n'.join(tokens) + '\n')
-	msg = msg.replace('Warning: Word class 0 did not occur!\n',
-			'').decode('utf8').strip()
-	match = CPUTIME.search(msg)
-	cputime = float(match.group(1)) if match else 0.0
+	results, msg, cputime = None, '', 0.0
+	if worker is not None and not tags:
+		try:
+			results, msg, cputime = worker.parse(tokens)
+		except (IOError, ValueError):  # fall back to a new bitpar process
+			worker.close()
+			worker = None
+	if worker is None or tags:
+		# pass empty 'unkwown word file' to disable bitpar's smoothing
+		args = ['-y'] if n == 0 else ['-b', str(n)]
+		args += ['-s', startlabel, '-vp', '-u', '/dev/null', rulesfile,
+				lexiconfile]
+		proc = subprocess.Popen([which('bitpar')] + args,
+				shell=False, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+				stderr=subprocess.PIPE)
+		results, msg = proc.communicate('\n'.join(tokens) + '\n')
+		msg = msg.replace('Warning: Word class 0 did not occur!\n',
+				'').decode('utf8').strip()
+		match = CPUTIME.search(msg)
+		cputime = float(match.group(1)) if match else 0.0
 	if tags:
 		unlink(tmp.name)
 	# decode results or not?
@@ -863,20 +1012,23 @@ def renumber(deriv):
 
 
 def pprint_matrix(matrix, sent, tolabel, matrix2=None):
-	"""Print a numpy matrix chart; optionally in parallel with another."""
+	"""Print a compact chart as produced by ``doinsideoutside``.
+
+	Optionally prints another chart in parallel."""
 	for span in range(1, len(sent) + 1):
 		for left in range(len(sent) - span + 1):
 			right = left + span
-			if matrix[left, right].any() or (
-					matrix2 is not None and matrix2[left, right].any()):
+			idx = compactcellidx(left, right, len(sent), 1)
+			if matrix[idx].any() or (
+					matrix2 is not None and matrix2[idx].any()):
 				print('[%d:%d]' % (left, right))
-				for lhs in range(len(matrix[left, right])):
-					if matrix[left, right, lhs] or (
-							matrix2 is not None and matrix2[left, right, lhs]):
+				for lhs in range(len(matrix[idx])):
+					if matrix[idx, lhs] or (
+							matrix2 is not None and matrix2[idx, lhs]):
 						print('%20s\t%8.6g' % (tolabel[lhs].decode('ascii'),
-								matrix[left, right, lhs]), end='')
+								matrix[idx, lhs]), end='')
 						if matrix2 is not None:
-							print('\t%8.6g' % matrix2[left, right, lhs], end='')
+							print('\t%8.6g' % matrix2[idx, lhs], end='')
 						print()
 
 
@@ -912,10 +1064,11 @@ def test():
 	cfg1.switch(u'default', False)
 	i, o, start, _ = doinsideoutside('mary walks'.split(), cfg1)
 	assert start
-	print(i[0, 2, cfg1.toid[b'S']], o[0, 2, cfg1.toid[b'S']])
+	root = compactcellidx(0, 2, 2, 1)
+	print(i[root, cfg1.toid[b'S']], o[root, cfg1.toid[b'S']])
 	i, o, start, _ = doinsideoutside('walks mary'.split(), cfg1)
 	assert not start
-	print(i[0, 2, cfg1.toid[b'S']], o[0, 2, cfg1.toid[b'S']])
+	print(i[root, cfg1.toid[b'S']], o[root, cfg1.toid[b'S']])
 	rules = [
 		((('NP', 'NP', 'PP'), ((0, 1), )), 0.4),
 		((('PP', 'P', 'NP'), ((0, 1), )), 1),
@@ -946,7 +1099,7 @@ def test():
 	# chart1, msg1 = parse_symbolic(sent, cfg2)
 	# print(msg, '\n', msg1)
 
-__all__ = ['CFGChart', 'DenseCFGChart', 'SparseCFGChart', 'bitpar_nbest',
-		'bitpar_yap_forest', 'chartmatrix', 'doinsideoutside', 'insidescores',
-		'minmaxmatrices', 'outsidescores', 'parse', 'parse_bitpar',
-		'parse_symbolic', 'pprint_matrix', 'renumber']
+__all__ = ['BitParWorker', 'CFGChart', 'DenseCFGChart', 'SparseCFGChart',
+		'bitpar_nbest', 'bitpar_yap_forest', 'chartmatrix', 'doinsideoutside',
+		'insidescores', 'minmaxmatrices', 'outsidescores', 'parse',
+		'parse_bitpar', 'parse_symbolic', 'pprint_matrix', 'renumber']
@@ -227,7 +227,10 @@ def parse(sent, Grammar grammar, tags=None, bint exhaustive=True,
 	:param start: integer corresponding to the start symbol that analyses
 		should have, e.g., grammar.toid[b'ROOT']
 	:param whitelist: a whitelist of allowed ChartItems. Anything else is not
-		added to the agenda.
+		added to the agenda. A list indexed by label, with for each label
+		either ``None`` (label is never pruned), a ``SpanSet`` of allowed
+		spans, or with ``splitprune`` and ``markorigin``, a list with a
+		``SpanSet`` for each component.
 	:param splitprune: coarse stage used a split-PCFG where discontinuous node
 		appear as multiple CFG nodes. Every discontinuous node will result
 		in multiple lookups into whitelist to see whether it should be
@@ -580,11 +583,11 @@ cdef inline bint process_edge(LCFRSItem_fused newitem,
 
 	:returns: ``True`` when edge is accepted in the chart, ``False`` when
 		blocked. When ``False``, ``newitem`` may be reused."""
-	cdef uint32_t a, b, n, cnt, label
+	cdef uint32_t a, b, n, cnt
 	cdef bint inagenda = newitem in agenda.mapping
 	cdef bint inchart = newitem in chart.parseforest
 	cdef list componentlist = None
-	cdef dict componentdict = None
+	cdef SpanSet spans = None
 	if not inagenda and not inchart:
 		# check if we need to prune this item
 		if whitelist is not None and whitelist[newitem.label] is not None:
@@ -592,7 +595,7 @@ cdef inline bint process_edge(LCFRSItem_fused newitem,
 				if markorigin:
 					componentlist = <list>(whitelist[newitem.label])
 				else:
-					componentdict = <dict>(whitelist[newitem.label])
+					spans = <SpanSet>(whitelist[newitem.label])
 				b = cnt = 0
 				if LCFRSItem_fused is SmallChartItem:
 					a = nextset(newitem.vec, b)
@@ -610,22 +613,24 @@ cdef inline bint process_edge(LCFRSItem_fused newitem,
 						for n in range(a, b):
 							SETBIT(FATCOMPONENT.vec, n)
 					if markorigin:
-						componentdict = <dict>(componentlist[cnt])
+						spans = <SpanSet>(componentlist[cnt])
 					if LCFRSItem_fused is SmallChartItem:
-						if PyDict_Contains(componentdict, COMPONENT) != 1:
+						if not spans.contains(&(COMPONENT.vec)):
 							return False
 						a = nextset(newitem.vec, b)
 					elif LCFRSItem_fused is FatChartItem:
-						if PyDict_Contains(componentdict, FATCOMPONENT) != 1:
+						if not spans.contains(FATCOMPONENT.vec):
 							return False
 						a = anextset(newitem.vec, b, SLOTS)
 					cnt += 1
 			else:
-				label = newitem.label
-				newitem.label = 0
-				if PyDict_Contains(whitelist[label], newitem) != 1:
-					return False
-				newitem.label = label
+				spans = <SpanSet>(whitelist[newitem.label])
+				if LCFRSItem_fused is SmallChartItem:
+					if not spans.contains(&(newitem.vec)):
+						return False
+				elif LCFRSItem_fused is FatChartItem:
+					if not spans.contains(newitem.vec):
+						return False
 		# haven't seen this item before, won't prune, add to agenda
 		agenda.setitem(newitem, score)
 	# in agenda (maybe in chart)
@@ -653,7 +658,7 @@ cdef inline int process_lexedge(LCFRSItem_fused newitem,
 
 	:returns: ``True`` when edge is accepted in the chart, ``False`` when
 		blocked. When ``False``, ``newitem`` may be reused."""
-	cdef uint32_t label
+	cdef SpanSet spans
 	cdef bint inagenda = newitem in agenda.mapping
 	cdef bint inchart = newitem in chart.parseforest
 	if inagenda:
@@ -664,11 +669,13 @@ cdef inline int process_lexedge(LCFRSItem_fused newitem,
 				chart.itemstr(newitem))
 	# check if we need to prune this item
 	elif whitelist is not None and whitelist[newitem.label] is not None:
-		label = newitem.label
-		newitem.label = 0
-		if PyDict_Contains(whitelist[label], newitem) != 1:
-			return False
-		newitem.label = label
+		spans = <SpanSet>(whitelist[newitem.label])
+		if LCFRSItem_fused is SmallChartItem:
+			if not spans.contains(&(newitem.vec)):
+				return False
+		elif LCFRSItem_fused is FatChartItem:
+			if not spans.contains(newitem.vec):
+				return False
 	# haven't seen this item before, won't prune, add to agenda
 	agenda.setitem(newitem, score)
 	chart.addlexedge(newitem, wordidx)
@@ -12,7 +12,6 @@ import codecs
 import logging
 import multiprocessing
 from math import log
-from itertools import islice
 from collections import defaultdict, OrderedDict, Counter as multiset
 if sys.version[0] >= '3':
 	import pickle
@@ -63,6 +62,7 @@ DEFAULTS = dict(
 		tailmarker='',  # with headrules, head is last node and can be marked
 		revmarkov=True,  # reverse horizontal markovization
 		labelfun=None,
+		cache=False,  # re-use optimal binarizations of productions
 		fanout_marks_before_bin=False))
 
 
@@ -74,7 +74,7 @@ def initworker(params):
 
 def startexp(
 		stages=(parser.DictObj(parser.DEFAULTSTAGE), ),  # see parser module
-		corpusfmt='export',  # choices: export, (disc)bracket, alpino, tiger
+		corpusfmt='export',  # export, (disc)bracket, alpino, tiger, binary
 		traincorpus=parser.DictObj(DEFAULTS['traincorpus']),
 		testcorpus=parser.DictObj(DEFAULTS['testcorpus']),
 		binarization=parser.DictObj(DEFAULTS['binarization']),
@@ -127,7 +127,7 @@ def startexp(
 		trees, sents, train_tagged_sents = loadtraincorpus(
 				corpusfmt, traincorpus, binarization, punct, functions,
 				morphology, removeempty, ensureroot, transformations,
-				relationalrealizational)
+				relationalrealizational, numproc)
 	elif isinstance(traincorpus.numsents, float):
 		raise ValueError('need to specify number of training set sentences, '
 				'not fraction, in rerun mode.')
@@ -137,8 +137,7 @@ def startexp(
 			removeempty=removeempty, morphology=morphology,
 			functions=functions, ensureroot=ensureroot)
 	if isinstance(testcorpus.numsents, float):
-		testcorpus.numsents = int(testcorpus.numsents
-				* len(testsettb.blocks()))
+		testcorpus.numsents = int(testcorpus.numsents * len(testsettb))
 	if testcorpus.skiptrain:
 		testcorpus.skip += (  # pylint: disable=maybe-no-member
 				traincorpus.numsents)  # pylint: disable=maybe-no-member
@@ -146,7 +145,7 @@ def startexp(
 	test_blocks = OrderedDict()
 	test_trees = OrderedDict()
 	test_tagged_sents = OrderedDict()
-	for n, a in islice(testsettb._read_blocks(),
+	for n, a in testsettb._sliceblocks(
 			testcorpus.skip, testcorpus.skip  # pylint: disable=maybe-no-member
 				+ testcorpus.numsents):
 		tree, sent = testsettb._parsetree(a)
@@ -262,32 +261,84 @@ def startexp(
 
 def loadtraincorpus(corpusfmt, traincorpus, binarization, punct, functions,
 		morphology, removeempty, ensureroot, transformations,
-		relationalrealizational):
-	"""Load the training corpus."""
+		relationalrealizational, numproc=1):
+	"""Load the training corpus.
+
+	:param numproc: when not 1, read and transform the trees with a pool of
+		processes, each of which handles a contiguous range of sentences.
+		Formats without an index of the trees (Alpino, Dact) are read by a
+		single process, since each range would be read from the start."""
 	train = treebank.READERS[corpusfmt](traincorpus.path,
 			encoding=traincorpus.encoding, headrules=binarization.headrules,
 			headfinal=True, headreverse=False, removeempty=removeempty,
 			ensureroot=ensureroot, punct=punct,
 			functions=functions, morphology=morphology)
 	if isinstance(traincorpus.numsents, float):
-		traincorpus.numsents = int(traincorpus.numsents * len(train.sents()))
-	traintrees = train.itertrees(None, traincorpus.numsents)
-	trees, sents = zip(*[treesent for _, treesent in traintrees
-			if 1 <= len(treesent[1]) <= traincorpus.maxwords])
+		traincorpus.numsents = int(traincorpus.numsents * len(train))
+	parallel = numproc != 1 and train._indexed
+	if parallel:
+		numsents = len(train)
+		if traincorpus.numsents is not None:
+			numsents = min(traincorpus.numsents, numsents)
+		chunksize = -(-numsents // (4 * (
+				numproc or multiprocessing.cpu_count()))) or 1
+		pool = multiprocessing.Pool(processes=numproc,
+				initializer=initworker, initargs=(parser.DictObj(
+					train=train, maxwords=traincorpus.maxwords,
+					transformations=transformations,
+					relationalrealizational=relationalrealizational), ))
+		treesents = [treesent for chunk in pool.imap(loadtrainworker,
+				[(n, min(n + chunksize, numsents))
+					for n in range(0, numsents, chunksize)])
+				for treesent in chunk]
+		pool.terminate()
+		pool.join()
+		del pool
+		trees, sents = zip(*treesents) if treesents else ((), ())
+		trees = list(trees)
+	else:
+		traintrees = train.itertrees(None, traincorpus.numsents)
+		trees, sents = zip(*[treesent for _, treesent in traintrees
+				if 1 <= len(treesent[1]) <= traincorpus.maxwords])
 	logging.info('%d training sentences after length restriction <= %d',
 			len(trees), traincorpus.maxwords)
 	if not trees:
 		raise ValueError('training corpus (selection) should be non-empty.')
+	if not parallel:
+		trees = transformtrees(trees, sents, transformations,
+				relationalrealizational)
+	train_tagged_sents = [[(word, tag) for word, (_, tag)
+			in zip(sent, sorted(tree.pos()))]
+				for tree, sent in zip(trees, sents)]
+	return trees, sents, train_tagged_sents
+
+
+def transformtrees(trees, sents, transformations, relationalrealizational):
+	"""Apply treebank transformations and the RR-transform to trees."""
 	if transformations:
 		trees = [treebanktransforms.transform(tree, sent, transformations)
 				for tree, sent in zip(trees, sents)]
 	if relationalrealizational:
 		trees = [treebanktransforms.rrtransform(
 				tree, **relationalrealizational)[0] for tree in trees]
-	train_tagged_sents = [[(word, tag) for word, (_, tag)
-			in zip(sent, sorted(tree.pos()))]
-				for tree, sent in zip(trees, sents)]
-	return trees, sents, train_tagged_sents
+	return list(trees)
+
+
+@parser.workerfunc
+def loadtrainworker(args):
+	"""Read and transform the training sentences ``start...end``.
+
+	:returns: a list of (tree, sent) tuples."""
+	start, end = args
+	prm = INTERNALPARAMS
+	treesents = [treesent for _, treesent in prm.train.itertrees(start, end)
+			if 1 <= len(treesent[1]) <= prm.maxwords]
+	if not treesents:
+		return []
+	trees, sents = zip(*treesents)
+	trees = transformtrees(trees, sents, prm.transformations,
+			prm.relationalrealizational)
+	return list(zip(trees, sents))
 
 
 def getposmodel(postagging, train_tagged_sents):
@@ -346,14 +397,22 @@ def dobinarization(trees, sents, binarization, relationalrealizational):
 						if relationalrealizational else (),
 					labelfun=binarization.labelfun)
 	elif binarization.method == 'optimal':
-		trees = [Tree.convert(treetransforms.optimalbinarize(tree))
-						for n, tree in enumerate(trees)]
+		cache = (treetransforms.BinarizationCache()
+				if binarization.cache else None)
+		trees = [Tree.convert(treetransforms.optimalbinarize(tree,
+						cache=cache)) for n, tree in enumerate(trees)]
+		if cache is not None:
+			msg += '; %s' % cache
 	elif binarization.method == 'optimalhead':
 		msg += ' h=%d v=%d' % (
 				binarization.h, binarization.v)
+		cache = (treetransforms.BinarizationCache()
+				if binarization.cache else None)
 		trees = [Tree.convert(treetransforms.optimalbinarize(
-				tree, headdriven=True, h=binarization.h, v=binarization.v))
-				for n, tree in enumerate(trees)]
+				tree, headdriven=True, h=binarization.h, v=binarization.v,
+				cache=cache)) for n, tree in enumerate(trees)]
+		if cache is not None:
+			msg += '; %s' % cache
 	trees = [treetransforms.addfanoutmarkers(t) for t in trees]
 	logging.info('%s; cpu time elapsed: %gs',
 			msg, time.clock() - begin)
@@ -637,26 +696,27 @@ def writeresults(results, params):
 	ext = {'export': 'export', 'bracket': 'mrg',
 			'discbracket': 'dbr', 'alpino': 'xml'}
 	category = (params.category + '.') if params.category else ''
-	if params.corpusfmt in ('alpino', 'tiger'):
+	if params.corpusfmt in ('alpino', 'tiger', 'binary'):
 		# convert gold corpus because writing these formats is unsupported
 		corpusfmt = 'export'
-		io.open('%s/%sgold.%s' % (params.resultdir, category, ext[corpusfmt]),
-				'w', encoding='utf-8').writelines(
-				treebank.writetree(goldtree, [w for w, _ in goldsent], n,
+		with io.open('%s/%sgold.%s' % (params.resultdir, category,
+				ext[corpusfmt]), 'w', encoding='utf-8') as out:
+			treebank.writetrees(out, ((goldtree, [w for w, _ in goldsent], n)
+					for n, (_, goldtree, goldsent, _)
+					in params.testset.items()),
 					corpusfmt, morphology=params.morphology)
-			for n, (_, goldtree, goldsent, _) in params.testset.items())
 	else:
 		corpusfmt = params.corpusfmt
 		io.open('%s/%sgold.%s' % (params.resultdir, category, ext[corpusfmt]),
 				'w', encoding='utf-8').writelines(
 				a for _, _, _, a in params.testset.values())
 	for res in results:
-		io.open('%s/%s%s.%s' % (params.resultdir, category, res.name,
-				ext[corpusfmt]), 'w', encoding='utf-8').writelines(
-					treebank.writetree(res.parsetrees[n],
-						[w for w, _ in goldsent], n, corpusfmt,
-						morphology=params.morphology)
-				for n, (_, _, goldsent, _) in params.testset.items())
+		with io.open('%s/%s%s.%s' % (params.resultdir, category, res.name,
+				ext[corpusfmt]), 'w', encoding='utf-8') as out:
+			treebank.writetrees(out, ((res.parsetrees[n],
+					[w for w, _ in goldsent], n)
+					for n, (_, _, goldsent, _) in params.testset.items()),
+					corpusfmt, morphology=params.morphology)
 	with open('%s/parsetimes.txt' % params.resultdir, 'w') as out:
 		out.write('#id\tlen\t%s\n' % '\t'.join(res.name for res in results))
 		out.writelines('%s\t%d\t%s\n' % (n, len(params.testset[n][2]),
@@ -910,6 +970,9 @@ def readparam(filename):
 		if n == 0 and stage.prune:
 			raise ValueError('need previous stage to prune, '
 					'but this stage is first.')
+		if stage.adaptivek not in (None, 'length', 'entropy'):
+			raise ValueError('unrecognized adaptivek option: %r'
+					% stage.adaptivek)
 		if stage.mode == 'dop-rerank':
 			assert stage.prune and not stage.splitprune and stage.k > 1
 			assert (stage.dop and stage.dop != 'doubledop'
@@ -971,9 +1034,10 @@ def main(argv=None):
 					"top='%s',\n%s" % (top, open(argv[1]).read()))
 
 
-__all__ = ['initworker', 'startexp', 'loadtraincorpus', 'getposmodel',
-		'dobinarization', 'getgrammars', 'doparsing', 'worker', 'writeresults',
-		'oldeval', 'readtepacoc', 'parsetepacoc', 'readparam']
+__all__ = ['initworker', 'startexp', 'loadtraincorpus', 'transformtrees',
+		'loadtrainworker', 'getposmodel', 'dobinarization', 'getgrammars',
+		'doparsing', 'worker', 'writeresults', 'oldeval', 'readtepacoc',
+		'parsetepacoc', 'readparam']
 
 if __name__ == '__main__':
 	main()
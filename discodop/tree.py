@@ -14,8 +14,12 @@ Removed: probabilistic trees, binarization, reading off CFG productions, &c."""
 from __future__ import division, print_function, unicode_literals
 import re
 import sys
+from array import array
 if sys.version[0] >= '3':
 	basestring = str  # pylint: disable=W0622,C0103
+# Tokenizer of Tree.parse() for the default brackets and patterns; the groups
+# match the label of an opening bracket, a closing bracket, and a leaf.
+BRACKETTOKENRE = re.compile(r'\(\s*([^\s()]*)|(\))|([^\s()]+)')
 
 
 class Tree(list):
@@ -312,6 +316,11 @@ class Tree(list):
 		:returns: A tree corresponding to the string representation s.
 			If this class method is called using a subclass of Tree, then it
 			will return a tree of that type."""
+		if (brackets == '()' and label_pattern is None
+				and leaf_pattern is None):
+			tree = cls._parsedefault(s, parse_label, parse_leaf)
+			if tree is not None:
+				return tree
 		if not isinstance(brackets, basestring) or len(brackets) != 2:
 			raise TypeError('brackets must be a length-2 string')
 		if re.search(r'\s', brackets):
@@ -360,6 +369,54 @@ class Tree(list):
 		tree = stack[0][1][0]
 		return tree
 
+	@classmethod
+	def _parsedefault(cls, s, parse_label, parse_leaf):
+		"""Fast path of parse() for the default brackets and patterns.
+
+		Nodes of ``Tree`` and ``ParentedTree`` are initialized directly,
+		instead of through their constructors.
+
+		:returns: the tree, or None if s is not a well-formed tree; parse()
+			then reports the error."""
+		stack = [(None, [])]
+		for label, close, leaf in BRACKETTOKENRE.findall(s):
+			if leaf:
+				if len(stack) == 1:
+					return None
+				if parse_leaf is not None:
+					leaf = parse_leaf(leaf)
+				stack[-1][1].append(leaf)
+			elif close:
+				if len(stack) == 1:
+					return None
+				label, children = stack.pop()
+				if cls is Tree:
+					node = list.__new__(Tree)
+					list.__init__(node, children)
+					node.label = label
+					node.source = node.bitset = None
+				elif cls is ParentedTree:
+					node = list.__new__(ParentedTree)
+					list.__init__(node, children)
+					node._parent = None
+					node.label = label
+					node.source = node.bitset = None
+					for child in children:
+						if isinstance(child, Tree):
+							child._parent = node
+				else:
+					node = cls(label, children)
+				stack[-1][1].append(node)
+			else:  # opening bracket
+				if len(stack) == 1 and stack[0][1]:
+					return None
+				if parse_label is not None:
+					label = parse_label(label)
+				stack.append((label, []))
+		if len(stack) != 1 or len(stack[0][1]) != 1:
+			return None
+		return stack[0][1][0]
+
 	@classmethod
 	def _parse_error(cls, orig, match, expecting):
 		"""Display a friendly error message when parsing a tree string fails.
@@ -812,6 +869,14 @@ class ParentedTree(AbstractParentedTree):
 		if not dry_run:
 			child._parent = self
 
+	def __reduce__(self):
+		"""Pickle without parent pointers.
+
+		The constructor restores them when the children are added."""
+		state = self.__dict__.copy()
+		del state['_parent']
+		return self.__class__, (self.label, list(self)), state
+
 
 class ImmutableParentedTree(ImmutableTree, ParentedTree):
 	"""Combination of an Immutable and Parented Tree."""
@@ -963,6 +1028,212 @@ class ImmutableMultiParentedTree(ImmutableTree, MultiParentedTree):
 		super(ImmutableMultiParentedTree, self).__init__(label_or_str, children)
 
 
+class LabelTable(object):
+	"""Interned labels, shared by the CompactTree objects of a corpus."""
+	__slots__ = ('toid', 'tolabel')
+
+	def __init__(self, labels=()):
+		self.tolabel = list(labels)
+		self.toid = {label: n for n, label in enumerate(self.tolabel)}
+
+	def getid(self, label):
+		""":returns: the id of label, which is added if necessary."""
+		try:
+			return self.toid[label]
+		except KeyError:
+			self.toid[label] = len(self.tolabel)
+			self.tolabel.append(label)
+			return self.toid[label]
+
+	def __len__(self):
+		return len(self.tolabel)
+
+	def __reduce__(self):
+		return LabelTable, (self.tolabel, )
+
+
+class CompactTree(object):
+	"""An immutable tree with integer leaves stored in a single array.
+
+	Nodes and leaves are numbered in preorder; for each, the array stores its
+	label id (or ``-leaf - 1`` for a leaf), the number of its parent, and the
+	number after its last descendant. Labels are interned in a LabelTable,
+	which can be shared by all trees of a corpus. Subtrees are views on the
+	array of the whole tree.
+
+	>>> tree = CompactTree.fromtree(Tree.parse(
+	... '(S (NP 1) (VP (VB 0) (JJ 2)))', parse_leaf=int))
+	>>> print(tree[1])
+	(VP (VB 0) (JJ 2))
+	>>> print(tree.leaves(), tree[1].parent.label)
+	[1, 0, 2] S
+	>>> tree.totree() == Tree.parse('(S (NP 1) (VP (VB 0) (JJ 2)))',
+	... parse_leaf=int)
+	True"""
+	__slots__ = ('data', 'labels', 'idx')
+
+	def __init__(self, data, labels, idx=0):
+		self.data = data
+		self.labels = labels
+		self.idx = idx
+
+	@classmethod
+	def fromtree(cls, tree, labels=None):
+		"""Convert a Tree object.
+
+		:param labels: a LabelTable to share with other trees; if None, a new
+			table is created."""
+		if labels is None:
+			labels = LabelTable()
+		nodes, parents, ends = [], [], []
+
+		def visit(node, parent):
+			"""Add node and its descendants in preorder."""
+			n = len(nodes)
+			parents.append(parent)
+			ends.append(0)
+			if isinstance(node, Tree):
+				nodes.append(labels.getid(node.label))
+				for child in node:
+					visit(child, n)
+			elif isinstance(node, int) and node >= 0:
+				nodes.append(-node - 1)
+			else:
+				raise ValueError('expected Tree or non-negative integer: %r'
+						% node)
+			ends[n] = len(nodes)
+
+		visit(tree, -1)
+		return cls(array(str('i'), nodes + parents + ends), labels)
+
+	def totree(self, cls=Tree):
+		""":returns: this tree converted to a Tree object of type cls."""
+		return cls(self.label, [child.totree(cls)
+				if isinstance(child, CompactTree) else child
+				for child in self])
+
+	def _child(self, n):
+		""":returns: a view on node n, or the leaf at n."""
+		if self.data[n] < 0:
+			return -self.data[n] - 1
+		return CompactTree(self.data, self.labels, n)
+
+	def _children(self):
+		"""Yield the numbers of the children of this node."""
+		data, size = self.data, len(self.data) // 3
+		n, end = self.idx + 1, data[2 * size + self.idx]
+		while n < end:
+			yield n
+			n = data[2 * size + n]
+
+	label = property(lambda self: self.labels.tolabel[self.data[self.idx]],
+			doc="""The label of this node.""")
+
+	@property
+	def parent(self):
+		"""The parent of this node, or None for the root."""
+		n = self.data[len(self.data) // 3 + self.idx]
+		return None if n == -1 else CompactTree(self.data, self.labels, n)
+
+	def __len__(self):
+		data, size = self.data, len(self.data) // 3
+		result, n, end = 0, self.idx + 1, data[2 * size + self.idx]
+		while n < end:
+			result += 1
+			n = data[2 * size + n]
+		return result
+
+	def __bool__(self):
+		return self.data[len(self.data) // 3 * 2 + self.idx] > self.idx + 1
+
+	__nonzero__ = __bool__  # Python 2
+
+	def __iter__(self):
+		for n in self._children():
+			yield self._child(n)
+
+	def __getitem__(self, index):
+		if index == 0 and self:
+			return self._child(self.idx + 1)
+		elif isinstance(index, int):
+			children = list(self._children())
+			return self._child(children[index])
+		elif isinstance(index, slice):
+			return list(self)[index]
+		result = self
+		for n in index:
+			result = result[n]
+		return result
+
+	def leaves(self):
+		""":returns: list containing the leaves of this tree."""
+		data = self.data
+		return [-data[n] - 1 for n in range(self.idx,
+				data[len(data) // 3 * 2 + self.idx]) if data[n] < 0]
+
+	def pos(self):
+		""":returns: a list of (leaf, preterminal label) tuples."""
+		data, size = self.data, len(self.data) // 3
+		tolabel = self.labels.tolabel
+		return [(-data[n] - 1, tolabel[data[data[size + n]]])
+				for n in range(self.idx, data[2 * size + self.idx])
+				if data[n] < 0]
+
+	def subtrees(self, condition=None):
+		"""Traverse and generate subtrees of this tree in depth-first order.
+
+		:param condition: a function to filter which nodes are generated."""
+		data = self.data
+		for n in range(self.idx, data[len(data) // 3 * 2 + self.idx]):
+			if data[n] >= 0:
+				node = CompactTree(data, self.labels, n)
+				if condition is None or condition(node):
+					yield node
+
+	def treepositions(self, order='preorder'):
+		""":param order: One of preorder, postorder, bothorder, leaves."""
+		positions = []
+		if order in ('preorder', 'bothorder'):
+			positions.append(())
+		for i, child in enumerate(self):
+			if isinstance(child, CompactTree):
+				positions.extend((i, ) + p for p in child.treepositions(order))
+			else:
+				positions.append((i, ))
+		if order in ('postorder', 'bothorder'):
+			positions.append(())
+		return positions
+
+	def _key(self):
+		"""A tuple with the labels and shape of this subtree."""
+		data, size = self.data, len(self.data) // 3
+		return tuple((self.labels.tolabel[data[n]] if data[n] >= 0
+				else data[n], data[2 * size + n] - self.idx)
+				for n in range(self.idx, data[2 * size + self.idx]))
+
+	def __eq__(self, other):
+		return isinstance(other, CompactTree) and self._key() == other._key()
+
+	def __ne__(self, other):
+		return not self == other
+
+	def __hash__(self):
+		return hash(self._key())
+
+	def __reduce__(self):
+		return CompactTree, (self.data, self.labels, self.idx)
+
+	def __repr__(self):
+		return '%s(%r)' % (self.__class__.__name__, str(self))
+
+	def __str__(self):
+		return str(self.totree())
+
+	def pprint(self, **kwargs):
+		""":returns: a pretty-printed string; cf. ``Tree.pprint()``."""
+		return self.totree().pprint(**kwargs)
+
+
 def slice_bounds(seq, slice_obj, allow_step=False):
 	"""Calculate the effective (start, stop) bounds of a slice.
 
@@ -999,4 +1270,5 @@ def slice_bounds(seq, slice_obj, allow_step=False):
 	return start, stop, 1
 
 __all__ = ['Tree', 'ImmutableTree', 'ParentedTree', 'ImmutableParentedTree',
-		'MultiParentedTree', 'ImmutableMultiParentedTree', 'slice_bounds']
+		'MultiParentedTree', 'ImmutableMultiParentedTree', 'LabelTable',
+		'CompactTree', 'slice_bounds']
@@ -3,14 +3,25 @@ from __future__ import division, print_function, unicode_literals
 import io
 import os
 import re
+import sys
+import mmap
+import struct
 import xml.etree.cElementTree as ElementTree
+try:
+	import cPickle as pickle
+except ImportError:
+	import pickle
 from glob import glob
+from array import array
+from bisect import bisect_right
 from itertools import count, chain, islice
 from collections import defaultdict, OrderedDict
-from discodop.tree import Tree, ParentedTree
+from discodop.tree import Tree, ParentedTree, LabelTable
 from discodop.treebanktransforms import punctremove, punctraise, \
 		balancedpunctraise, punctroot, ispunct, readheadrules, headfinder, \
 		sethead, headmark, headorder, removeemptynodes
+if sys.version[0] >= '3':
+	basestring = str  # pylint: disable=W0622,C0103
 
 FIELDS = tuple(range(6))
 WORD, LEMMA, TAG, MORPH, FUNC, PARENT = FIELDS
@@ -20,6 +31,22 @@ EXPORTNONTERMINAL = re.compile(r"^#([0-9]+)$")
 LEAVESRE = re.compile(r" ([^ ()]*)\)")
 FRONTIERNTRE = re.compile(r" \)")
 INDEXRE = re.compile(r" [0-9]+\)")
+# start tag of a sentence in Tiger XML with its id, or its end tag
+TIGERSENTRE = re.compile(br'<s\b[^>]*?\bid="([^"]*)"|</s>')
+XMLDECLRE = re.compile(br'<\?xml[^>]*\bencoding=["\']([-\w.]+)["\']')
+# version of the format of the byte-offset index files
+INDEXVERSION = 1
+# identifies files in the format of BinaryCorpusReader; followed by the offset
+# of the header, an unsigned 64 bit integer.
+BINARYMAGIC = b'DISCOTB1'
+# the columns of a binary treebank: per sentence, offsets into the other
+# columns; per node and terminal in preorder, the label id (or -leaf - 1 for a
+# terminal), and the position after its last descendant, relative to the root;
+# per node, ids for each field of its source (or -1; -2 for a word equal to
+# that of its terminal); per token, the id of the word.
+BINARYCOLUMNS = ('treeoffsets', 'nodeoffsets', 'sentoffsets', 'labels',
+		'ends', 'word', 'lemma', 'tag', 'morph', 'func', 'parent', 'secedges',
+		'words')
 
 
 class CorpusReader(object):
@@ -96,15 +123,55 @@ class CorpusReader(object):
 			raise ValueError('no files matched pattern %s' % path)
 		self._block_cache = None
 		self._trees_cache = None
+		self._index = self._indexpos = self._firstblocks = None
+		self._numblocks = 0
 
 	def itertrees(self, start=None, end=None):
 		"""
 		:returns: an iterator returning tuples (key, (tree, sent)) of
 			sentences in corpus. Useful when the dictionary of all trees in
 			corpus would not fit in memory."""
-		for n, a in islice(self._read_blocks(), start, end):
+		for n, a in self._sliceblocks(start, end):
 			yield n, self._parsetree(a)
 
+	def iterblocks(self, start=None, end=None):
+		"""
+		:returns: an iterator returning tuples (key, block) with the raw
+			representation of trees ``start...end`` in the original
+			treebank."""
+		for n, a in self._sliceblocks(start, end):
+			yield n, self._strblock(n, a)
+
+	def get(self, key):
+		"""
+		:returns: the tuple (tree, sent) for the sentence with the given key,
+			without reading the preceding sentences of the corpus."""
+		if not self._indexed:
+			for n, a in self._read_blocks():
+				if n == key:
+					return self._parsetree(a)
+			raise KeyError(key)
+		self._getindex()
+		if self._indexpos is None:  # blocks are numbered 1, 2, ...
+			if not 1 <= key <= self._numblocks:
+				raise KeyError(key)
+			pos = key - 1
+		else:
+			pos = self._indexpos[key]
+		filename, first, _, offsets, lengths = self._index[
+				bisect_right(self._firstblocks, pos) - 1]
+		with io.open(filename, 'rb') as inp:
+			inp.seek(offsets[pos - first])
+			return self._parsetree(self._readblock(
+					inp.read(lengths[pos - first])))
+
+	def __len__(self):
+		""":returns: the number of sentences in the corpus."""
+		if self._indexed:
+			self._getindex()
+			return self._numblocks
+		return sum(1 for _ in self._read_blocks())
+
 	def trees(self):
 		"""
 		:returns: an ordered dictionary of parse trees
@@ -142,6 +209,103 @@ class CorpusReader(object):
 	def _read_blocks(self):
 		"""Iterate over blocks in corpus file corresponding to parse trees."""
 
+	# whether sentences can be read directly by their position; e.g., this
+	# format implements _blockoffsets() and _readblock()
+	_indexed = False
+
+	def _blockoffsets(self, inp):
+		"""Iterate over tuples ``(key, offset, length)`` for blocks in a file.
+
+		The corpus file is opened in binary mode; key is None when the blocks
+		are numbered consecutively."""
+
+	def _readblock(self, data):
+		"""Convert the bytes of a block to a value.
+
+		The value is as returned by _read_blocks()."""
+
+	def _decode(self, data):
+		"""Decode bytes and translate newlines as ``io.open()`` does."""
+		return data.decode(self._encoding).replace(
+				'\r\n', '\n').replace('\r', '\n')
+
+	def _getindex(self):
+		"""Load the index of the corpus files.
+
+		I.e., for each file a tuple ``(filename, first, keys, offsets,
+		lengths)``, where ``first`` is the position of its first block in the
+		corpus."""
+		if self._index is None:
+			index, indexpos, first = [], {}, 0
+			for filename in self._filenames:
+				keys, offsets, lengths = self._fileindex(filename)
+				if keys and keys[0] is None:
+					indexpos = None
+				elif indexpos is not None:
+					for n, key in enumerate(keys, first):
+						if key in indexpos:
+							raise ValueError('duplicate sentence ID: %s' % key)
+						indexpos[key] = n
+				index.append((filename, first, keys, offsets, lengths))
+				first += len(offsets)
+			self._index, self._indexpos = index, indexpos
+			self._firstblocks = [a[1] for a in index]
+			self._numblocks = first
+		return self._index
+
+	def _fileindex(self, filename):
+		"""Get the keys, offsets, and lengths of the blocks in a corpus file.
+
+		The result is stored in a hidden file next to the corpus file, e.g.,
+		``.wsj_0001.mrg.index``, which is rebuilt when the corpus file has
+		been modified."""
+		stat = os.stat(filename)
+		indexfile = os.path.join(os.path.dirname(filename),
+				'.%s.index' % os.path.basename(filename))
+		try:
+			with open(indexfile, 'rb') as inp:
+				result = pickle.load(inp)
+			if result[:3] == (INDEXVERSION, stat.st_mtime, stat.st_size):
+				return result[3:]
+		except (IOError, OSError, EOFError, ValueError, TypeError,
+				pickle.UnpicklingError):
+			pass
+		keys, offsets, lengths = [], [], []
+		with io.open(filename, 'rb') as inp:
+			for key, offset, length in self._blockoffsets(inp):
+				keys.append(key)
+				offsets.append(offset)
+				lengths.append(length)
+		try:
+			with open(indexfile, 'wb') as out:
+				pickle.dump((INDEXVERSION, stat.st_mtime, stat.st_size,
+						keys, offsets, lengths), out, protocol=2)
+		except (IOError, OSError):  # e.g., directory is not writable
+			pass
+		return keys, offsets, lengths
+
+	def _sliceblocks(self, start=None, end=None):
+		"""Like ``islice(self._read_blocks(), start, end)``, using the index.
+
+		If available, the index is used to seek directly to block ``start``."""
+		if not start or not self._indexed:
+			for n, a in islice(self._read_blocks(), start, end):
+				yield n, a
+			return
+		index = self._getindex()
+		end = self._numblocks if end is None else min(end, self._numblocks)
+		for filename, first, keys, offsets, lengths in index[
+				bisect_right(self._firstblocks, start) - 1:]:
+			if first >= end:
+				break
+			with io.open(filename, 'rb') as inp:
+				for n in range(max(start - first, 0),
+						min(end - first, len(offsets))):
+					inp.seek(offsets[n])
+					yield (first + n + 1 if self._indexpos is None
+							else keys[n]), self._readblock(
+							inp.read(lengths[n]))
+
 	def _strblock(self, n, block):
 		"""Convert a value returned by _read_blocks() to a string."""
 		return block
@@ -158,7 +322,7 @@ class CorpusReader(object):
 			removeemptynodes(tree, sent)
 		if self.ensureroot and tree.label != self.ensureroot:
 			tree = ParentedTree(self.ensureroot, [tree])
-		if not isinstance(self, BracketCorpusReader):
+		if not isinstance(self, (BracketCorpusReader, BinaryCorpusReader)):
 			# roughly order constituents by order in sentence
 			for a in reversed(list(tree.subtrees(lambda x: len(x) > 1))):
 				a.sort(key=Tree.leaves)
@@ -202,6 +366,17 @@ class BracketCorpusReader(CorpusReader):
 				if line), 1):
 			yield n, block
 
+	_indexed = True
+
+	def _blockoffsets(self, inp):
+		offset = 0
+		for line in inp:
+			yield None, offset, len(line)
+			offset += len(line)
+
+	def _readblock(self, data):
+		return self._decode(data)
+
 	def _parse(self, block):
 		c = count()
 		tree = ParentedTree.parse(LEAVESRE.sub(lambda _: ' %d)' % next(c),
@@ -241,6 +416,17 @@ class DiscBracketCorpusReader(CorpusReader):
 				if line), 1):
 			yield n, block
 
+	_indexed = True
+
+	def _blockoffsets(self, inp):
+		offset = 0
+		for line in inp:
+			yield None, offset, len(line)
+			offset += len(line)
+
+	def _readblock(self, data):
+		return self._decode(data)
+
 	def _parse(self, block):
 		treestr = block.split("\t", 1)[0]
 		tree = ParentedTree.parse(treestr, parse_leaf=int)
@@ -298,6 +484,36 @@ class NegraCorpusReader(CorpusReader):
 					lines.append(line.strip())
 				# other lines are ignored, such as #FORMAT x, %% comments, ...
 
+	_indexed = True
+
+	def _blockoffsets(self, inp):
+		started = False
+		offset = 0
+		for line in inp:
+			if line.startswith(b'#BOS '):
+				if started:
+					raise ValueError('beginning of sentence marker while '
+							'previous one still open: %s'
+							% line.decode(self._encoding))
+				started = True
+				sentid = line.split()[1].decode(self._encoding)
+				start = offset
+			elif line.startswith(b'#EOS '):
+				if not started:
+					raise ValueError('end of sentence marker while '
+							'none started')
+				thissentid = line.split()[1].decode(self._encoding)
+				if sentid != thissentid:
+					raise ValueError('unexpected sentence id: '
+						'start=%s, end=%s' % (sentid, thissentid))
+				started = False
+				yield sentid, start, offset + len(line) - start
+			offset += len(line)
+
+	def _readblock(self, data):
+		return [line.strip() for line
+				in self._decode(data).rstrip('\n').split('\n')[1:-1]]
+
 	def _strblock(self, n, block):
 		return '#BOS %s\n%s\n#EOS %s\n' % (n, '\n'.join(block), n)
 
@@ -319,21 +535,68 @@ class TigerXMLCorpusReader(CorpusReader):
 		"""
 		:returns: a list of strings containing the raw representation of
 			trees in the treebank."""
-		if self._block_cache is None:
-			self._block_cache = OrderedDict(self._read_blocks())
 		return OrderedDict((n, ElementTree.tostring(a))
-				for n, a in self._block_cache.items())
+				for n, a in self._read_blocks())
 
 	def _read_blocks(self):
 		for filename in self._filenames:
-			# iterator over elements in XML  file
+			# iterator over elements in XML file; each sentence is detached
+			# from its parent when it is complete, so that memory usage is
+			# bounded by the size of a single sentence.
 			context = ElementTree.iterparse(filename,
-					events=(b'start', b'end'))
-			_, root = next(context)  # event == 'start' of root element
+					events=(str('start'), str('end')))
+			ancestors = []
 			for event, elem in context:
-				if event == 'end' and elem.tag == 's':
+				if event == 'start':
+					ancestors.append(elem)
+					continue
+				ancestors.pop()
+				if elem.tag == 's':
+					if ancestors:
+						ancestors[-1].remove(elem)
 					yield elem.get('id'), elem
-				root.clear()
+
+	_indexed = True
+	_xmlencoding = None
+
+	def _blockoffsets(self, inp):
+		sentid = start = None
+		offset = 0  # offset of buf in the file
+		buf = b''
+		for line in inp:
+			buf += line
+			if buf.rfind(b'<') > buf.rfind(b'>'):
+				continue  # a tag is split over lines
+			for match in TIGERSENTRE.finditer(buf):
+				if match.group(1) is not None:
+					if sentid is not None:
+						raise ValueError('start of sentence %s while '
+								'previous one still open: %s' % (
+								match.group(1).decode('ascii'), sentid))
+					start = offset + match.start()
+					sentid = match.group(1).decode('ascii')
+				elif sentid is None:
+					raise ValueError('end of sentence at offset %d while '
+							'none started' % (offset + match.start()))
+				else:
+					yield sentid, start, offset + match.end() - start
+					sentid = None
+			offset += len(buf)
+			buf = b''
+		if sentid is not None:
+			raise ValueError('sentence %s not closed at end of file' % sentid)
+
+	def _readblock(self, data):
+		# a sentence on its own lacks the XML declaration of the file,
+		# so convert it to UTF-8 using the declared encoding.
+		if self._xmlencoding is None:
+			with io.open(self._filenames[0], 'rb') as inp:
+				match = XMLDECLRE.match(inp.readline())
+			self._xmlencoding = (match.group(1).decode('ascii')
+					if match else 'utf-8')
+		if self._xmlencoding.lower() not in ('utf8', 'utf-8'):
+			data = data.decode(self._xmlencoding).encode('utf8')
+		return ElementTree.fromstring(data)
 
 	def _strblock(self, n, block):
 		return ElementTree.tostring(block)
@@ -353,6 +616,7 @@ class TigerXMLCorpusReader(CorpusReader):
 		for nt in block.find('graph').find('nonterminals'):
 			if nt.get('id') == root:
 				ntid = '0'
+				rootlabel = nt.get('cat')
 			else:
 				fields = nodes.setdefault(nt.get('id'), 6 * [None])
 				ntid = nt.get('id').split('_')[-1]
@@ -379,7 +643,7 @@ class TigerXMLCorpusReader(CorpusReader):
 		tree, sent = exporttree(
 				['\t'.join(a) for a in nodes.values()],
 				self.functions, self.morphology, self.lemmas)
-		tree.label = nodes[root][TAG]
+		tree.label = nodes[root][TAG] if root in nodes else rootlabel
 		return tree, sent
 
 	def _word(self, block, orig=False):
@@ -400,9 +664,7 @@ class AlpinoCorpusReader(CorpusReader):
 		"""
 		:returns: a list of strings containing the raw representation of
 			trees in the treebank."""
-		if self._block_cache is None:
-			self._block_cache = OrderedDict(self._read_blocks())
-		return self._block_cache
+		return OrderedDict(self._read_blocks())
 
 	def _read_blocks(self):
 		"""Read corpus and yield blocks corresponding to each sentence."""
@@ -451,6 +713,155 @@ class DactCorpusReader(AlpinoCorpusReader):
 				yield entry.name(), entry.contents()
 
 
+class BinaryCorpusReader(CorpusReader):
+	"""Corpus reader for treebanks in a compact binary format.
+
+	A treebank in any other format can be converted with
+	``writebinarycorpus()`` or ``discodop treetransforms --outputfmt=binary``.
+	Tree structure, labels, words, and the fields of the export format
+	(lemmas, tags, morphology, functions, secondary edges) are stored in
+	columns of integers, with the offsets of each sentence. The file is
+	memory-mapped, so that processes share its pages, and sentences are read
+	directly by their position without parsing the rest of the corpus."""
+	_indexed = True
+
+	def blocks(self):
+		return OrderedDict((n, self._strblock(n, a))
+				for n, a in self._read_blocks())
+
+	def _read_blocks(self):
+		return self._sliceblocks()
+
+	def get(self, key):
+		self._getindex()
+		return self._parsetree(self._block(self._indexpos[key]))
+
+	def __len__(self):
+		self._getindex()
+		return self._numblocks
+
+	def _getindex(self):
+		"""Open the corpus files.
+
+		I.e., for each file a ``_BinaryTreebankFile`` object."""
+		if self._index is None:
+			index, indexpos, first = [], {}, 0
+			for filename in self._filenames:
+				treebank = _BinaryTreebankFile(filename, first)
+				for n, key in enumerate(treebank.keys, first):
+					if key in indexpos:
+						raise ValueError('duplicate sentence ID: %s' % key)
+					indexpos[key] = n
+				index.append(treebank)
+				first += len(treebank.keys)
+			self._index, self._indexpos = index, indexpos
+			self._firstblocks = [a.first for a in index]
+			self._numblocks = first
+		return self._index
+
+	def _block(self, pos):
+		"""Find the file with the sentence at position ``pos`` of the corpus.
+
+		:returns: the tuple ``(treebank, n)`` for the sentence."""
+		treebank = self._index[bisect_right(self._firstblocks, pos) - 1]
+		return treebank, pos - treebank.first
+
+	def _sliceblocks(self, start=None, end=None):
+		self._getindex()
+		for pos in range(*slice(start, end).indices(self._numblocks)):
+			treebank, n = self._block(pos)
+			yield treebank.keys[n], (treebank, n)
+
+	def _strblock(self, n, block):
+		tree, sent = self._parse(block)
+		return writeexporttree(tree, sent, n, None, None)
+
+	def _parse(self, block):
+		treebank, n = block
+		start, end = treebank.column('treeoffsets', n, n + 2)
+		labels = treebank.column('labels', start, end)
+		ends = treebank.column('ends', start, end)
+		start, end = treebank.column('nodeoffsets', n, n + 2)
+		fields = list(zip(*[treebank.column(name, start, end) for name in
+				('word', 'lemma', 'tag', 'morph', 'func', 'parent')]))
+		secedges = treebank.column('secedges', start, end)
+		strings, tolabel = treebank.strings, treebank.labels
+		sent = [strings[a] if a >= 0 else None for a in treebank.column(
+				'words', *treebank.column('sentoffsets', n, n + 2))]
+		preterminals = []
+		nodes = count()
+		nosource = (-1, ) * 6
+
+		def getnode(m):
+			"""Create node m and its descendants."""
+			k = next(nodes)
+			children = []
+			child = m + 1
+			while child < ends[m]:
+				if labels[child] < 0:
+					children.append(-labels[child] - 1)
+					child += 1
+				else:
+					children.append(getnode(child))
+					child = ends[child]
+			node = ParentedTree(tolabel[labels[m]], children)
+			if fields[k] != nosource:
+				node.source = tuple(strings[a] if a >= 0
+						else (sent[children[0]] if a == -2 else None)
+						for a in fields[k])
+				if secedges[k] >= 0:
+					node.source += tuple(strings[secedges[k]].split('\t'))
+				if children and not isinstance(children[0], Tree):
+					preterminals.append(node)
+			return node
+
+		tree = getnode(0)
+		for node in preterminals:
+			handlemorphology(self.morphology, self.lemmas, node, node.source,
+					sent)
+		handlefunctions(self.functions, tree, morphology=self.morphology)
+		return tree, sent
+
+	def __getstate__(self):
+		# memory maps cannot be pickled; reopen the files when necessary.
+		state = self.__dict__.copy()
+		state['_index'] = state['_indexpos'] = state['_firstblocks'] = None
+		return state
+
+
+class _BinaryTreebankFile(object):
+	"""A memory-mapped file in the format of ``BinaryCorpusReader``."""
+	def __init__(self, filename, first=0):
+		with open(filename, 'rb') as inp:
+			if inp.read(len(BINARYMAGIC)) != BINARYMAGIC:
+				raise ValueError('not a binary treebank: %r' % filename)
+			self.data = mmap.mmap(inp.fileno(), 0, access=mmap.ACCESS_READ)
+		offset = len(BINARYMAGIC)
+		headeroffset, = struct.unpack(str('<Q'),
+				self.data[offset:offset + 8])
+		header = pickle.loads(self.data[headeroffset:])
+		self.keys = header['keys']
+		self.labels = header['labels']
+		self.strings = header['strings']
+		self.columns = header['columns']
+		self.byteswap = header['byteorder'] != sys.byteorder
+		self.first = first  # position of first sentence in the corpus
+		for name, (_, typecode, itemsize) in self.columns.items():
+			if array(typecode).itemsize != itemsize:
+				raise ValueError('%r: column %s has %d-byte integers; '
+						'expected %d bytes.' % (filename, name, itemsize,
+						array(typecode).itemsize))
+
+	def column(self, name, start, end):
+		""":returns: an array with the items ``start...end`` of a column."""
+		pos, typecode, itemsize = self.columns[name]
+		result = array(typecode, self.data[pos + start * itemsize:
+				pos + end * itemsize])
+		if self.byteswap:
+			result.byteswap()
+		return result
+
+
 def brackettree(treestr, sent, brackets, strtermre):
 	"""Parse a single tree presented in (disc)bracket format.
 
@@ -597,11 +1008,21 @@ def writetree(tree, sent, n, fmt,
 	Lemmas, functions, and morphology information will be empty unless nodes
 	contain a 'source' attribute with such information."""
 	if fmt == 'bracket':
-		result = INDEXRE.sub(
-				lambda x: ' %s)' % quote(sent[int(x.group()[:-1])]),
-				'%s\n' % tree)
+		result = None
+		if isinstance(tree, Tree):
+			try:
+				result = '%s\n' % writebrackettree(
+						tree, [quote(a) for a in sent])
+			except TypeError:  # terminals are not integer indices
+				pass
+		if result is None:  # e.g., tree given as string
+			result = INDEXRE.sub(
+					lambda x: ' %s)' % quote(sent[int(x.group()[:-1])]),
+					'%s\n' % tree)
 	elif fmt == 'discbracket':
-		result = '%s\t%s\n' % (tree, ' '.join(map(quote, sent)))
+		result = '%s\t%s\n' % (writebrackettree(tree)
+				if isinstance(tree, Tree) else tree,
+				' '.join(map(quote, sent)))
 	elif fmt == 'tokens':
 		result = '%s\n' % ' '.join(sent)
 	elif fmt == 'wordpos':
@@ -624,24 +1045,174 @@ def writetree(tree, sent, n, fmt,
 	return result
 
 
+def writetrees(out, trees, fmt, comment=None, headrules=None,
+		morphology=None, batchsize=256, flush=False):
+	"""Write an iterable of trees to a file in the given treebank format.
+
+	:param out: a file object opened for writing text.
+	:param trees: an iterable of tuples ``(tree, sent, n)``, with arguments
+		as for ``writetree()``.
+	:param fmt, comment, headrules, morphology: cf. ``writetree()``.
+	:param batchsize: the number of trees that are formatted before the
+		result is written to ``out`` with a single call.
+	:param flush: if True, flush ``out`` after each batch.
+	:returns: the number of trees written."""
+	cnt = 0
+	batch = []
+	for tree, sent, n in trees:
+		batch.append(writetree(tree, sent, n, fmt, comment=comment,
+				headrules=headrules, morphology=morphology))
+		if len(batch) >= batchsize:
+			out.write(''.join(batch))
+			cnt += len(batch)
+			batch = []
+			if flush:
+				out.flush()
+	if batch:
+		out.write(''.join(batch))
+		cnt += len(batch)
+		if flush:
+			out.flush()
+	return cnt
+
+
+def writebinarycorpus(filename, trees):
+	"""Write trees to a file in the format of ``BinaryCorpusReader``.
+
+	:param trees: an iterable of tuples ``(tree, sent, n)``; cf.
+		``writetrees()``.
+	:returns: the number of trees written."""
+	labels, strings = LabelTable(), LabelTable()
+	columns = OrderedDict((name, array(str('i'))) for name in BINARYCOLUMNS)
+	for name in ('treeoffsets', 'nodeoffsets', 'sentoffsets'):
+		columns[name].append(0)
+	fields = [columns[name] for name in
+			('word', 'lemma', 'tag', 'morph', 'func', 'parent')]
+	keys = []
+
+	def visit(node, start, sent):
+		"""Add node and its descendants in preorder.
+
+		The ends of nodes are relative to the position ``start`` of the
+		root."""
+		n = len(columns['labels'])
+		if not isinstance(node, Tree):
+			columns['labels'].append(-node - 1)
+			columns['ends'].append(n + 1 - start)
+			return
+		columns['labels'].append(labels.getid(node.label))
+		columns['ends'].append(0)
+		source = getattr(node, 'source', None) or ()
+		for m, column in enumerate(fields):
+			if len(source) <= m or source[m] is None:
+				column.append(-1)
+			elif (m == WORD and len(node) == 1
+					and not isinstance(node[0], Tree)
+					and source[m] == sent[node[0]]):
+				column.append(-2)
+			else:
+				column.append(strings.getid(source[m]))
+		columns['secedges'].append(strings.getid('\t'.join(source[6:]))
+				if len(source) > 6 else -1)
+		for child in node:
+			visit(child, start, sent)
+		columns['ends'][n] = len(columns['labels']) - start
+
+	for tree, sent, n in trees:
+		keys.append(n)
+		visit(tree, len(columns['labels']), sent)
+		columns['words'].extend(strings.getid(word) if word is not None
+				else -1 for word in sent)
+		columns['treeoffsets'].append(len(columns['labels']))
+		columns['nodeoffsets'].append(len(columns['lemma']))
+		columns['sentoffsets'].append(len(columns['words']))
+	# store each column with the smallest type that fits its values
+	for name, column in columns.items():
+		for typecode in ('b', 'h'):
+			bits = 8 * array(str(typecode)).itemsize - 1
+			if column and -2 ** bits <= min(column) and max(column) < 2 ** bits:
+				columns[name] = array(str(typecode), column)
+				break
+	offsets, offset = {}, len(BINARYMAGIC) + 8
+	for name, column in columns.items():
+		offsets[name] = (offset, column.typecode, column.itemsize)
+		offset += len(column) * column.itemsize
+	with open(filename, 'wb') as out:
+		out.write(BINARYMAGIC)
+		out.write(struct.pack(str('<Q'), offset))
+		for column in columns.values():
+			column.tofile(out)
+		pickle.dump(dict(keys=keys, labels=labels.tolabel,
+				strings=strings.tolabel, columns=offsets,
+				byteorder=sys.byteorder), out, protocol=2)
+	return len(keys)
+
+
+def writebrackettree(tree, sent=None):
+	"""Return tree as a string in bracket notation, without line breaks.
+
+	Equivalent to ``str(tree)``, except that when ``sent`` is given, the
+	terminals are replaced by the corresponding words of ``sent``.
+
+	:raises TypeError: if ``sent`` is given and a terminal is not an integer
+		index."""
+	def flat(node):
+		"""Recursively format ``node``."""
+		return '(%s %s)' % (
+				node.label if isinstance(node.label, basestring)
+				else '%r' % node.label,
+				' '.join([flat(child) if isinstance(child, Tree)
+				else child if isinstance(child, basestring)
+				else '/'.join(child) if isinstance(child, tuple)
+				else '%r' % child for child in node]))
+
+	def withwords(node):
+		"""Recursively format ``node`` with words from ``sent``."""
+		return '(%s %s)' % (
+				node.label if isinstance(node.label, basestring)
+				else '%r' % node.label,
+				' '.join([withwords(child) if isinstance(child, Tree)
+				else sent[child] for child in node]))
+	if sent is None:
+		return flat(tree)
+	return withwords(tree)
+
+
 def writeexporttree(tree, sent, n, comment, morphology):
 	"""Return string with given tree in Negra's export format."""
 	result = []
 	if n is not None:
 		cmt = (' %% ' + comment) if comment else ''
 		result.append('#BOS %s%s' % (n, cmt))
-	indices = tree.treepositions('leaves')
-	wordsandpreterminals = indices + [a[:-1] for a in indices]
-	phrasalnodes = [a for a in tree.treepositions('postorder')
-			if a not in wordsandpreterminals and a != ()]
-	wordids = {tree[a]: a for a in indices}
-	assert len(sent) == len(indices) == len(wordids), (
+	# collect in a single traversal: phrasal nodes (i.e., excluding the root
+	# and preterminals) in postorder, and the preterminal of each terminal;
+	# both with their parents.
+	phrasalnodes, wordids = [], {}
+	numleaves = [0]
+
+	def traverse(node, parent):
+		"""Visit the nodes of ``tree`` in postorder."""
+		preterminal = False
+		for child in node:
+			if isinstance(child, Tree):
+				traverse(child, node)
+			else:
+				preterminal = True
+				numleaves[0] += 1
+				wordids[child] = node, parent
+		if not preterminal and parent is not None:
+			phrasalnodes.append((node, parent))
+
+	traverse(tree, None)
+	nodeids = {id(node): str(500 + m)
+			for m, (node, _) in enumerate(phrasalnodes)}
+	nodeids[id(tree)] = nodeids[id(None)] = '0'
+	assert len(sent) == numleaves[0] == len(wordids), (
 			n, str(tree), sent, wordids.keys())
 	for i, word in enumerate(sent):
 		if not word:
 			raise ValueError('empty word in sentence: %r' % sent)
-		idx = wordids[i]
-		node = tree[idx[:-1]]
+		node, parent = wordids[i]
 		lemma = '--'
 		postag = node.label.replace('$[', '$(') or '--'
 		func = morphtag = '--'
@@ -655,13 +1226,10 @@ def writeexporttree(tree, sent, n, comment, morphology):
 			morphtag = postag
 		elif morphtag == '--' and morphology == 'add' and '/' in postag:
 			postag, morphtag = postag.split('/', 1)
-		nodeid = str(500 + phrasalnodes.index(idx[:-2])
-				if len(idx) > 2 else 0)
+		nodeid = nodeids[id(parent)]
 		result.append("\t".join((word, lemma, postag, morphtag, func,
 				nodeid) + tuple(secedges)))
-	for idx in phrasalnodes:
-		node = tree[idx]
-		parent = '#%d' % (500 + phrasalnodes.index(idx))
+	for node, parent in phrasalnodes:
 		lemma = '--'
 		label = node.label or '--'
 		func = morphtag = '--'
@@ -670,10 +1238,8 @@ def writeexporttree(tree, sent, n, comment, morphology):
 			morphtag = node.source[MORPH] or '--'
 			func = node.source[FUNC] or '--'
 			secedges = node.source[6:]
-		nodeid = str(500 + phrasalnodes.index(idx[:-1])
-				if len(idx) > 1 else 0)
-		result.append('\t'.join((parent, lemma, label, morphtag, func,
-				nodeid) + tuple(secedges)))
+		result.append('\t'.join(('#' + nodeids[id(node)], lemma, label,
+				morphtag, func, nodeids[id(parent)]) + tuple(secedges)))
 	if n is not None:
 		result.append("#EOS %s" % n)
 	return "%s\n" % "\n".join(result)
@@ -1012,14 +1578,17 @@ READERS = OrderedDict((('export', NegraCorpusReader),
 		('bracket', BracketCorpusReader),
 		('discbracket', DiscBracketCorpusReader),
 		('tiger', TigerXMLCorpusReader),
-		('alpino', AlpinoCorpusReader), ('dact', DactCorpusReader)))
+		('alpino', AlpinoCorpusReader), ('dact', DactCorpusReader),
+		('binary', BinaryCorpusReader)))
 WRITERS = ('export', 'bracket', 'discbracket', 'dact',
 		'conll', 'mst', 'tokens', 'wordpos')
 
 __all__ = ['CorpusReader', 'BracketCorpusReader', 'DiscBracketCorpusReader',
 		'NegraCorpusReader', 'AlpinoCorpusReader', 'TigerXMLCorpusReader',
-		'DactCorpusReader', 'brackettree', 'exporttree', 'exportsplit',
-		'alpinotree', 'writetree', 'writeexporttree', 'writealpinotree',
-		'writedependencies', 'dependencies', 'makedep', 'handlefunctions',
-		'handlemorphology', 'incrementaltreereader', 'segmentbrackets',
-		'segmentexport', 'quote', 'unquote', 'treebankfanout', 'numbase']
+		'DactCorpusReader', 'BinaryCorpusReader', 'brackettree', 'exporttree',
+		'exportsplit', 'alpinotree', 'writetree', 'writetrees',
+		'writebinarycorpus', 'writebrackettree', 'writeexporttree',
+		'writealpinotree', 'writedependencies', 'dependencies', 'makedep',
+		'handlefunctions', 'handlemorphology', 'incrementaltreereader',
+		'segmentbrackets', 'segmentexport', 'quote', 'unquote',
+		'treebankfanout', 'numbase']
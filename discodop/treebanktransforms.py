@@ -21,6 +21,7 @@ NEGRACONSTUNARY = dict(zip('CNP NM PN'.split(), repeat('NP')))
 NUMBERRE = re.compile('^[0-9]+(?:[,.][0-9]+)*$')
 DERE = re.compile("^([Dd]es?|du|d')$")
 PPORNP = re.compile('^(NP|PP)+PP$')
+VPHEADSPLIT = {'VB': 'HINF', 'TO': 'HTO', 'VBN': 'HPART', 'VBG': 'HPART'}
 
 
 def transform(tree, sent, transformations):
@@ -35,9 +36,14 @@ def transform(tree, sent, transformations):
 	:alpino: ``transformations=('PUNCT', )``
 	:ftb:
 			``transformations=('markinf markpart de2 markp1 mwadvs mwadvsel1 '
-			'mwadvsel2 mwnsel1 mwnsel2 PUNCT tagpa').split()``"""
-	for name in transformations:
-		if name == 'APPEND-FUNC':  # add function to phrasal label
+			'mwadvsel2 mwnsel1 mwnsel2 PUNCT tagpa').split()``
+
+	Consecutive transformations which only add state splits are applied in a
+	single traversal of the tree; cf. ``compiletransforms()``."""
+	for name in compiletransforms(transformations):
+		if isinstance(name, tuple):  # fused node transformations
+			nodetransforms(tree, sent, *name)
+		elif name == 'APPEND-FUNC':  # add function to phrasal label
 			for a in tree.subtrees():
 				func = function(a)
 				if func and func != '--':
@@ -67,16 +73,8 @@ def transform(tree, sent, transformations):
 					lemma = quote(a.source[LEMMA])
 				a[:] = [a.__class__(lemma,
 						[a.pop() for _ in range(len(a))][::-1])]
-		elif name == 'NP-PP':  # mark PPs under NPs
-			for pp in tree.subtrees(lambda n: n.label == 'PP'
-					and n.parent.label == 'NP'):
-				pp.label += STATESPLIT + 'NP'
 		elif name == 'FOLD-NUMBERS':
 			sent[:] = ['000' if NUMBERRE.match(a) else a for a in sent]
-		elif name == 'PUNCT':  # distinguish sentence-ending punctuation.
-			for punct in tree.subtrees(lambda n: isinstance(n[0], int)
-					and sent[n[0]] in '.?!'):
-				punct.label += STATESPLIT + sent[punct[0]]
 		elif name == 'FANOUT':  # add fan-out markers
 			from discodop.treetransforms import addfanoutmarkers
 			addfanoutmarkers(tree)
@@ -86,20 +84,14 @@ def transform(tree, sent, transformations):
 			pass
 		else:
 			raise ValueError('unrecognized transformation %r' % name)
-	for a in reversed(list(tree.subtrees(lambda x: len(x) > 1))):
-		a.sort(key=Tree.leaves)
+	sortchildren(tree)
 	return tree
 
 
-def negratransforms(name, tree, _sent):
+def negratransforms(name, tree, sent):
 	"""Negra / Tiger transforms."""
-	if name == 'S-RC':  # relative clause => S becomes SRC
-		for s in tree.subtrees(lambda n: n.label == 'S'
-				and function(n) == 'RC'):
-			s.label += STATESPLIT + 'RC'
-	elif name == 'NP':  # case
-		for np in tree.subtrees(lambda n: n.label == 'NP'):
-			np.label += STATESPLIT + function(np)
+	if name in ('S-RC', 'NP', 'VP-GF'):
+		nodetransforms(tree, sent, *compiletransforms((name, ))[0])
 	elif name == 'PP-NP':  # un-flatten PPs by introducing NPs
 		addtopp = ('AC', )
 		for pp in tree.subtrees(lambda n: n.label == 'PP'):
@@ -134,9 +126,6 @@ def negratransforms(name, tree, _sent):
 					np1 = np[1:]
 					np[1:] = []
 					np[1:] = [ParentedTree('NP', np1)]
-	elif name == 'VP-GF':  # VP category split based on head
-		for vp in tree.subtrees(lambda n: n.label == 'VP'):
-			vp.label += STATESPLIT + function(vp)
 	elif name == 'VP-FIN_NEGRA':  # introduce finite VP at S level
 		# collect objects and modifiers
 		# introduce new S level for discourse markers
@@ -219,37 +208,14 @@ def negratransforms(name, tree, _sent):
 	return True
 
 
-def wsjtransforms(name, tree, _sent):
+def wsjtransforms(name, tree, sent):
 	"""Transforms for WSJ section of Penn treebank."""
-	if name == 'S-WH':
-		for sbar in tree.subtrees(lambda n: n.label == 'SBAR'):
-			for s in sbar:
-				if (s.label == 'S'
-						and any(a.label.startswith('WH') for a in s)):
-					s.label += STATESPLIT + 'WH'
-	elif name == 'VP-HD':  # VP category split based on head
-		for vp in tree.subtrees(lambda n: n.label == 'VP'):
-			hd = [x for x in vp if ishead(x)].pop()
-			if hd.label == 'VB':
-				vp.label += STATESPLIT + 'HINF'
-			elif hd.label == 'TO':
-				vp.label += STATESPLIT + 'HTO'
-			elif hd.label in ('VBN', 'VBG'):
-				vp.label += STATESPLIT + 'HPART'
-	elif name == 'S-INF':
-		for s in tree.subtrees(lambda n: n.label == 'S'):
-			hd = [x for x in s if ishead(x)].pop()
-			if hd.label in ('VP' + STATESPLIT + 'HINF',
-					'VP' + STATESPLIT + 'HTO'):
-				s.label += STATESPLIT + 'INF'
+	if name in ('S-WH', 'VP-HD', 'S-INF', 'MARK-UNARY'):
+		nodetransforms(tree, sent, *compiletransforms((name, ))[0])
 	elif name == 'VP-FIN_WSJ':  # add disc. finite VP when verb is under S
 		for s in tree.subtrees(lambda n: n.label == 'S'):
 			if not any(a.label.startswith('VP') for a in s):
 				raise NotImplementedError
-	elif name == 'MARK-UNARY':  # add -U to unary nodes to avoid cycles
-		for unary in tree.subtrees(lambda n: len(n) == 1
-				and isinstance(n[0], Tree)):
-			unary.label += STATESPLIT + 'U'
 	else:
 		return False
 	return True
@@ -259,37 +225,14 @@ def ftbtransforms(name, tree, sent):
 	"""Port of manual FTB enrichments specified in Stanford parser.
 
 	cf. ``FrenchTreebankParserParams.java``"""
-	if name == 'markinf':
-		for t in tree.subtrees(lambda n: strip(n.label) == "V"
-				and isinstance(n.parent, Tree)
-				and isinstance(n.parent.parent, Tree)
-				and strip(n.parent.label) == "VN"
-				and strip(n.parent.parent.label) == "VPinf"):
-			t.label += "^infinitive"
-	elif name == 'markpart':
-		for t in tree.subtrees(lambda n: strip(n.label) == "V"
-				and isinstance(n.parent, Tree)
-				and isinstance(n.parent.parent, Tree)
-				and strip(n.parent.label) == "VN"
-				and strip(n.parent.parent.label) == "VPpart"):
-			t.label += "^participle"
+	if name in ('markinf', 'markpart', 'tagpa', 'coord1', 'de2', 'markp1',
+			'mwadvs', 'mwadvsel1', 'mwadvsel2', 'mwnsel1', 'mwnsel2',
+			'mwnsel3'):
+		nodetransforms(tree, sent, *compiletransforms((name, ))[0])
 	elif name == 'markvn':
 		for t in tree.subtrees(lambda n: strip(n.label) == "VN"):
 			for sub in islice(t.subtrees(), 1, None):
 				sub.label += "^withVN"
-	elif name == 'tagpa':  # Add parent annotation to POS tags
-		for t in tree.subtrees(lambda n:
-				not isinstance(n[0], Tree)
-				and strip(n.label) != "PUNC"):
-			t.label += "^" + t.parent.label
-	elif name == 'coord1':
-		for t in tree.subtrees(lambda n: strip(n.label) == 'COORD'
-				and len(n) >= 2):
-			t.label += "^" + t[1].label
-	elif name == 'de2':
-		for t in tree.subtrees(lambda n: strip(n.label) == 'P'
-				and DERE.match(sent[n[0]])):
-			t.label += "^de2"
 	elif name == 'de3':
 		# @NP|PP|COORD >+(@NP|PP) (@PP <, (@P < /^([Dd]es?|du|d')$/))
 		for t in tree.subtrees(lambda n:
@@ -301,64 +244,248 @@ def ftbtransforms(name, tree, sent):
 							and DERE.match(sent[a[n - 1][0][0]])):
 						t.label += "^de3"
 						break
-	elif name == 'markp1':
-		for t in tree.subtrees(lambda n: strip(n.label) == "P"
-				and strip(n.parent.label) == "PP"
-				and strip(n.parent.parent.label) == "NP"):
-			t.label += "^n"
-	elif name == 'mwadvs':
-		for t in tree.subtrees(lambda n: strip(n.label) == "MWADV"
-				and "S" in n.parent.label):
-			t.label += "^mwadv-s"
-	elif name == 'mwadvsel1':
-		for t in tree.subtrees(lambda n: strip(n.label) == "MWADV"
-				and len(n) == 2
-				and strip(n[0].label) == "P"
-				and strip(n[1].label) == "N"):
-			t.label += "^mwadv1"
-	elif name == 'mwadvsel2':
-		for t in tree.subtrees(lambda n: strip(n.label) == "MWADV"
-				and len(n) == 3
-				and strip(n[0].label) == "P"
-				and strip(n[1].label) == "D"
-				and strip(n[2].label) == "N"):
-			t.label += "^mwadv2"
-	elif name == 'mwnsel1':
-		for t in tree.subtrees(lambda n: strip(n.label) == "MWN"
-				and len(n) == 2
-				and strip(n[0].label) == "N"
-				and strip(n[1].label) == "A"):
-			t.label += "^mwn1"
-	elif name == 'mwnsel2':
-		for t in tree.subtrees(lambda n: strip(n.label) == "MWN"
-				and len(n) == 3
-				and strip(n[0].label) == "N"
-				and strip(n[1].label) == "P"
-				and strip(n[2].label) == "N"):
-			t.label += "^mwn2"
-	elif name == 'mwnsel3':  # noun-noun compound joined with dash.
-		for t in tree.subtrees(lambda n: strip(n.label) == "MWN"
-				and len(n) == 3
-				and strip(n[0].label) == "N"
-				and sent[n[1][0]] == "-"
-				and strip(n[2].label) == "N"):
-			t.label += "^mwn3"
 	else:
 		return False
 	return True
 
 
+# Transformations which add a state split to the label of a single node,
+# given that node, its parent and children, and the labels of other nodes
+# without state splits. name => (labels, parent, children, func) where:
+# - labels: labels (without state splits) of the nodes func applies to,
+# 	or None for any node.
+# - parent, children: labels (without state splits) of the parent or
+# 	children whose complete label is inspected by func; None for any label.
+# - func(node, sent): returns the state split to add to the label of node,
+# 	or None.
+NODETRANSFORMS = {
+		# mark PPs under NPs
+		'NP-PP': (('PP', ), ('NP', ), (), lambda n, _:
+			'NP' if n.label == 'PP' and n.parent.label == 'NP' else None),
+		# distinguish sentence-ending punctuation.
+		'PUNCT': (None, (), (), lambda n, sent:
+			sent[n[0]] if isinstance(n[0], int) and sent[n[0]] in '.?!'
+			else None),
+		# Negra / Tiger
+		# relative clause => S becomes SRC
+		'S-RC': (('S', ), (), (), lambda n, _:
+			'RC' if n.label == 'S' and function(n) == 'RC' else None),
+		# case
+		'NP': (('NP', ), (), (), lambda n, _:
+			function(n) if n.label == 'NP' else None),
+		# VP category split based on head
+		'VP-GF': (('VP', ), (), (), lambda n, _:
+			function(n) if n.label == 'VP' else None),
+		# WSJ
+		'S-WH': (('S', ), ('SBAR', ), (), lambda n, _:
+			'WH' if n.label == 'S' and n.parent is not None
+			and n.parent.label == 'SBAR'
+			and any(a.label.startswith('WH') for a in n) else None),
+		# VP category split based on head
+		'VP-HD': (('VP', ), (), tuple(VPHEADSPLIT), lambda n, _:
+			VPHEADSPLIT.get([x for x in n if ishead(x)].pop().label)
+			if n.label == 'VP' else None),
+		'S-INF': (('S', ), (), ('VP', ), lambda n, _:
+			'INF' if n.label == 'S' and [x for x in n if ishead(x)].pop().label
+			in ('VP' + STATESPLIT + 'HINF', 'VP' + STATESPLIT + 'HTO')
+			else None),
+		# add -U to unary nodes to avoid cycles
+		'MARK-UNARY': (None, (), (), lambda n, _:
+			'U' if len(n) == 1 and isinstance(n[0], Tree) else None),
+		# FTB
+		'markinf': (('V', ), (), (), lambda n, _:
+			'infinitive' if isinstance(n.parent, Tree)
+			and isinstance(n.parent.parent, Tree)
+			and strip(n.parent.label) == "VN"
+			and strip(n.parent.parent.label) == "VPinf" else None),
+		'markpart': (('V', ), (), (), lambda n, _:
+			'participle' if isinstance(n.parent, Tree)
+			and isinstance(n.parent.parent, Tree)
+			and strip(n.parent.label) == "VN"
+			and strip(n.parent.parent.label) == "VPpart" else None),
+		# Add parent annotation to POS tags
+		'tagpa': (None, None, (), lambda n, _:
+			n.parent.label if not isinstance(n[0], Tree)
+			and strip(n.label) != "PUNC" else None),
+		'coord1': (('COORD', ), (), None, lambda n, _:
+			n[1].label if len(n) >= 2 else None),
+		'de2': (('P', ), (), (), lambda n, sent:
+			'de2' if DERE.match(sent[n[0]]) else None),
+		'markp1': (('P', ), (), (), lambda n, _:
+			'n' if strip(n.parent.label) == "PP"
+			and strip(n.parent.parent.label) == "NP" else None),
+		'mwadvs': (('MWADV', ), None, (), lambda n, _:
+			'mwadv-s' if "S" in n.parent.label else None),
+		'mwadvsel1': (('MWADV', ), (), (), lambda n, _:
+			'mwadv1' if len(n) == 2
+			and strip(n[0].label) == "P"
+			and strip(n[1].label) == "N" else None),
+		'mwadvsel2': (('MWADV', ), (), (), lambda n, _:
+			'mwadv2' if len(n) == 3
+			and strip(n[0].label) == "P"
+			and strip(n[1].label) == "D"
+			and strip(n[2].label) == "N" else None),
+		'mwnsel1': (('MWN', ), (), (), lambda n, _:
+			'mwn1' if len(n) == 2
+			and strip(n[0].label) == "N"
+			and strip(n[1].label) == "A" else None),
+		'mwnsel2': (('MWN', ), (), (), lambda n, _:
+			'mwn2' if len(n) == 3
+			and strip(n[0].label) == "N"
+			and strip(n[1].label) == "P"
+			and strip(n[2].label) == "N" else None),
+		# noun-noun compound joined with dash.
+		'mwnsel3': (('MWN', ), (), (), lambda n, sent:
+			'mwn3' if len(n) == 3
+			and strip(n[0].label) == "N"
+			and sent[n[1][0]] == "-"
+			and strip(n[2].label) == "N" else None),
+		}
+COMPILEDTRANSFORMS = {}
+
+
+def compiletransforms(transformations):
+	"""Compile a sequence of transformation names into traversals of a tree.
+
+	Consecutive transformations listed in ``NODETRANSFORMS`` are fused into a
+	single traversal, with a table mapping labels to the transformations
+	that apply to them; other transformations form a step by themselves.
+	Transformations are only fused when the result is identical to applying
+	them one after another.
+
+	:returns: a tuple of steps; each step is either the name of a
+		transformation, or a tuple of arguments for ``nodetransforms()``.
+		The result is cached."""
+	key = tuple(transformations)
+	if key in COMPILEDTRANSFORMS:
+		return COMPILEDTRANSFORMS[key]
+	steps, names = [], []
+	for name in key:
+		if name not in NODETRANSFORMS:
+			if names:
+				steps.append(dispatchtable(names))
+				names = []
+			steps.append(name)
+		elif names and traversalorder(names + [name]) is None:
+			steps.append(dispatchtable(names))
+			names = [name]
+		else:
+			names.append(name)
+	if names:
+		steps.append(dispatchtable(names))
+	COMPILEDTRANSFORMS[key] = tuple(steps)
+	return COMPILEDTRANSFORMS[key]
+
+
+def traversalorder(names):
+	"""Find a traversal in which node transformations can be fused.
+
+	In a preorder traversal, the parent of a node has already received all
+	state splits while its children have received none; in a postorder
+	traversal it is the other way around. When applied one after another,
+	the parent has received the splits of preceding transformations and
+	the current one, while the children have received those of preceding
+	transformations only. Fusing is possible when the difference does not
+	affect the labels that a transformation inspects.
+
+	:returns: 'preorder', 'postorder', or None if neither is possible."""
+	specs = [NODETRANSFORMS[name] for name in names]
+
+	def overlaps(inspected, labels):
+		"""Test whether inspected labels may be changed."""
+		return inspected != () and (inspected is None or labels is None
+				or not set(inspected).isdisjoint(labels))
+
+	if not any(overlaps(children, labels)
+			for n, (_, _, children, _) in enumerate(specs)
+				for labels, _, _, _ in specs[:n]) and not any(
+			overlaps(parent, labels)
+			for n, (_, parent, _, _) in enumerate(specs)
+				for labels, _, _, _ in specs[n + 1:]):
+		return 'preorder'
+	elif not any(overlaps(children, labels)
+			for n, (_, _, children, _) in enumerate(specs)
+				for labels, _, _, _ in specs[n:]) and not any(
+			overlaps(parent, labels)
+			for n, (_, parent, _, _) in enumerate(specs)
+				for labels, _, _, _ in specs[:n + 1]):
+		return 'postorder'
+	return None
+
+
+def dispatchtable(names):
+	"""Create arguments for ``nodetransforms()`` to fuse transformations."""
+	specs = [NODETRANSFORMS[name] for name in names]
+	table = {label: [func for labels, _, _, func in specs
+				if labels is None or label in labels]
+			for labels, _, _, _ in specs if labels is not None
+				for label in labels}
+	default = [func for labels, _, _, func in specs if labels is None]
+	return table, default, traversalorder(names) == 'postorder'
+
+
+def nodetransforms(tree, sent, table, default, postorder=False):
+	"""Apply node transformations in a single traversal of tree.
+
+	:param table: a dictionary mapping labels (without state splits) to a
+		list of functions from ``NODETRANSFORMS``.
+	:param default: the list of functions for nodes with any other label.
+	:param postorder: if True, visit the children of a node before the node
+		itself; otherwise, visit the node first."""
+	nodes = [tree]
+	for node in nodes:
+		nodes.extend(child for child in node if isinstance(child, Tree))
+	for node in reversed(nodes) if postorder else nodes:
+		label = node.label
+		for func in table.get(label[:label.index(STATESPLIT)]
+				if STATESPLIT in label else label, default):
+			split = func(node, sent)
+			if split is not None:
+				node.label += STATESPLIT + split
+
+
+def sortchildren(tree):
+	"""Sort the children of each node by their leaves, bottom-up.
+
+	Equivalent to ``a.sort(key=Tree.leaves)`` for each node ``a``, visiting
+	descendants before ancestors, but collects the leaves only once.
+
+	:returns: the leaves of ``tree`` in the new order."""
+	childleaves = [sortchildren(child) if isinstance(child, Tree)
+			else [child] for child in tree]
+	if len(tree) > 1:
+		keys = {id(child): leaves for child, leaves in zip(tree, childleaves)}
+		tree.sort(key=lambda child: keys[id(child)])
+		childleaves.sort()
+	return [leaf for leaves in childleaves for leaf in leaves]
+
+
+def collectleaves(tree, result):
+	"""Store the leaves of each node of tree in the dictionary ``result``.
+
+	:returns: the leaves of ``tree``; ``result`` is indexed by ``id(node)``.
+	"""
+	leaves = result[id(tree)] = []
+	for child in tree:
+		if isinstance(child, Tree):
+			leaves.extend(collectleaves(child, result))
+		else:
+			leaves.append(child)
+	return leaves
+
+
 def reversetransform(tree, transformations):
 	"""Undo specified transformations and remove state splits marked by ``^``.
 
 	Do not apply twice (might remove VPs which shouldn't be)."""
-	# Generic state-split removal
-	for node in tree.subtrees(lambda n: STATESPLIT in n.label[1:]):
-		node.label = node.label[:node.label.index(STATESPLIT, 1)]
-
-	# restore linear precedence ordering
-	for a in tree.subtrees(lambda n: len(n) > 1):
-		a.sort(key=lambda n: n.leaves())
+	# Generic state-split removal & restore linear precedence ordering
+	leaves = {}
+	collectleaves(tree, leaves)
+	for node in tree.subtrees():
+		if STATESPLIT in node.label[1:]:
+			node.label = node.label[:node.label.index(STATESPLIT, 1)]
+		if len(node) > 1:
+			node.sort(key=lambda n: leaves[id(n)])
 	for name in reversed(transformations):
 		if name == 'FANOUT':
 			from discodop.treetransforms import removefanoutmarkers
@@ -466,8 +593,10 @@ def reversetransform(tree, transformations):
 				a.source[TAG] = a.label
 				a[:] = [a[0].pop() for _ in range(len(a[0]))][::-1]
 	# restore linear precedence ordering
+	leaves.clear()
+	collectleaves(tree, leaves)
 	for a in tree.subtrees(lambda n: len(n) > 1):
-		a.sort(key=lambda n: n.leaves())
+		a.sort(key=lambda n: leaves[id(n)])
 	return tree
 
 
@@ -968,7 +1097,9 @@ def headstats(trees):
 	return heads, unknown, pos1, pos2
 
 
-__all__ = ['transform', 'negratransforms', 'wsjtransforms', 'ftbtransforms',
+__all__ = ['transform', 'negratransforms', 'wsjtransforms',
+		'ftbtransforms', 'compiletransforms', 'traversalorder',
+		'dispatchtable', 'nodetransforms', 'sortchildren', 'collectleaves',
 		'reversetransform', 'collapselabels', 'unifymorphfeat', 'rrtransform',
 		'rrbacktransform', 'removeterminals', 'removeemptynodes', 'ispunct',
 		'punctremove', 'punctremove', 'punctlower', 'punctraise',
@@ -19,13 +19,15 @@ This file contains three main transformations:
 from __future__ import print_function
 import re
 import sys
+import multiprocessing
 from operator import attrgetter
 from itertools import islice
-from collections import defaultdict, Set, Iterable
+from collections import defaultdict, deque, Set, Iterable
 if sys.version[0] >= '3':
 	basestring = str  # pylint: disable=W0622,C0103
-from discodop.tree import Tree, ImmutableTree
-from discodop.treebank import READERS, WRITERS, writetree
+from discodop.tree import Tree, ImmutableTree, CompactTree
+from discodop.treebank import READERS, WRITERS, writetree, writetrees, \
+		writebinarycorpus
 from discodop.grammar import ranges
 try:
 	from discodop.bit import fanout as bitfanout
@@ -46,7 +48,7 @@ where input and output are treebanks; standard in/output is used if not given.
 action is one of:
     none
     binarize [-h x] [-v x] [--factor=left|right]
-    optimalbinarize [-h x] [-v x]
+    optimalbinarize [-h x] [-v x] [--cache]
     unbinarize
     introducepreterminals
     splitdisc [--markorigin]
@@ -95,18 +97,26 @@ options may consist of:
   --rightunary   ... unary productions.
   --tailmarker   mark rightmost child (the head if headrules are applied), to
                  avoid cyclic rules when --leftunary and --rightunary are used.
+  --cache        re-use the optimal binarization of a production for its other
+                 occurrences; the result is the same, but faster.
   --headrules=x  turn on head finding; affects binarization.
                  reads rules from file "x" (e.g., "negra.headrules").
   --markheads    mark heads by adding '-HD' to phrasal labels.
   --reverse      reverse the transformations given by --transform;
   --transforms=x specify names of tree transformations to apply; for possible
                  names, cf. treebanktransforms module.
+  --numproc=n    read, transform, and write chunks of trees with n processes;
+                 0 to use all CPUs [default: 1]. Requires an input file in
+                 one of the formats export, bracket, discbracket, tiger,
+                 or binary.
 
 
 Note: selecting the formats 'conll' or 'mst' results in an unlabeled dependency
     conversion and requires the use of heuristic head rules (--headrules),
     to ensure that all constituents have a child marked as head.''' % (
-			sys.argv[0], '|'.join(READERS), '|'.join(WRITERS))
+			sys.argv[0], '|'.join(READERS), '|'.join(WRITERS + ('binary', )))
+
+INTERNALPARAMS = None
 
 # e.g., 'VP_2*0' group 1: 'VP_2'; group 2: '0'; group 3: ''
 SPLITLABELRE = re.compile(r'(.*)\*(?:([0-9]+)([^!]+![^!]+)?)?$')
@@ -117,7 +127,7 @@ def binarize(tree, factor='right', horzmarkov=999, vertmarkov=1,
 		tailmarker='', leftmostunary=False, rightmostunary=False, threshold=2,
 		artpa=True, reverse=False, ids=None, filterfuncs=(),
 		labelfun=None, dot=False, abbrrepetition=False):
-	"""Binarize a Tree object.
+	"""Binarize a Tree object; a CompactTree is first converted to a Tree.
 
 	:param factor: "left" or "right". Determines whether binarization proceeds
 			from left to right or vice versa.
@@ -182,6 +192,8 @@ def binarize(tree, factor='right', horzmarkov=999, vertmarkov=1,
 		raise ValueError("factor should be 'left' or 'right'.")
 	if labelfun is None:
 		labelfun = attrgetter('label')
+	if isinstance(tree, CompactTree):
+		tree = tree.totree()
 	treeclass = tree.__class__
 	leftmostunary = 1 if leftmostunary else 0
 
@@ -544,33 +556,38 @@ def canonicalize(tree):
 
 
 def optimalbinarize(tree, sep='|', headdriven=False,
-		h=None, v=1, fun=None):
+		h=None, v=1, fun=None, cache=None):
 	"""Recursively binarize a tree, optimizing for given function.
 
 	``v=0`` is not implemented. Setting h to a nonzero integer restricts the
-	possible binarizations to head driven binarizations."""
+	possible binarizations to head driven binarizations.
+
+	:param cache: a ``BinarizationCache`` to re-use the binarizations of
+		productions across trees; cf. ``minimalbinarization()``."""
 	if h is None:
 		tree = Tree.convert(tree)
 		for a in list(tree.subtrees(lambda x: len(x) > 1))[::-1]:
 			a.sort(key=lambda x: x.leaves())
 	return optimalbinarize_(addbitsets(tree), fun or complexityfanout, sep,
-			headdriven, h or 999, v, ())
+			headdriven, h or 999, v, (), cache)
 
 
-def optimalbinarize_(tree, fun, sep, headdriven, h, v, ancestors):
+def optimalbinarize_(tree, fun, sep, headdriven, h, v, ancestors,
+		cache=None):
 	"""Helper function for postorder / bottom-up binarization."""
 	if not isinstance(tree, Tree):
 		return tree
 	parentstr = '^<%s>' % (','.join(ancestors[:v - 1])) if v > 1 else ''
 	newtree = ImmutableTree(tree.label + parentstr,
 		[optimalbinarize_(t, fun, sep, headdriven, h, v,
-			(tree.label,) + ancestors) for t in tree])
+			(tree.label,) + ancestors, cache) for t in tree])
 	newtree.bitset = tree.bitset
 	return minimalbinarization(newtree, fun, sep, parentstr=parentstr, h=h,
-			head=(len(tree) - 1) if headdriven else None)
+			head=(len(tree) - 1) if headdriven else None, cache=cache)
 
 
-def minimalbinarization(tree, score, sep='|', head=None, parentstr='', h=999):
+def minimalbinarization(tree, score, sep='|', head=None, parentstr='', h=999,
+		cache=None):
 	"""Find optimal binarization according to a scoring function.
 
 	Implementation of Gildea (2010): Optimal parsing strategies for linear
@@ -583,6 +600,11 @@ def minimalbinarization(tree, score, sep='|', head=None, parentstr='', h=999):
 		better (the scores can be anything else which supports comparisons).
 	:param head: an optional index of the head node, specifying it enables
 		head-driven binarization (which constrains the possible binarizations).
+	:param cache: an optional ``BinarizationCache``; if the signature of the
+		production is found, the search is skipped and the binarization
+		stored there is rebuilt. The signature consists of the labels,
+		the pattern of the bitsets, and the scores of the children, so
+		``score`` should only depend on these and the bitsets.
 
 	>>> tree = '(X (A 0) (B 1) (C 2) (D 3) (E 4))'
 	>>> tree2 = binarize(Tree.parse(tree, parse_leaf=int))
@@ -613,18 +635,40 @@ def minimalbinarization(tree, score, sep='|', head=None, parentstr='', h=999):
 	# do default right factored binarization instead
 	elif fanout(tree) == 1 and all(fanout(a) == 1 for a in tree):
 		return factorconstituent(tree, sep=sep, h=h)
-	from discodop.plcfrs import Agenda
 	labels = [a.label for a in tree]
-	# the four main datastructures:
+	# for each of the optimal partial binarizations, this dictionary has
+	# a bitset that describes which non-terminals from the input it covers
+	nonterms = {}
+	if cache is not None:
+		key = cache.signature(tree, score, head)
+		if key in cache.binarizations:
+			cache.hits += 1
+
+			def rebuild(node):
+				"""Recreate partial binarizations from child indices."""
+				if not isinstance(node, tuple):
+					return tree[node]
+				a, b = rebuild(node[0]), rebuild(node[1])
+				p = newproduction(a, b)
+				nonterms[p] = nonterms[a] | nonterms[b]
+				return p
+			for n, a in enumerate(tree):
+				nonterms[a] = (1 << n) if head is None else OrderedSet([n])
+			p = ImmutableTree(tree.label, rebuild(cache.binarizations[key])[:])
+			p.bitset = tree.bitset
+			return p
+		cache.misses += 1
+	from discodop.plcfrs import Agenda
+	# the main datastructures:
 	# the agenda is a priority queue of partial binarizations to explore
 	# the first complete binarization that is dequeued is the optimal one
 	agenda = Agenda()
 	# the working set contains all the optimal partial binarizations
 	# keys are binarizations, values are their scores
 	workingset = {}
-	# for each of the optimal partial binarizations, this dictionary has
-	# a bitset that describes which non-terminals from the input it covers
-	nonterms = {}
+	# the keys of the working set in order of insertion; they are visited in
+	# this order, so that the result only depends on the signature of tree.
+	order = []
 	# reverse lookup table for nonterms (from bitsets to binarizations)
 	revnonterms = {}
 	# the goal is a bitset that covers all non-terminals of the input
@@ -635,6 +679,7 @@ def minimalbinarization(tree, score, sep='|', head=None, parentstr='', h=999):
 			revnonterms[nonterms[a]] = a
 			workingset[a] = score(a) + (0,)
 			agenda[a] = workingset[a]
+			order.append(a)
 	else:
 		# head driven binarization:
 		# add all non-head nodes to the working set,
@@ -647,6 +692,7 @@ def minimalbinarization(tree, score, sep='|', head=None, parentstr='', h=999):
 			revnonterms[nonterms[a]] = a
 			if n != head:
 				workingset[a] = score(a) + (0,)
+				order.append(a)
 		for n, a in enumerate(tree):
 			if n == head:
 				continue
@@ -654,22 +700,29 @@ def minimalbinarization(tree, score, sep='|', head=None, parentstr='', h=999):
 			p = newproduction(a, hd)
 			x = score(p)
 			agenda[p] = workingset[p] = x + (x[0],)
+			order.append(p)
 			nonterms[p] = nonterms[a] | nonterms[hd]
 			revnonterms[nonterms[p]] = p
 	while agenda:
 		p, x = agenda.popitem()
 		if nonterms[p] == goal:
 			# (add final unary here)
+			if cache is not None:
+				cache.add(key, tree, p)
 			p = ImmutableTree(tree.label, p[:])
 			p.bitset = tree.bitset
 			return p
-		for p1, y in list(workingset.items()):
+		# drop keys that were replaced by better binarizations
+		candidates = [a for a in order if a in workingset]
+		order[:] = candidates
+		for p1 in candidates:
 			if p1 not in workingset:
 				continue
 			# this is inefficient. we should have a single query for all
 			# items not overlapping with p
 			elif nonterms[p] & nonterms[p1]:
 				continue
+			y = workingset[p1]
 			# if we do head-driven binarization, add one nonterminal at a time
 			if head is None:
 				p2 = newproduction(p, p1)
@@ -699,9 +752,73 @@ def minimalbinarization(tree, score, sep='|', head=None, parentstr='', h=999):
 				nonterms[p2] = p2nonterms
 				revnonterms[p2nonterms] = p2
 				agenda[p2] = workingset[p2] = x2
+				order.append(p2)
 	raise ValueError('agenda exhausted without finding binarization.')
 
 
+class BinarizationCache(object):
+	"""Optimal binarizations of productions, for ``minimalbinarization()``.
+
+	The binarization of a production is stored under its signature, as
+	nested pairs of child indices, such that it can be re-used for other
+	occurrences of the production in the treebank. Contains no trees, and
+	can be pickled to pass it to other processes; ``update()`` merges the
+	binarizations found by another cache."""
+	def __init__(self):
+		self.binarizations = {}
+		self.hits = self.misses = 0
+
+	def signature(self, tree, score, head):
+		"""Return the key for the binarization of the top production.
+
+		The bitsets of the children are reduced to a pattern with, for each
+		contiguous range of positions, the index of the child it belongs to;
+		-1 marks a gap. The labels are only part of the key when ``score`` is
+		not one of ``complexityfanout()`` and ``fanoutcomplexity()``, which
+		only inspect bitsets."""
+		owner = {}
+		for n, a in enumerate(tree):
+			for m in getbits(a.bitset):
+				owner[m] = n
+		pattern, prev = [], None
+		for m in sorted(owner):
+			if prev is not None and m != prev + 1:
+				pattern.append(-1)
+			if not pattern or pattern[-1] != owner[m]:
+				pattern.append(owner[m])
+			prev = m
+		labels = ()
+		if score not in (complexityfanout, fanoutcomplexity):
+			labels = (tree.label, ) + tuple(a.label for a in tree)
+		return ('%s.%s' % (score.__module__, score.__name__), head, labels,
+				tuple(pattern), tuple(score(a) for a in tree))
+
+	def add(self, key, tree, binarization):
+		"""Store the binarization of ``tree`` under ``key``."""
+		indices = {id(a): n for n, a in enumerate(tree)}
+
+		def encode(node):
+			"""Replace children of tree by their indices."""
+			if id(node) in indices:
+				return indices[id(node)]
+			return encode(node[0]), encode(node[1])
+		self.binarizations[key] = encode(binarization)
+
+	def update(self, other):
+		"""Add the binarizations and statistics of another cache."""
+		self.binarizations.update(other.binarizations)
+		self.hits += other.hits
+		self.misses += other.misses
+
+	def __len__(self):
+		return len(self.binarizations)
+
+	def __str__(self):
+		return '%d productions; %d hits, %d misses (hit rate %.1f%%)' % (
+				len(self.binarizations), self.hits, self.misses,
+				100.0 * self.hits / ((self.hits + self.misses) or 1))
+
+
 def fanout(tree):
 	"""Return fan-out of constituent. Requires ``bitset`` attribute."""
 	return bitfanout(tree.bitset) if isinstance(tree, Tree) else 1
@@ -892,14 +1009,13 @@ def main():
 	import io
 	from getopt import gnu_getopt, GetoptError
 	from discodop import treebanktransforms
-	actions = {'none': None, 'introducepreterminals': introducepreterminals,
-			'splitdisc': None, 'mergedisc': mergediscnodes, 'transform': None,
-			'unbinarize': unbinarize, 'binarize': None, 'optimalbinarize': None}
+	actions = ('none', 'introducepreterminals', 'splitdisc', 'mergedisc',
+			'transform', 'unbinarize', 'binarize', 'optimalbinarize')
 	flags = ('markorigin markheads leftunary rightunary tailmarker '
-			'renumber reverse'.split())
+			'renumber reverse cache'.split())
 	options = ('inputfmt= outputfmt= inputenc= outputenc= slice= ensureroot= '
 			'punct= headrules= functions= morphology= lemmas= factor= '
-			'markorigin= maxlen= fmt= enc= transforms=').split()
+			'markorigin= maxlen= fmt= enc= transforms= numproc=').split()
 	try:
 		opts, args = gnu_getopt(sys.argv[1:], 'h:v:', flags + options)
 		if not 1 <= len(args) <= 3:
@@ -916,12 +1032,17 @@ def main():
 		opts['--inputfmt'] = opts['--outputfmt'] = opts['--fmt']
 	if '--enc' in opts:
 		opts['--inputenc'] = opts['--outputenc'] = opts['--enc']
-	if opts.get('--outputfmt', WRITERS[0]) not in WRITERS:
+	# binary output is written by writebinarycorpus(), not writetree()
+	if opts.get('--outputfmt', WRITERS[0]) not in WRITERS + ('binary', ):
 		print('unrecognized output format: %r\navailable formats: %s' % (
-				opts.get('--outputfmt'), ' '.join(WRITERS)), file=sys.stderr)
+				opts.get('--outputfmt'), ' '.join(WRITERS + ('binary', ))),
+				file=sys.stderr)
 		sys.exit(2)
 	infilename = args[1] if len(args) >= 2 and args[1] != '-' else '/dev/stdin'
 	outfilename = args[2] if len(args) == 3 and args[2] != '-' else '/dev/stdout'
+	if opts.get('--numproc', '1') != '1' and infilename == '/dev/stdin':
+		print('error: --numproc requires an input file', file=sys.stderr)
+		sys.exit(2)
 
 	# open corpus
 	corpus = READERS[opts.get('--inputfmt', 'export')](
@@ -934,49 +1055,45 @@ def main():
 			lemmas=opts.get('--lemmas'))
 	start, end = opts.get('--slice', ':').split(':')
 	start, end = (int(start) if start else None), (int(end) if end else None)
-	trees = corpus.itertrees(start, end)
-	if '--maxlen' in opts:
-		maxlen = int(opts['--maxlen'])
-		trees = ((key, (tree, sent)) for key, (tree, sent) in trees
-				if len(sent) <= maxlen)
-	if '--renumber' in opts:
-		trees = (('%8d' % n, treesent)
-				for n, (_, treesent) in enumerate(trees, 1))
-
-	# select transformation
-	transform = actions[action]
-	if action in ('binarize', 'optimalbinarize'):
-		h = int(opts.get('-h', 999))
-		v = int(opts.get('-v', 1))
-		if action == 'binarize':
-			factor = opts.get('--factor', 'right')
-			transform = lambda t, _: binarize(t, factor, h, v,
-					leftmostunary='--leftunary' in opts,
-					rightmostunary='--rightunary' in opts,
-					tailmarker='$' if '--tailmarker' in opts else '')
-		elif action == 'optimalbinarize':
-			headdriven = '--headrules' in opts
-			transform = lambda t, _: optimalbinarize(t, '|', headdriven, h, v)
-	elif action == 'splitdisc':
-		transform = lambda t, _: splitdiscnodes(t, '--markorigin' in opts)
-	elif action == 'unbinarize':
-		transform = lambda t, _: unbinarize(Tree.convert(t))
-	elif action == 'transform':
-		tfs = opts['--transforms'].split(',')
-		transform = lambda t, s: (treebanktransforms.reversetransform(t, tfs)
-				if '--reverse' in opts
-				else treebanktransforms.transform(t, s, tfs))
-	if transform is not None:  # NB: transform cannot affect (no. of) terminals
-		trees = ((key, (transform(tree, sent), sent)) for key, (tree, sent) in trees)
-
-	# read, transform, & write trees
+	if (start or 0) < 0 or (end or 0) < 0:
+		start, end, _ = slice(start, end).indices(len(corpus))
+	maxlen = int(opts['--maxlen']) if '--maxlen' in opts else None
+	renumber = '--renumber' in opts
+	numproc = int(opts.get('--numproc', 1)) or multiprocessing.cpu_count()
+	if numproc != 1 and not corpus._indexed:
+		print('error: --numproc is not supported for input format %r' %
+				opts.get('--inputfmt', 'export'), file=sys.stderr)
+		sys.exit(2)
+	outputfmt = opts.get('--outputfmt', 'export')
 	headrules = None
-	if opts.get('--outputfmt') in ('mst', 'conll'):
+	if outputfmt in ('mst', 'conll'):
 		if not opts.get('--headrules'):
 			raise ValueError('need head rules for dependency conversion')
 		headrules = treebanktransforms.readheadrules(opts.get('--headrules'))
+	cache = (BinarizationCache()
+			if action == 'optimalbinarize' and '--cache' in opts else None)
+
+	# read & transform trees
+	# NB: only with dact/binary output, or when trees are renumbered after
+	# selecting them by length, the workers pass trees instead of strings.
+	results = None
+	if numproc == 1:
+		trees = transformcorpus(corpus, gettransform(action, opts, cache),
+				start, end, maxlen, 1 if renumber else None)
+	elif outputfmt in ('dact', 'binary') or renumber and maxlen is not None:
+		trees = (treesent for _, chunk in paralleltransform(corpus, action,
+				opts, start, end, maxlen, None, None, numproc, cache)
+				for treesent in chunk)
+		if renumber and maxlen is not None:
+			trees = (('%8d' % n, treesent)
+					for n, (_, treesent) in enumerate(trees, 1))
+	else:
+		results = paralleltransform(corpus, action, opts, start, end,
+				maxlen, outputfmt, headrules, numproc, cache)
+
+	# write trees
 	cnt = 0
-	if opts.get('--outputfmt') == 'dact':
+	if outputfmt == 'dact':
 		import alpinocorpus
 		outfile = alpinocorpus.CorpusWriter(outfilename)
 		if (action == 'none' and opts.get('--inputfmt') in ('alpino', 'dact')
@@ -990,32 +1107,182 @@ def main():
 			for key, (tree, sent) in trees:
 				outfile.write(str(key), writetree(tree, sent, key, 'alpino'))
 				cnt += 1
+	elif outputfmt == 'binary':
+		cnt = writebinarycorpus(outfilename, ((tree, sent, key)
+				for key, (tree, sent) in trees))
 	else:
 		encoding = opts.get('outputenc', 'utf-8')
 		outfile = io.open(outfilename, 'w', encoding=encoding)
 		# copy trees verbatim when only taking slice or converting encoding
 		if (action == 'none' and opts.get('--inputfmt') == opts.get(
 				'--outputfmt') and set(opts) <= {'--slice', '--inputenc',
-				'--outputenc', '--inputfmt', '--outputfmt'}):
+				'--outputenc', '--inputfmt', '--outputfmt', '--numproc'}):
 			for block in islice(corpus.blocks().values(), start, end):
 				outfile.write(block)
 				cnt += 1
+		elif results is not None:
+			for n, result in results:
+				outfile.write(result)
+				cnt += n
 		else:
-			for key, (tree, sent) in trees:
-				outfile.write(writetree(tree, sent, key,
-						opts.get('--outputfmt', 'export'), headrules))
-				cnt += 1
+			cnt = writetrees(outfile, ((tree, sent, key)
+					for key, (tree, sent) in trees),
+					outputfmt, headrules=headrules)
 	print('%sed %d trees with action %r' % ('convert' if action == 'none'
 			else 'transform', cnt, action), file=sys.stderr)
+	if cache is not None:
+		print('optimal binarizations: %s' % cache, file=sys.stderr)
+
+
+def gettransform(action, opts, cache=None):
+	"""Return a function ``transform(tree, sent)`` for a command line action.
+
+	Returns None if trees are to be left as is.
+
+	:param opts: a dictionary with the command line options.
+	:param cache: a ``BinarizationCache`` used by ``optimalbinarize``."""
+	from discodop import treebanktransforms
+	if action in ('binarize', 'optimalbinarize'):
+		h = int(opts.get('-h', 999))
+		v = int(opts.get('-v', 1))
+		if action == 'binarize':
+			factor = opts.get('--factor', 'right')
+			return lambda t, _: binarize(t, factor, h, v,
+					leftmostunary='--leftunary' in opts,
+					rightmostunary='--rightunary' in opts,
+					tailmarker='$' if '--tailmarker' in opts else '')
+		headdriven = '--headrules' in opts
+		return lambda t, _: optimalbinarize(t, '|', headdriven, h, v,
+				cache=cache)
+	elif action == 'introducepreterminals':
+		return lambda t, _: introducepreterminals(t)
+	elif action == 'splitdisc':
+		return lambda t, _: splitdiscnodes(t, '--markorigin' in opts)
+	elif action == 'mergedisc':
+		return lambda t, _: mergediscnodes(t)
+	elif action == 'unbinarize':
+		return lambda t, _: unbinarize(Tree.convert(t))
+	elif action == 'transform':
+		tfs = opts['--transforms'].split(',')
+		return lambda t, s: (treebanktransforms.reversetransform(t, tfs)
+				if '--reverse' in opts
+				else treebanktransforms.transform(t, s, tfs))
+	return None
 
 
-__all__ = ['OrderedSet', 'abbr', 'addbitsets', 'addfanoutmarkers', 'binarize',
-		'unbinarize', 'canonicalize', 'collapseunary', 'complexity',
-		'complexityfanout', 'contsets', 'disc', 'factorconstituent',
-		'fanout', 'fanoutcomplexity', 'getbits', 'getyf',
-		'introducepreterminals', 'mergediscnodes', 'minimalbinarization',
-		'optimalbinarize', 'postorder', 'removefanoutmarkers',
-		'splitdiscnodes']
+def transformcorpus(corpus, transform, start=None, end=None, maxlen=None,
+		renumber=None):
+	"""Read, select, and transform the trees ``start...end`` of a corpus.
+
+	:param transform: a function as returned by ``gettransform()``, or None.
+	:param maxlen: if given, skip sentences with more than ``maxlen`` tokens.
+	:param renumber: if given, replace sentence IDs with consecutive numbers
+		starting from ``renumber``, padded with 8 spaces.
+	:returns: an iterator with tuples ``(key, (tree, sent))``."""
+	trees = corpus.itertrees(start, end)
+	if maxlen is not None:
+		trees = ((key, (tree, sent)) for key, (tree, sent) in trees
+				if len(sent) <= maxlen)
+	if renumber is not None:
+		trees = (('%8d' % n, treesent)
+				for n, (_, treesent) in enumerate(trees, renumber))
+	if transform is not None:  # NB: transform cannot affect (no. of) terminals
+		trees = ((key, (transform(tree, sent), sent))
+				for key, (tree, sent) in trees)
+	return trees
+
+
+def paralleltransform(corpus, action, opts, start, end, maxlen, fmt,
+		headrules, numproc, cache=None, chunksize=256):
+	"""Transform trees ``start...end`` of a corpus with a pool of processes.
+
+	The trees are divided in chunks of ``chunksize`` sentences; the results
+	of ``transformworker()`` are yielded in order as tuples ``(cnt, result)``.
+	At most ``2 * numproc`` chunks are pending at a time, so memory use does
+	not depend on the size of the corpus.
+
+	:param fmt: if None, results are lists of tuples ``(key, (tree, sent))``;
+		otherwise, strings with trees in this treebank format.
+	:param cache: if given, the binarizations found by the workers are
+		added to this ``BinarizationCache``.
+
+	Each worker reads its own chunk, so the corpus reader must have an index
+	of the trees (e.g., not for Alpino or Dact corpora); otherwise every
+	chunk would require reading the corpus from the start."""
+	if not corpus._indexed:
+		raise ValueError('corpus format does not support reading chunks.')
+	start, end, _ = slice(start, end).indices(len(corpus))
+	pool = multiprocessing.Pool(processes=numproc, initializer=initworker,
+			initargs=(dict(corpus=corpus, action=action, opts=opts,
+				maxlen=maxlen, fmt=fmt, headrules=headrules,
+				cache=None if cache is None else BinarizationCache()), ))
+	renumber = '--renumber' in opts and maxlen is None
+	pending = deque()
+	try:
+		for n in range(start, end, chunksize):
+			pending.append(pool.apply_async(transformworker, ((
+					n, min(n + chunksize, end),
+					n - start + 1 if renumber else None), )))
+			while pending and (len(pending) > 2 * numproc
+					or n + chunksize >= end):
+				cnt, result, newcache = pending.popleft().get()
+				if cache is not None:
+					cache.update(newcache)
+				yield cnt, result
+	finally:
+		pool.terminate()
+		pool.join()
+
+
+def initworker(params):
+	"""Set global parameter object and select transformation."""
+	global INTERNALPARAMS
+	INTERNALPARAMS = params
+	params['transform'] = gettransform(
+			params['action'], params['opts'], params['cache'])
+
+
+def transformworker(args):
+	"""Read and transform the sentences ``start...end``.
+
+	:returns: a tuple ``(cnt, result, cache)`` with the number of trees, the
+		trees as a list or string (cf. ``paralleltransform()``), and a
+		``BinarizationCache`` with the binarizations found for this chunk."""
+	import io
+	start, end, renumber = args
+	prm = INTERNALPARAMS
+	cache = prm['cache']
+	if cache is not None:
+		known, hits, misses = set(cache.binarizations), cache.hits, cache.misses
+	trees = transformcorpus(prm['corpus'], prm['transform'], start, end,
+			prm['maxlen'], renumber)
+	if prm['fmt'] is None:
+		result = list(trees)
+		cnt = len(result)
+	else:
+		out = io.StringIO()
+		cnt = writetrees(out, ((tree, sent, key)
+				for key, (tree, sent) in trees),
+				prm['fmt'], headrules=prm['headrules'])
+		result = out.getvalue()
+	newcache = None
+	if cache is not None:
+		newcache = BinarizationCache()
+		newcache.binarizations = {key: a for key, a
+				in cache.binarizations.items() if key not in known}
+		newcache.hits, newcache.misses = cache.hits - hits, cache.misses - misses
+	return cnt, result, newcache
+
+
+__all__ = ['BinarizationCache', 'OrderedSet', 'abbr', 'addbitsets',
+		'addfanoutmarkers', 'binarize', 'unbinarize', 'canonicalize',
+		'collapseunary', 'complexity', 'complexityfanout', 'contsets',
+		'disc', 'factorconstituent', 'fanout', 'fanoutcomplexity', 'getbits',
+		'gettransform', 'getyf',
+		'initworker', 'introducepreterminals', 'mergediscnodes',
+		'minimalbinarization', 'optimalbinarize', 'paralleltransform',
+		'postorder', 'removefanoutmarkers', 'splitdiscnodes',
+		'transformcorpus', 'transformworker']
 
 if __name__ == '__main__':
 	main()
@@ -2,6 +2,7 @@
 # pylint: disable=C0111,W0232
 from __future__ import print_function
 import re
+from contextlib import contextmanager
 from unittest import TestCase
 from itertools import count, islice
 from operator import itemgetter
@@ -14,6 +15,52 @@ from discodop.treebanktransforms import punctraise, balancedpunctraise
 from discodop.grammar import flatten, UniqueIDs
 
 
+class Test_tree(object):
+	def test_parse(self):
+		treestr = '(S (NP (DT 0) (NN 1)) (VP (VB 2) (ADV 3)))'
+		for cls in (Tree, ParentedTree):
+			tree = cls.parse(treestr, parse_leaf=int)
+			assert tree == cls('S', [cls('NP', [cls('DT', [0]),
+					cls('NN', [1])]), cls('VP', [cls('VB', [2]),
+					cls('ADV', [3])])])
+			assert tree[1][0].source is None and tree[1][0].bitset is None
+		assert tree[1][0].parent is tree[1] and tree.parent is None
+		for malformed in ('(S (NP 0)', '(S 0) (T 1)', '(S 0))', 'a', ''):
+			try:
+				ParentedTree.parse(malformed)
+			except ValueError:
+				pass
+			else:
+				raise AssertionError('expected ValueError for %r' % malformed)
+
+	def test_compacttree(self):
+		import pickle
+		from discodop.tree import CompactTree, LabelTable
+		from discodop.grammar import lcfrsproductions
+		from discodop.eval import bracketings
+		tree = Tree.parse('(S (VP (VB 0) (JJ 2)) (NP 1))', parse_leaf=int)
+		sent = 'is Mary happy'.split()
+		labels = LabelTable()
+		ctree = CompactTree.fromtree(tree, labels)
+		assert ctree.totree() == tree and str(ctree) == str(tree)
+		assert CompactTree.fromtree(tree.copy(True), labels) == ctree
+		assert len(labels) == 5
+		assert ctree.leaves() == tree.leaves() and ctree.pos() == tree.pos()
+		assert ctree.treepositions() == tree.treepositions()
+		assert ctree[0, 1].parent.label == 'VP' and ctree.parent is None
+		assert lcfrsproductions(ctree, sent) == lcfrsproductions(tree, sent)
+		assert bracketings(ctree) == {('S', (0, 1, 2)): 1, ('VP', (0, 2)): 1}
+		assert bracketings(ctree, disconly=True) == {('VP', (0, 2)): 1}
+		assert str(binarize(ctree, horzmarkov=1)) == str(
+				binarize(tree, horzmarkov=1))
+		for protocol in (0, 2):
+			ctree1, ctree2 = pickle.loads(pickle.dumps(
+					[ctree, ctree[0]], protocol))
+			assert ctree1 == ctree and ctree2 == ctree[0]
+			assert ctree1.labels is ctree2.labels
+			assert ctree1.labels.toid == labels.toid
+
+
 class Test_treetransforms(object):
 	def test_binarize(self):
 		treestr = '(S (VP (PDS 0) (ADV 3) (VVINF 4)) (PIS 2) (VMFIN 1))'
@@ -74,6 +121,43 @@ class Test_treetransforms(object):
 		assert str(mergediscnodes(splitdiscnodes(tree))) == (
 				'(S (X (A 0) (A 1) (A 2) (A 3)))')
 
+	def test_binarizationcache(self):
+		import pickle
+		from discodop.treetransforms import optimalbinarize, \
+				BinarizationCache
+		from discodop.treebank import NegraCorpusReader
+		for punct in (None, 'root'):
+			corpus = NegraCorpusReader('alpinosample.export', punct=punct)
+			trees = list(corpus.trees().values())
+			for headdriven, h in ((False, None), (True, 1)):
+				cache = BinarizationCache()
+				# the second time, the binarizations are rebuilt from the cache
+				for tree in trees + trees:
+					assert str(optimalbinarize(tree.copy(True),
+							headdriven=headdriven, h=h, cache=cache)) == str(
+							optimalbinarize(tree.copy(True),
+							headdriven=headdriven, h=h))
+				assert cache.misses == len(cache) and cache.hits >= len(cache)
+				cache1 = pickle.loads(pickle.dumps(cache))
+				cache1.update(cache)
+				assert cache1.binarizations == cache.binarizations
+
+	def test_paralleltransform(self):
+		import io
+		from discodop.treetransforms import gettransform, transformcorpus, \
+				paralleltransform
+		from discodop.treebank import NegraCorpusReader, writetrees
+		corpus = NegraCorpusReader('alpinosample.export')
+		opts = {'--renumber': '', '-h': '1'}
+		out = io.StringIO()
+		writetrees(out, ((tree, sent, key) for key, (tree, sent)
+				in transformcorpus(corpus, gettransform('binarize', opts),
+					1, None, None, 1)), 'export')
+		result = list(paralleltransform(corpus, 'binarize', opts, 1, None,
+				None, 'export', None, 2, chunksize=1))
+		assert [cnt for cnt, _ in result] == [1, 1]
+		assert ''.join(chunk for _, chunk in result) == out.getvalue()
+
 
 class Test_treebank(object):
 	def test_incrementaltreereader(self):
@@ -108,6 +192,135 @@ rich	JJ	--	--	500
 		result = list(incrementaltreereader(data.splitlines()))
 		assert len(result) == 1
 
+	def test_index(self):
+		"""Indexed access gives the same trees as reading the corpus."""
+		import os
+		import shutil
+		import tempfile
+		from discodop.treebank import NegraCorpusReader, BracketCorpusReader
+		tmpdir = tempfile.mkdtemp()
+		try:
+			shutil.copy('alpinosample.export', tmpdir)
+			filename = os.path.join(tmpdir, 'treebank.mrg')
+			with open(filename, 'w') as out:
+				out.write('(S (NP Mary) (VP (VB is) (JJ rich)) (. .))\n'
+						'(S (NP John) (VP (VB is) (JJ poor)) (. .))\n')
+			for reader, path in ((NegraCorpusReader, os.path.join(
+						tmpdir, 'alpinosample.export')),
+					(BracketCorpusReader, filename)):
+				for _ in range(2):  # create index; read it from disk
+					corpus = reader(path)
+					trees = list(corpus.trees().items())
+					assert len(corpus) == len(trees)
+					assert [(n, tree) for n, (tree, _) in corpus.itertrees(
+							1, None)] == trees[1:]
+					assert all(corpus.get(n)[0] == tree for n, tree in trees)
+			assert os.path.exists(os.path.join(tmpdir, '.treebank.mrg.index'))
+			with open(filename, 'a') as out:
+				out.write('(S (NP Mary) (VP (VB is) (JJ happy)) (. .))\n')
+			os.utime(filename, (0, 0))
+			corpus = BracketCorpusReader(filename)
+			assert len(corpus) == 3
+			assert corpus.get(3)[1][2] == 'happy'
+		finally:
+			shutil.rmtree(tmpdir)
+
+	def test_tigerxml(self):
+		"""Streaming and indexed access to a Tiger XML file agree."""
+		import os
+		import shutil
+		import tempfile
+		from discodop.treebank import TigerXMLCorpusReader
+		sentence = ('<s id="s%d">\n<graph root="s%d_500">\n<terminals>\n'
+				'<t id="s%d_1" word="%s" lemma="--" pos="NN" morph="--" />\n'
+				'<t id="s%d_2" word="." lemma="--" pos="$." morph="--" />\n'
+				'</terminals>\n<nonterminals>\n<nt id="s%d_500" cat="S">\n'
+				'<edge label="SB" idref="s%d_1" />\n'
+				'<edge label="--" idref="s%d_2" />\n'
+				'</nt>\n</nonterminals>\n</graph>\n</s>\n')
+		tmpdir = tempfile.mkdtemp()
+		try:
+			filename = os.path.join(tmpdir, 'tiger.xml')
+			with open(filename, 'wb') as out:
+				out.write(b'<?xml version="1.0" encoding="ISO-8859-1"?>\n'
+						b'<corpus id="test">\n<body>\n')
+				for n, word in enumerate((b'Haus', b'K\xe4se', b'Welt'), 1):
+					block = (sentence.encode('ascii').replace(b'%s', word)
+							.replace(b'%d', str(n).encode('ascii')))
+					if n == 2:  # start tag split over lines
+						block = block.replace(b'<s id', b'<s\n\tid')
+					out.write(block)
+				out.write(b'</body>\n</corpus>\n')
+			corpus = TigerXMLCorpusReader(filename)
+			trees = list(corpus.itertrees())
+			assert [n for n, _ in trees] == ['s1', 's2', 's3']
+			assert len(corpus) == 3
+			tree, sent = corpus.get('s2')
+			assert (tree, sent) == trees[1][1]
+			assert sent == [u'K\xe4se', '.']
+			assert [n for n, _ in corpus.itertrees(1, 2)] == ['s2']
+			filename = os.path.join(tmpdir, 'unmatched.xml')
+			with open(filename, 'wb') as out:
+				out.write(b'<corpus>\n<body>\n</s>\n</body>\n</corpus>\n')
+			try:
+				len(TigerXMLCorpusReader(filename))
+			except ValueError:
+				pass
+			else:
+				raise AssertionError('expected error for unmatched </s>')
+		finally:
+			shutil.rmtree(tmpdir)
+
+	def test_writetrees(self):
+		import io
+		from discodop.treebank import NegraCorpusReader, writetree, writetrees
+		corpus = NegraCorpusReader('alpinosample.export')
+		trees = [(tree, sent, n) for n, (tree, sent) in corpus.itertrees()]
+		for fmt in ('export', 'bracket', 'discbracket', 'alpino'):
+			out = io.StringIO()
+			assert writetrees(out, trees, fmt, batchsize=2) == len(trees)
+			assert out.getvalue() == ''.join(writetree(tree, sent, n, fmt)
+					for tree, sent, n in trees)
+		tree = Tree.parse('(S (NP 0) (VP 1))', parse_leaf=int)
+		assert writetree(tree, ['Mary', '(laughs)'], 1, 'bracket') == (
+				'(S (NP Mary) (VP -LRB-laughs-RRB-))\n')
+		tree = Tree.parse('(S (NP 0) (VP 1))')  # indices as strings
+		assert writetree(tree, ['Mary', '(laughs)'], 1, 'bracket') == (
+				'(S (NP Mary) (VP -LRB-laughs-RRB-))\n')
+
+	def test_binarycorpus(self):
+		import os
+		import shutil
+		import tempfile
+		from discodop.treebank import NegraCorpusReader, BinaryCorpusReader, \
+				writebinarycorpus, writetree
+		from discodop.treetransforms import paralleltransform
+		tmpdir = tempfile.mkdtemp()
+		try:
+			filename = os.path.join(tmpdir, 'treebank.bin')
+			corpus = NegraCorpusReader('alpinosample.export')
+			assert writebinarycorpus(filename, ((tree, sent, n)
+					for n, (tree, sent) in corpus.itertrees())) == 3
+			for opts in ({}, dict(functions='add', morphology='between',
+					lemmas='add', punct='move')):
+				trees = list(NegraCorpusReader(
+						'alpinosample.export', **opts).itertrees())
+				bincorpus = BinaryCorpusReader(filename, **opts)
+				assert len(bincorpus) == 3
+				assert list(bincorpus.itertrees()) == trees
+				assert list(bincorpus.itertrees(2)) == trees[2:]
+				key, (tree, sent) = trees[1]
+				assert bincorpus.get(key) == (tree, sent)
+				assert writetree(tree, sent, key, 'export') == writetree(
+						bincorpus.get(key)[0], sent, key, 'export')
+			# a binary corpus can be divided over processes
+			result = paralleltransform(BinaryCorpusReader(filename), 'none',
+					{}, 0, None, None, None, None, 2, chunksize=1)
+			assert [a for _, chunk in result for a in chunk] == list(
+					BinaryCorpusReader(filename).itertrees())
+		finally:
+			shutil.rmtree(tmpdir)
+
 
 class Test_treebanktransforms(object):
 	def test_balancedpunctraise(self):
@@ -152,6 +365,23 @@ class Test_treebanktransforms(object):
 						'mismatch with %r\nbefore: %r\nafter: %r' % (
 						transformations, before, after))
 
+	def test_compiletransforms(self):
+		from discodop.treebanktransforms import transform, compiletransforms
+		from discodop.treebank import NegraCorpusReader
+		assert len(compiletransforms(('S-RC', 'VP-GF', 'NP', 'PUNCT'))) == 1
+		assert len(compiletransforms(('S-WH', 'VP-HD', 'S-INF'))) == 1
+		assert len(compiletransforms(('markinf markpart de2 markp1 mwadvs '
+				'mwadvsel1 mwadvsel2 mwnsel1 mwnsel2 PUNCT tagpa').split())) == 2
+		transformations = ('MARK-UNARY', 'S-RC', 'NP', 'PUNCT', 'tagpa')
+		n = NegraCorpusReader('alpinosample.export')
+		nn = NegraCorpusReader('alpinosample.export')
+		for (_, (a, asent)), (_, (b, bsent)) in zip(
+				n.itertrees(), nn.itertrees()):
+			transform(a, asent, transformations)
+			for name in transformations:
+				transform(b, bsent, (name, ))
+			assert str(a) == str(b)
+
 
 class Test_grammar(object):
 	def test_flatten(self):
@@ -397,6 +627,259 @@ def test_fragments():
 		print("%s\t%d" % (re.sub("[0-9]+", lambda x: b[int(x.group())], a), c))
 
 
+# trees of different sizes; the first needs more slots in a bitset than the
+# others, i.e., more than 64 nodes.
+TOYTREES = ['(S (NP %s (NP (DT the) (NN mouse))) (VP (VBD saw) '
+			'(NP (DT the) (NN cheese))))\n'
+			% ' '.join(12 * ['(NP (DT the) (NN cat)) (CC and)']),
+		'(S (NP (DT The) (NN cat)) (VP (VBP saw) (NP (DT the) (NN dog))))\n',
+		'(S (NP (DT The) (NN mouse)) (VP (VBP saw) (NP (DT the) '
+			'(NN cat))))\n',
+		'(S (NP (DT The) (NN dog)) (VP (VBD ate) (NP (DT the) (NN cat))))\n',
+		'(S (NP (DT A) (NN mouse)) (VP (VBD ate) (NP (DT the) '
+			'(NN cheese))))\n']
+
+
+@contextmanager
+def tempfiles(*contents):
+	"""Write each sequence of lines to a file in a temporary directory.
+
+	Yields the directory and the filenames; the directory is removed
+	afterwards."""
+	import os
+	import shutil
+	import tempfile
+	tmpdir = tempfile.mkdtemp()
+	try:
+		filenames = []
+		for n, lines in enumerate(contents):
+			filenames.append(os.path.join(tmpdir, '%d.mrg' % n))
+			with open(filenames[-1], 'w') as out:
+				out.writelines(lines)
+		yield tmpdir, filenames
+	finally:
+		shutil.rmtree(tmpdir)
+
+
+def test_exactcounts_unindexed():
+	# trees2 is indexed before trees1 adds new productions
+	from discodop._fragments import readtreebank, extractfragments, \
+			exactcounts
+	with tempfiles(2 * ['(S (NP (DT The) (NN cat)) (VP (VBP saw) '
+			'(NP (DT a) (NN dog))))\n'],
+			['(S (NP (DT The) (NN mouse)) (VP (VBP ate)))\n']) as (
+			_, (filename1, filename2)):
+		labels, prods = [], {}
+		trees2, _ = readtreebank(filename2, labels, prods)
+		trees2.indextrees(prods)
+		trees1, sents1 = readtreebank(filename1, labels, prods)
+		trees1.indextrees(prods)
+	fragments = extractfragments(trees1, sents1, 0, 0, labels,
+			discontinuous=False, approx=False)
+	counts = exactcounts(trees1, trees2, list(fragments.values()))
+	trees2.indextrees(prods)
+	assert counts == exactcounts(trees1, trees2, list(fragments.values()))
+	assert sorted(counts) == [0, 1]
+
+
+def test_fragmentcache():
+	"""Fragments from a cached, memory-mapped treebank are identical."""
+	import os
+	from discodop.fragments import readtreebanks
+	from discodop._fragments import extractfragments
+	with tempfiles(TOYTREES) as (tmpdir, (filename, )):
+		results = []
+		for _ in range(3):
+			params = readtreebanks(filename, cachedir=tmpdir + '/cache')
+			results.append(extractfragments(params['trees1'],
+					params['sents1'], 0, 0, params['labels']))
+		assert results[0] and results[0] == results[1] == results[2]
+		assert len(os.listdir(tmpdir + '/cache')) == 2
+
+
+def test_fragmentcheckpoint():
+	"""Resuming from a partially completed run gives the same fragments."""
+	import os
+	from discodop.fragments import getfragments
+	trees = [binarize(Tree.parse(a, parse_leaf=int)) for a in (
+			'(S (NP (DT 0) (NN 1)) (VP (VBP 2) (NP (DT 3) (NN 4))))',
+			'(S (NP (DT 0) (NN 1)) (VP (VBP 2) (NP (DT 3) (JJ 4) (NN 5))))',
+			'(S (NP (DT 0) (NN 1)) (VP (VBD 2) (NP (DT 3) (NN 4))))')]
+	sents = ['the cat saw the dog'.split(),
+			'the cat saw the hungry dog'.split(),
+			'the mouse ate the cat'.split()]
+	expected = getfragments(trees, sents, disc=False)
+	with tempfiles() as (tmpdir, _):
+		assert getfragments(trees, sents, disc=False,
+				checkpoint=tmpdir) == expected
+		os.remove(os.path.join(tmpdir, 'merged.pickle'))
+		os.remove(os.path.join(tmpdir, 'fragments0.pickle'))
+		assert getfragments(trees, sents, disc=False,
+				checkpoint=tmpdir) == expected
+		assert len(expected) > 10
+
+
+def test_fragmentincremental():
+	"""Updating fragments with new trees gives the same fragments as
+	extracting them from all trees."""
+	from discodop.fragments import PARAMS, FLAGS, regular, incremental
+	PARAMS.update((a, False) for a in FLAGS)
+	PARAMS.update(disc=False, fmt='bracket', twoterms=None, indices=True)
+	# the old trees need more slots in a bitset than the new trees
+	with tempfiles(TOYTREES[:3], TOYTREES[3:], TOYTREES, ()) as (
+			_, (old, new, alltrees, prev)):
+		keys, counts = regular([old], 1, None, 'utf8')
+		with open(prev, 'w') as out:
+			out.writelines('%s\t%r\n' % (a, sorted(b.elements()))
+					for a, b in zip(keys, counts))
+		expected = dict(zip(*regular([alltrees], 1, None, 'utf8')))
+		result = dict(zip(*incremental(prev, [old, new], 1, 'utf8')))
+		assert result == expected
+		assert len(expected) > len(keys)
+		with open(prev, 'w') as out:
+			out.writelines('%s\n' % a for a in keys)
+		try:
+			incremental(prev, [old, new], 1, 'utf8')
+		except ValueError:
+			pass
+		else:
+			raise AssertionError('expected error for fragments without counts')
+
+
+def test_fragmentbatch():
+	"""Batch mode gives the same results with a pool of processes."""
+	import io
+	import os
+	from discodop.fragments import PARAMS, FLAGS, batch
+	PARAMS.update((a, False) for a in FLAGS)
+	PARAMS.update(disc=False, fmt='bracket', twoterms=None)
+	with tempfiles(TOYTREES, TOYTREES[:2], TOYTREES[2:],
+			TOYTREES[3:]) as (tmpdir, filenames):
+		results = []
+		for numproc in (1, 2):
+			outdir = '%s/out%d' % (tmpdir, numproc)
+			os.mkdir(outdir)
+			batch(outdir, filenames, None, 'utf8', False, numproc=numproc)
+			results.append({a: sorted(io.open(os.path.join(outdir, a),
+					encoding='utf8')) for a in os.listdir(outdir)})
+		assert len(results[0]) == 3 and results[0] == results[1]
+
+
+def test_fragmentiterate():
+	"""Iterated extraction gives the same fragments with a pool of
+	processes."""
+	from discodop.fragments import getfragments
+	trees = [binarize(Tree.parse(a, parse_leaf=int)) for a in (
+			'(S (NP (DT 0) (NN 1)) (VP (VB 2) (NP (DT 3) (NN 4))))',
+			'(S (NP (DT 0) (NN 1)) (VP (VB 2) (NP (DT 3) (NN 4))))',
+			'(S (NP (DT 0) (NN 1)) (VP (VB 2) (NP (DT 3) (NN 4))))',
+			'(S (NP (DT 0) (NN 1)) (VP (VB 2) (NP (DT 3) (NN 4))))')]
+	sents = ['a cat ate the mouse'.split(), 'a dog ate a mouse'.split(),
+			'a mouse saw a dog'.split(), 'the cat ate a dog'.split()]
+	for complement in (False, True):
+		results = []
+		for numproc in (1, 2):
+			# new frontier words are numbered in order of extraction
+			results.append(sorted((frag, tuple(None if word is None
+					or word.startswith('#') else word for word in sent),
+					sum(indices.values())) for (frag, sent), indices
+					in getfragments(trees, sents, numproc=numproc, disc=True,
+						iterate=True, complement=complement).items()))
+		assert results[0] == results[1]
+		assert len(results[0]) > len(getfragments(trees, sents, disc=True,
+				complement=complement))
+
+
+def test_fragmentindex():
+	"""Fragments found with an index agree with exact counts."""
+	from discodop._fragments import FragmentIndex, readtreebank, \
+			completebitsets, exactcounts
+	with tempfiles(['(NP (DT the) (NN ))\t2\n(S (NP ) (VP (VBP saw) '
+			'(NP )))\t2\n(NN cat)\t2\n(VP (VBD ate) (NP ))\t1\n'],
+			TOYTREES[:3]) as (tmpdir, (fragmentfile, treefile)):
+		index = FragmentIndex.fromfragments(fragmentfile)
+		index.tofile(tmpdir + '/fragments.idx')
+		result = FragmentIndex.fromfile(tmpdir + '/fragments.idx').queryfile(
+				treefile)
+		assert result == index.queryfile(treefile)
+		labels, prods = [], {}
+		frags, fsents = readtreebank(fragmentfile, labels, prods)
+		trees, _ = readtreebank(treefile, labels, prods)
+	trees.indextrees(prods)
+	bitsets = completebitsets(frags, fsents, labels,
+			max(frags.maxnodes, trees.maxnodes))
+	for n, frag in enumerate(index.fragments):
+		expected = exactcounts(frags, trees, [bitsets[frag.encode('utf8')]],
+				indices=True)[0]
+		assert expected == {m: a[n] for m, a in enumerate(result) if n in a}
+	assert [sorted(a) for a in result] == [[0, 2], [0, 1, 2], [0, 1, 2]]
+
+
+
+def test_workload():
+	"""Intervals cover all trees and balance the estimated costs."""
+	from discodop.fragments import workload
+	costs = [100, 1, 1, 1, 50, 50, 1, 1, 1, 1, 1, 1]
+	work = workload(len(costs), 2, 2, costs)
+	assert work[0] == (0, 1) and work[-1][1] == len(costs)
+	assert all(a[1] == b[0] for a, b in zip(work, work[1:]))
+	assert len(work) <= 4
+	assert workload(len(costs), 2, 1, costs) == [(0, len(costs))]
+
+
+def test_fragmentstore():
+	"""Merging runs on disk gives the same result as a dictionary."""
+	from discodop.fragments import FragmentStore, keysvalues
+	batches = [[(b'(A a)', 1), (b'(B b)', 2)], [(b'(C c)', 3), (b'(A a)', 4)],
+			[((b'(D 0)', (u'd', None)), 5), (b'(B b)', 6)]]
+	for memlimit in (1, 10 ** 6):
+		added, updated = FragmentStore(memlimit), FragmentStore(memlimit)
+		for batch in batches:
+			added.add(batch)
+			updated.update(batch)
+		added.update([(b'(C c)', 7)])
+		chunks = list(added.chunks())
+		# with the lower limit, each fragment makes a chunk
+		assert len(chunks) == (4 if memlimit == 1 else 1)
+		assert dict((a, b) for keys, values in chunks
+				for a, b in zip(keys, values)) == {b'(A a)': 5, b'(B b)': 8,
+				b'(C c)': 7, (b'(D 0)', (u'd', None)): 5}
+		keys, values = keysvalues(updated)
+		assert keys == [a for chunk, _ in chunks for a in chunk]
+		assert dict(zip(keys, values)) == {b'(A a)': 4, b'(B b)': 6,
+				b'(C c)': 3, (b'(D 0)', (u'd', None)): 5}
+
+
+def test_pruningretries():
+	"""A pruned stage that fails is retried with a relaxed threshold."""
+	from discodop.grammar import treebankgrammar
+	from discodop.containers import Grammar
+	from discodop.parser import Parser, DictObj, DEFAULTSTAGE
+	trees = [binarize(Tree(a)) for a in (
+			'(S (NP (PRP I)) (VP (VB saw) (NP (NP (DT the) (NN man)) '
+			'(PP (IN with) (NP (DT a) (NN telescope))))))',
+			'(S (NP (PRP I)) (VP (VB saw) (NP (DT the) (NN man)) '
+			'(PP (IN with) (NP (DT a) (NN telescope)))))')]
+	sents = [tree.leaves() for tree in trees]
+	for tree in trees:
+		for n, idx in enumerate(tree.treepositions('leaves')):
+			tree[idx] = n
+	rules = treebankgrammar(trees, sents)
+	for maxretries, noparse, retries, k in (
+			(0, True, 0, 0.99), (1, False, 1, 0.099), (3, False, 1, 0.099)):
+		# a threshold of 0.99 prunes both attachments of the PP
+		coarse = DictObj(DEFAULTSTAGE, name='coarse', mode='pcfg-posterior',
+				grammar=Grammar(rules, start='S'))
+		fine = DictObj(DEFAULTSTAGE, name='fine', mode='pcfg', prune=True,
+				k=0.99, maxretries=maxretries, backtransform=None,
+				grammar=Grammar(rules, start='S'))
+		_ = fine.grammar.getmapping(coarse.grammar)
+		result = list(Parser([coarse, fine]).parse(sents[0]))[1]
+		assert result.noparse == noparse
+		assert result.retries == retries
+		assert abs(result.k - k) < 1e-9
+
+
 def test_grammar(debug=False):
 	"""Demonstrate grammar extraction."""
 	from discodop.grammar import treebankgrammar, dopreduction, doubledop
@@ -466,6 +949,122 @@ def test_grammar(debug=False):
 	Grammar(treebankgrammar([tree], [[str(a) for a in range(10)]]))
 
 
+def test_loadtraincorpus():
+	"""Loading the training corpus in parallel gives identical results."""
+	from discodop.runexp import loadtraincorpus, DEFAULTS
+	from discodop.parser import DictObj
+	results = []
+	for numproc in (1, 2):
+		traincorpus = DictObj(DEFAULTS['traincorpus'])
+		traincorpus.update(numsents=None)
+		results.append(loadtraincorpus('export', traincorpus,
+				DictObj(DEFAULTS['binarization']), 'move', None, None,
+				False, None, ('S-RC', 'VP-GF', 'NP'), None, numproc))
+	assert len(results[0][0]) == 3
+	assert results[0] == results[1]
+	assert all(node.parent is tree for tree in results[1][0]
+			for node in tree)
+
+
+def test_getmapping():
+	"""Verify that the inverse coarse-to-fine label mapping is consistent."""
+	from discodop.grammar import treebankgrammar, dopreduction
+	from discodop.containers import Grammar
+	from discodop.treebank import NegraCorpusReader
+	from discodop.treetransforms import addfanoutmarkers
+	corpus = NegraCorpusReader('alpinosample.export', punct='move')
+	sents = list(corpus.sents().values())
+	trees = [addfanoutmarkers(binarize(a.copy(True), horzmarkov=1))
+			for a in list(corpus.trees().values())[:10]]
+	coarse = Grammar(treebankgrammar(trees, sents))
+	fine = Grammar(dopreduction(trees, sents)[0])
+	fine.getmapping(coarse, striplabelre=re.compile(b'@.+$'),
+			neverblockre=re.compile(b'^#[0-9]+|.+}<'))
+	assert len(fine.finemapping) == coarse.nonterminals
+	assert fine.finemapping[0] == []
+	for label, finelabels in enumerate(fine.finemapping):
+		for finelabel in finelabels:
+			assert re.sub(b'@.+$', b'', fine.tolabel[finelabel]
+					) == coarse.tolabel[label]
+	assert sorted(fine.neverblocked + [a for b in fine.finemapping
+			for a in b]) == list(range(1, fine.nonterminals))
+
+
+def test_bitparworker():
+	"""Parse several sentences with a single bitpar process, using a stub
+	executable that produces output in the format of bitpar."""
+	import os
+	import sys
+	import tempfile
+	from discodop.containers import Grammar
+	from discodop.pcfg import BitParWorker, parse_bitpar
+	# n-best derivations are separated by blank lines; a failed parse is not
+	# followed by a blank line, and the word 'hang' makes the stub hang.
+	stub = tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False)
+	stub.write('import sys, os, time\n'
+			'n = int(sys.argv[sys.argv.index("-b") + 1])\n'
+			'words = []\n'
+			'for line in iter(sys.stdin.readline, ""):\n'
+			'	if line.strip():\n'
+			'		words.append(line.strip())\n'
+			'		continue\n'
+			'	if "hang" in words:\n'
+			'		time.sleep(60)\n'
+			'	sys.stderr.write("raw cpu time 0.01\\npid %d\\n" % os.getpid())\n'
+			'	sys.stderr.flush()\n'
+			'	if set(words) - {"a", "b"}:\n'
+			'		sys.stdout.write("No parse for: \\"%s\\"\\n" % " ".join(words))\n'
+			'	for _ in range(n if words and not set(words) - {"a", "b"} else 0):\n'
+			'		sys.stdout.write("vitprob=0.25\\n(S %s)\\n\\n" % " ".join(\n'
+			'				"(X %s)" % a for a in words))\n'
+			'	sys.stdout.flush()\n'
+			'	words = []\n')
+	stub.close()
+	script = tempfile.NamedTemporaryFile(mode='w', delete=False)
+	script.write('#!/bin/sh\nexec %s %s "$@"\n' % (sys.executable, stub.name))
+	script.close()
+	os.chmod(script.name, 0o755)
+	grammar = Grammar(b'1\tS\tX\tX\n', u'a\tX 1\nb\tX 1\n',
+			start='S', bitpar=True, binarized=False)
+	worker = BitParWorker('rules', 'lexicon', 1, 'S', executable=script.name)
+	try:
+		for sent in ('a b'.split(), 'b a'.split()):
+			chart, cputime, msg = parse_bitpar(grammar, 'rules', 'lexicon',
+					sent, 1, 'S', grammar.toid[b'S'], worker=worker)
+			assert chart, msg
+			assert cputime == 0.01
+			assert chart.rankededges[chart.root()][0][0] == (
+					'(S (X 0) (X 1))')
+		pids = set()
+		for sent in ('a b'.split(), 'a c'.split(), 'b a b'.split()):
+			results, msg, _ = worker.parse([a.encode('utf8') for a in sent])
+			if 'c' in sent:
+				assert results == b'No parse for: "a c"\n'
+			else:
+				assert results.count(b'(X ') == len(sent)
+			pids.add(msg.splitlines()[1])
+		assert len(pids) == 1, 'expected a single bitpar process'
+	finally:
+		worker.close()
+	worker = BitParWorker('rules', 'lexicon', 2, 'S', executable=script.name,
+			timeout=0.5)
+	try:
+		results, _, _ = worker.parse([b'a', b'b'])
+		assert results.count(b'vitprob=') == 2
+		try:
+			worker.parse([b'hang'])
+		except ValueError:
+			pass
+		else:
+			raise AssertionError('expected timeout')
+		worker.proc.wait()
+		assert not worker.alive()
+	finally:
+		worker.close()
+		os.unlink(stub.name)
+		os.unlink(script.name)
+
+
 def test_optimalbinarize():
 	"""Verify that all optimal parsing complexities are lower than or
 	equal to the complexities of right-to-left binarizations."""
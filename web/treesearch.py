@@ -1,6 +1,10 @@
 """Web interface to search a treebank. Requires Flask, tgrep2
 or alpinocorpus-python (for xpath queries), style. Expects one or more
-treebanks with .mrg or .dact extension in the directory corpus/"""
+treebanks with .mrg or .dact extension in the directory corpus/
+
+Optionally, corpus/fragments.idx may contain a fragment index (cf.
+``discodop._fragments.FragmentIndex.tofile()``); the fragments of search
+results are then looked up in this index instead of being extracted."""
 from __future__ import print_function
 # stdlib
 import io
@@ -38,6 +42,7 @@ except ImportError:
 # disco-dop
 from discodop.treedraw import DrawTree
 from discodop import treebank, fragments
+from discodop._fragments import FragmentIndex
 from discodop.parser import which
 from discodop.treesearch import TgrepSearcher, DactSearcher, RegexSearcher, \
 		filterlabels
@@ -418,7 +423,11 @@ def fragmentsinresults(form, doexport=False):
 	with tempfile.NamedTemporaryFile(delete=True) as tmp:
 		tmp.writelines(uniquetrees)
 		tmp.flush()
-		results, approxcounts = fragments.regular([tmp.name], 1, None, 'utf8')
+		if FRAGMENTINDEX is not None and not disc:
+			results, approxcounts = indexedfragments(tmp.name)
+		else:
+			results, approxcounts = fragments.regular(
+					[tmp.name], 1, None, 'utf8')
 	if disc:
 		results = nlargest(FRAGLIMIT, zip(results, approxcounts), key=lambda ff:
 				sum(1 for a in ff[0][1] if a) ** 2 * ff[1] ** 0.5)
@@ -462,6 +471,26 @@ def fragmentsinresults(form, doexport=False):
 					MINNODES, MINFREQ)
 
 
+def indexedfragments(filename):
+	"""Look up the indexed fragments occurring at least twice in the trees
+	of ``filename``."""
+	total = Counter()
+	for matches in FRAGMENTINDEX.queryfile(filename, encoding='utf8'):
+		total.update(matches)
+	result = [(FRAGMENTINDEX.fragments[n], cnt)
+			for n, cnt in total.items() if cnt >= MINFREQ]
+	return [a for a, _ in result], [b for _, b in result]
+
+
+def treebanklines(filename, start, end):
+	"""Return lines ``start...end`` of a treebank in bracket format, using
+	the byte-offset index of the corpus reader to seek to them."""
+	if filename not in TREEBANKS:
+		TREEBANKS[filename] = treebank.BracketCorpusReader(
+				filename, encoding='utf8')
+	return [block for _, block in TREEBANKS[filename].iterblocks(start, end)]
+
+
 @APP.route('/style')
 def style():
 	"""Show simple surface characteristics of texts."""
@@ -529,8 +558,7 @@ def draw():
 	nomorph = 'nomorph' in request.args
 	filename = os.path.join(CORPUS_DIR, TEXTS[textno] + '.mrg')
 	if os.path.exists(filename):
-		treestr = next(islice(open(filename),
-				sentno - 1, sentno)).decode('utf8')
+		treestr = treebanklines(filename, sentno - 1, sentno)[0]
 		result = DrawTree(filterlabels(treestr, nofunc, nomorph)).text(
 					unicodelines=True, html=True)
 	elif 'xpath' in CORPORA:
@@ -561,8 +589,7 @@ def browsesents():
 		filename = os.path.join(CORPUS_DIR, TEXTS[textno] + '.mrg')
 		if os.path.exists(filename):
 			results = [' '.join(GETLEAVES.findall(a)) for a
-					in islice(io.open(filename, encoding='utf8'),
-					start, maxtree)]
+					in treebanklines(filename, start, maxtree)]
 		elif 'xpath' in CORPORA:
 			filename = CORPUS_DIR + TEXTS[textno] + '.dact'
 			results = [ElementTree.fromstring(
@@ -641,9 +668,9 @@ def browse():
 					for n in range(start, maxtree)]
 		elif os.path.exists(filename):
 			drawntrees = [DrawTree(filterlabels(
-					line.decode('utf8'), nofunc, nomorph)).text(
+					line, nofunc, nomorph)).text(
 					unicodelines=True, html=True)
-					for line in islice(open(filename), start, maxtree)]
+					for line in treebanklines(filename, start, maxtree)]
 		else:
 			raise ValueError('no treebank available for "%s".' % TEXTS[textno])
 		results = ['<pre id="t%s"%s>%s</pre>' % (n + 1,
@@ -871,12 +898,14 @@ def getcorpus():
 	if (set(texts) != currentfiles or any(os.stat(a).st_mtime > picklemtime
 				for a in tfiles + afiles + tokfiles)):
 		if corpora.get('tgrep2'):
-			numsents = [len(open(filename).readlines())
-					for filename in tfiles if filename.endswith('.mrg')]
-			numconst = [open(filename).read().count('(')
-					for filename in tfiles if filename.endswith('.mrg')]
-			numwords = [len(GETLEAVES.findall(open(filename).read()))
-					for filename in tfiles if filename.endswith('.mrg')]
+			numsents, numconst, numwords = [], [], []
+			for filename in tfiles:
+				if filename.endswith('.mrg'):
+					with open(filename) as inp:  # read each file only once
+						data = inp.read()
+					numsents.append(len(data.splitlines()))
+					numconst.append(data.count('('))
+					numwords.append(len(GETLEAVES.findall(data)))
 		elif corpora.get('xpath'):
 			numsents = [corpus.size() for corpus
 					in corpora['xpath'].files.values()]
@@ -944,6 +973,11 @@ for log in (logging.getLogger(), APP.logger):
 	log.handlers[0].setFormatter(logging.Formatter(
 			fmt='%(asctime)s %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
 TEXTS, NUMSENTS, NUMCONST, NUMWORDS, STYLETABLE, CORPORA = getcorpus()
+TREEBANKS = {}  # corpus readers of .mrg files, with their indices
+FRAGMENTINDEX = None
+if os.path.exists(os.path.join(CORPUS_DIR, 'fragments.idx')):
+	FRAGMENTINDEX = FragmentIndex.fromfile(
+			os.path.join(CORPUS_DIR, 'fragments.idx'))
 
 
 if __name__ == '__main__':